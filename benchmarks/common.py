@@ -0,0 +1,90 @@
+
+# Helpers that are shared by the benchmark scripts in this directory.
+
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable
+
+ROOT_DIR = Path(__file__).parent.parent
+SRC_DIR = ROOT_DIR / 'src'
+SNIPPETS_DIR = ROOT_DIR / 'test-snippets'
+
+def get_env() -> dict[str, str]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ str(SRC_DIR), env.get('PYTHONPATH', '') ])
+    env.pop('TEMPLATY_SOCKET', None)
+    return env
+
+def get_commit() -> str | None:
+    try:
+        proc = subprocess.run([ 'git', 'rev-parse', 'HEAD' ], cwd=ROOT_DIR, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip()
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+def time_call[T](setup: Callable[[], T], fn: Callable[[T], Any], runs: int, min_time: float = 0.05) -> list[float]:
+    # Short calls are repeated until a sample takes at least min_time, so
+    # that the resolution of the clock doesn't matter. Only fn is timed.
+    fn(setup())
+    number = 1
+    while True:
+        args = [ setup() for _ in range(number) ]
+        start = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 2
+    samples = [ elapsed / number ]
+    while len(samples) < runs:
+        args = [ setup() for _ in range(number) ]
+        start = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+def format_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:8.1f}us'
+    if seconds < 1:
+        return f'{seconds * 1e3:8.1f}ms'
+    return f'{seconds:8.2f}s '
+
+def load_baseline(path: str | None) -> dict[str, dict[str, float]] | None:
+    if path is None:
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)['results']
+
+def print_results(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]] | None = None, unit: Callable[[float], str] = format_time) -> None:
+    width = max((len(name) for name in results), default=0) + 2
+    for name, stats in results.items():
+        line = f'{name:<{width}} {unit(stats["median"])} (min {unit(stats["min"]).strip()})'
+        if baseline is not None and name in baseline and baseline[name]['median']:
+            line += f'  {stats["median"] / baseline[name]["median"]:.2f}x'
+        print(line)
+
+def write_results(path: str, results: dict[str, dict[str, float]], **info: Any) -> None:
+    with open(path, 'w') as f:
+        json.dump({
+            'python': sys.version,
+            'platform': platform.platform(),
+            'commit': get_commit(),
+            **info,
+            'results': results,
+        }, f, indent=2)
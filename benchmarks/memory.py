@@ -0,0 +1,77 @@
+
+# Renders a template with a large output and reports how much memory every
+# phase needed, so that changes in memory use can be tracked over time.
+#
+# Usage: python benchmarks/memory.py [--size-mb 100] [-o results.json] [--compare old.json]
+
+import argparse
+import resource
+import sys
+import time
+
+from common import SRC_DIR, load_baseline, summarize, write_results
+
+sys.path.insert(0, str(SRC_DIR))
+
+from templaty.evaluator import evaluate
+from templaty.memory import MemoryReport, format_size
+
+LINE_SIZE = 1000
+
+TEMPLATE = """\
+class Table:
+  {% for i in range(0, count) %}
+  row{{i}} = '{{line}}'
+  {% endfor %}
+"""
+
+def run(size_mb: int, trace: bool) -> dict[str, dict[str, float]]:
+    count = size_mb * 1024 * 1024 // LINE_SIZE
+    ctx = { 'count': count, 'line': 'x' * (LINE_SIZE - 20) }
+    results = {}
+    # A single frame per allocation keeps the overhead of tracing manageable
+    report = MemoryReport(frames=1) if trace else None
+    start = time.perf_counter()
+    try:
+        result = evaluate(TEMPLATE, ctx, stats=report)
+    finally:
+        if report is not None:
+            report.stop()
+    results['time'] = summarize([ time.perf_counter() - start ])
+    results['output'] = summarize([ float(len(result)) ])
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results['maxrss'] = summarize([ float(maxrss if sys.platform == 'darwin' else maxrss * 1024) ])
+    if report is not None:
+        for phase, memory in report.memory.items():
+            results[f'{phase}/peak'] = summarize([ float(memory.peak) ])
+            results[f'{phase}/retained'] = summarize([ float(memory.retained) ])
+    return results
+
+def format_value(name: str, value: float) -> str:
+    if name == 'time':
+        return f'{value:9.2f}s '
+    return f'{format_size(value):>10}'
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=100, help='Approximately how many megabytes of output to generate')
+    parser.add_argument('--no-trace', action='store_true', help='Only measure the maximum resident set size, which is a lot faster')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='A JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run(args.size_mb, not args.no_trace)
+
+    baseline = load_baseline(args.compare)
+    for name, stats in results.items():
+        line = f'{name:<20} {format_value(name, stats["median"])}'
+        if baseline is not None and name in baseline and baseline[name]['median']:
+            line += f'  {stats["median"] / baseline[name]["median"]:.2f}x'
+        print(line)
+
+    if args.output is not None:
+        write_results(args.output, results, size_mb=args.size_mb, trace=not args.no_trace)
+
+if __name__ == '__main__':
+    main()
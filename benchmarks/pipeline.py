@@ -0,0 +1,216 @@
+
+# Times every phase of the pipeline separately: scanning, parsing, outlining,
+# evaluation, rendering of the output tree and execute_dir() on a directory.
+#
+# Usage: python benchmarks/pipeline.py [-n RUNS] [-w WORKLOAD] [-p PHASE] [-o results.json] [--compare old.json]
+#
+# A custom synthetic workload can be added with --size, --depth, --density and
+# --loops.
+
+import argparse
+from collections.abc import Iterator
+import itertools
+import os
+from pathlib import Path
+import sys
+import tempfile
+from typing import Any, Callable
+
+from common import SNIPPETS_DIR, SRC_DIR, load_baseline, print_results, summarize, time_call, write_results
+
+sys.path.insert(0, str(SRC_DIR))
+
+from templaty.build import execute_dir
+from templaty.evaluator import evaluate, evaluate_output, parse, render_output
+from templaty.outline import outline
+from templaty.parser import Parser
+from templaty.scanner import END_OF_FILE, Scanner, Token
+
+PHASES = [ 'scan', 'parse', 'outline', 'evaluate', 'render', 'total', 'execute_dir' ]
+
+EXPRESSIONS = [
+    '{{name}}',
+    '{{entity.name |> snake}}',
+    '{{items[3]}}',
+    '{{upper(name)}}',
+]
+
+def make_template(size: int, depth: int, density: int, loops: int) -> str:
+    lines = []
+    for i in range(size):
+        lines.append(f'def function_{i}(self):')
+        for d in range(depth):
+            lines.append('  ' * (d + 1) + f'{{% for x{d} in range(0, {loops}) %}}')
+        exprs = list(itertools.islice(itertools.cycle(EXPRESSIONS), density))
+        if depth > 0:
+            exprs[-1] = f'{{{{x{depth-1}}}}}'
+        lines.append('  ' * (depth + 1) + 'value = ' + ' + '.join(exprs))
+        for d in reversed(range(depth)):
+            lines.append('  ' * (d + 1) + '{% endfor %}')
+    return '\n'.join(lines) + '\n'
+
+class Entity:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+SYNTHETIC_CTX = {
+    'name': 'fooBar',
+    'entity': Entity('SomeEntity'),
+    'items': [ f'item{i}' for i in range(10) ],
+}
+
+class Workload:
+
+    def __init__(self, name: str, sources: dict[str, str], ctx: dict[str, Any]) -> None:
+        self.name = name
+        self.sources = sources
+        self.ctx = ctx
+
+def make_synthetic(name: str, size: int, depth: int, density: int, loops: int) -> Workload:
+    return Workload(name, { f'{name}.tply': make_template(size, depth, density, loops) }, SYNTHETIC_CTX)
+
+def load_snippets() -> Workload:
+    sources = dict((path.name, path.read_text()) for path in sorted(SNIPPETS_DIR.glob('*.tply')))
+    return Workload('snippets', sources, {})
+
+WORKLOADS: dict[str, Callable[[], Workload]] = {
+    'small': lambda: make_synthetic('small', size=10, depth=1, density=3, loops=5),
+    'wide': lambda: make_synthetic('wide', size=200, depth=1, density=5, loops=5),
+    'deep': lambda: make_synthetic('deep', size=10, depth=3, density=3, loops=5),
+    'dense': lambda: make_synthetic('dense', size=50, depth=1, density=20, loops=3),
+    'snippets': load_snippets,
+}
+
+def scan_all(scanner: Scanner) -> list[Token]:
+    tokens = []
+    for token in scanner.scan():
+        tokens.append(token)
+        if token.type == END_OF_FILE:
+            break
+    return tokens
+
+class PrescannedScanner:
+
+    # Lets the parser be timed without the scanner running along with it.
+
+    def __init__(self, scanner: Scanner, tokens: list[Token]) -> None:
+        self.file = scanner.file
+        self._tokens = tokens
+
+    def scan(self) -> Iterator[Token]:
+        # The real scanner keeps on returning the last token forever
+        return itertools.chain(self._tokens, itertools.repeat(self._tokens[-1]))
+
+def get_phases(workload: Workload) -> dict[str, tuple[Callable[[], Any], Callable[[Any], Any]]]:
+
+    def nothing() -> None:
+        return None
+
+    def scan(_) -> None:
+        for filename, source in workload.sources.items():
+            scan_all(Scanner(filename, source))
+
+    prescanned = []
+    for filename, source in workload.sources.items():
+        scanner = Scanner(filename, source)
+        prescanned.append((scanner, scan_all(Scanner(filename, source))))
+
+    def parse_all(_) -> None:
+        for scanner, tokens in prescanned:
+            Parser(PrescannedScanner(scanner, tokens)).parse_all()
+
+    def parse_fresh() -> list:
+        # outline() changes the tree, so it needs a new one every time
+        return [ parse(source, filename) for filename, source in workload.sources.items() ]
+
+    def outline_all(templates: list) -> None:
+        for template in templates:
+            outline(template)
+
+    templates = parse_fresh()
+    outline_all(templates)
+
+    def evaluate_all(_) -> None:
+        for template in templates:
+            evaluate_output(template, workload.ctx)
+
+    outputs = [ evaluate_output(template, workload.ctx) for template in templates ]
+
+    def render_all(_) -> None:
+        for output in outputs:
+            render_output(output)
+
+    def total(_) -> None:
+        for filename, source in workload.sources.items():
+            evaluate(source, workload.ctx, filename=filename)
+
+    return {
+        'scan': (nothing, scan),
+        'parse': (nothing, parse_all),
+        'outline': (parse_fresh, outline_all),
+        'evaluate': (nothing, evaluate_all),
+        'render': (nothing, render_all),
+        'total': (nothing, total),
+    }
+
+def time_execute_dir(workload: Workload, runs: int) -> list[float]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_dir = Path(tmp_dir) / 'src'
+        dest_dir = Path(tmp_dir) / 'out'
+        src_dir.mkdir()
+        for filename, source in workload.sources.items():
+            (src_dir / filename).write_text(source)
+        # Filenames in error messages are relative to the working directory,
+        # so the templates must be inside it.
+        old_cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            return time_call(lambda: None, lambda _: execute_dir(src_dir, dest_dir, workload.ctx, force=True), runs)
+        finally:
+            os.chdir(old_cwd)
+
+def run(workloads: list[Workload], phases: list[str], runs: int) -> dict[str, dict[str, float]]:
+    results = {}
+    for workload in workloads:
+        workload_phases = get_phases(workload)
+        for phase in phases:
+            if phase == 'execute_dir':
+                samples = time_execute_dir(workload, runs)
+            else:
+                setup, fn = workload_phases[phase]
+                samples = time_call(setup, fn, runs)
+            results[f'{workload.name}/{phase}'] = summarize(samples)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=5, help='How many samples to take of each measurement')
+    parser.add_argument('-w', '--workload', action='append', choices=list(WORKLOADS), help='Only run this workload (may be repeated)')
+    parser.add_argument('-p', '--phase', action='append', choices=PHASES, help='Only time this phase (may be repeated)')
+    parser.add_argument('--size', type=int, help='Number of functions in a custom synthetic template')
+    parser.add_argument('--depth', type=int, default=1, help='How deeply the loops of the custom template are nested')
+    parser.add_argument('--density', type=int, default=3, help='Number of expressions on each generated line')
+    parser.add_argument('--loops', type=int, default=5, help='Number of iterations of each loop')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='A JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    names = args.workload
+    if names is None:
+        names = [] if args.size is not None else list(WORKLOADS)
+    workloads = [ WORKLOADS[name]() for name in names ]
+    custom = None
+    if args.size is not None:
+        custom = dict(size=args.size, depth=args.depth, density=args.density, loops=args.loops)
+        workloads.append(make_synthetic('custom', **custom))
+
+    results = run(workloads, args.phase or PHASES, args.runs)
+
+    print_results(results, load_baseline(args.compare))
+
+    if args.output is not None:
+        write_results(args.output, results, custom=custom)
+
+if __name__ == '__main__':
+    main()
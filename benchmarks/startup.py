@@ -0,0 +1,70 @@
+
+# Measures how long it takes to start the templaty command.
+#
+# Usage: python benchmarks/startup.py [-n RUNS] [-o results.json] [--compare old.json]
+
+import argparse
+import json
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import get_env, load_baseline, print_results, summarize, write_results
+
+IMPORT_TARGETS = [
+    'templaty',
+    'templaty.main',
+    'templaty.client',
+    'templaty.evaluator',
+]
+
+def measure_import(module: str, env: dict[str, str]) -> int:
+    proc = subprocess.run([ sys.executable, '-X', 'importtime', '-c', f'import {module}' ], env=env, capture_output=True, text=True, check=True)
+    # The last line is the module itself, with the cumulative time in microseconds
+    last = proc.stderr.strip().splitlines()[-1]
+    return int(last.split('|')[1])
+
+def measure_command(argv: list[str], env: dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run([ sys.executable, *argv ], env=env, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+def run(runs: int) -> dict[str, dict[str, float]]:
+    env = get_env()
+    results = {}
+    for module in IMPORT_TARGETS:
+        samples = [ measure_import(module, env) / 1e6 for _ in range(runs) ]
+        results[f'import {module}'] = summarize(samples)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template_path = Path(tmp_dir) / 'hello.tply'
+        template_path.write_text('{% for i in range(0, 3) %}Hello, {{name}}!\n{% endfor %}')
+        data_path = Path(tmp_dir) / 'data.json'
+        data_path.write_text(json.dumps({ 'name': 'world' }))
+        commands = {
+            'python -c pass': [ '-c', 'pass' ],
+            'templaty --help': [ '-m', 'templaty', '--help' ],
+            'templaty render': [ '-m', 'templaty', '--no-server', str(template_path), '--data-file', str(data_path) ],
+        }
+        for name, argv in commands.items():
+            samples = [ measure_command(argv, env) for _ in range(runs) ]
+            results[name] = summarize(samples)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=10, help='How many times to run each measurement')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='A JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run(args.runs)
+
+    print_results(results, load_baseline(args.compare))
+
+    if args.output is not None:
+        write_results(args.output, results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+
+# Compares the string helpers in templaty.util against the character-by-character
+# implementations they replaced, which are kept below as the reference. The
+# results of both are checked to be identical before anything is timed.
+#
+# Usage: python benchmarks/strings.py [-n RUNS] [-f FUNCTION] [-o results.json] [--compare old.json]
+
+import argparse
+import random
+import sys
+
+from common import SRC_DIR, load_baseline, print_results, summarize, time_call, write_results
+
+sys.path.insert(0, str(SRC_DIR))
+
+from templaty import util
+
+FUNCTIONS = [ 'escape', 'indent', 'dedent', 'get_indentation' ]
+
+def reference_is_blank(text: str) -> bool:
+    for ch in text:
+        if not ch == ' ' and not ch == '\t':
+            return False
+    return True
+
+def reference_dedent(text: str, at_blank_line=True) -> str:
+    indent_length = reference_get_indentation(text, at_blank_line)
+    curr_removed = 0
+    out = ''
+    for ch in text:
+        if ch == '\n':
+            at_blank_line = True
+        elif reference_is_blank(ch):
+            if curr_removed < indent_length:
+                curr_removed += 1
+                continue
+        else:
+            curr_removed = 0
+        out += ch
+    return out
+
+def reference_indent(text: str, indentation='  ', at_blank_line=True) -> str:
+    out = ''
+    for ch in text:
+        if not at_blank_line:
+            at_blank_line = ch == '\n'
+        elif ch == '\n':
+            at_blank_line = True
+        elif not reference_is_blank(ch):
+            at_blank_line = False
+            out += indentation
+        out += ch
+    return out
+
+def reference_get_indentation(text: str, at_blank_line=True, default_indent=0):
+    min_indent = None
+    curr_indent = 0
+    for ch in text:
+        if at_blank_line:
+            if reference_is_blank(ch):
+                curr_indent += 1
+                continue
+            at_blank_line = ch == '\n'
+            if not at_blank_line and (min_indent is None or curr_indent < min_indent):
+                min_indent = curr_indent
+        else:
+            if ch == '\n':
+                at_blank_line = True
+                curr_indent = 0
+    if min_indent is None:
+        min_indent = default_indent if at_blank_line else curr_indent 
+    return min_indent
+
+def reference_escape(text: str) -> str:
+    out = ''
+    for ch in text:
+        if ch in util.SPECIAL_CHARS:
+            out += util.SPECIAL_CHARS[ch]
+        elif ch.isprintable():
+        #  elif ord(ch) >= 0x20 and ord(ch) <= 0x7E:
+            out += ch
+        else:
+            code = ord(ch)
+            out += f"\\x{code:02X}" if code <= 0x7F else f'\\u{code:04X}'
+    return out
+
+REFERENCE = {
+    'escape': reference_escape,
+    'indent': reference_indent,
+    'dedent': reference_dedent,
+    'get_indentation': reference_get_indentation,
+}
+
+def make_code(lines: int) -> str:
+    rng = random.Random(lines)
+    out = []
+    for i in range(lines):
+        depth = rng.randint(1, 4)
+        out.append('  ' * depth + f'value_{i} = call(arg, "text\\twith {i}")' if i % 7 else '')
+    return '\n'.join(out) + '\n'
+
+def make_string_literals(count: int) -> list[str]:
+    rng = random.Random(count)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz ABC_0123456789.,;:!?"\'\\'
+    special = '\t\r\n\x00\x1b\x7f\u00e9\u200b\u00a0\U0001f600'
+    literals = []
+    for _ in range(count):
+        length = rng.randint(5, 60)
+        chars = [ rng.choice(alphabet) for _ in range(length) ]
+        if rng.random() < 0.3:
+            chars[rng.randrange(length)] = rng.choice(special)
+        literals.append(''.join(chars))
+    return literals
+
+INPUTS = {
+    'small': lambda: [ make_code(10) ],
+    'large': lambda: [ make_code(5000) ],
+    'literals': lambda: make_string_literals(1000),
+}
+
+def check_identical() -> None:
+    rng = random.Random(0)
+    samples = [ '', '\n', '  \n', ' \t x', '\\', 'a\r\nb', '  foo\n\n    bar\n  \n baz  qux\n' ]
+    samples.extend(make_string_literals(200))
+    for _ in range(2000):
+        samples.append(''.join(rng.choice(' \t\n\rab\\\x01\u00e9') for _ in range(rng.randint(0, 30))))
+    for text in samples:
+        for at_blank_line in [ True, False ]:
+            assert util.escape(text) == reference_escape(text), text
+            assert util.indent(text, '--', at_blank_line) == reference_indent(text, '--', at_blank_line), text
+            assert util.dedent(text, at_blank_line) == reference_dedent(text, at_blank_line), text
+            assert util.get_indentation(text, at_blank_line, 3) == reference_get_indentation(text, at_blank_line, 3), text
+
+def run(functions: list[str], runs: int) -> dict[str, dict[str, float]]:
+    results = {}
+    for input_name, make_input in INPUTS.items():
+        texts = make_input()
+        for name in functions:
+            for variant, fn in [ ('reference', REFERENCE[name]), ('current', getattr(util, name)) ]:
+                def call_all(_, fn=fn) -> None:
+                    for text in texts:
+                        fn(text)
+                results[f'{input_name}/{name}/{variant}'] = summarize(time_call(lambda: None, call_all, runs))
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=5, help='How many samples to take of each measurement')
+    parser.add_argument('-f', '--function', action='append', choices=FUNCTIONS, help='Only time this function (may be repeated)')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='A JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    check_identical()
+
+    results = run(args.function or FUNCTIONS, args.runs)
+
+    print_results(results, load_baseline(args.compare))
+
+    if args.output is not None:
+        write_results(args.output, results)
+
+if __name__ == '__main__':
+    main()
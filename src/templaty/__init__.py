@@ -1,24 +1,70 @@
 
-import shutil
 import sys
-from pathlib import Path
 from types import ModuleType
-from typing import Any
-import importlib.util
+from typing import TYPE_CHECKING, Any
 
-from sweetener import clone, warn
+if TYPE_CHECKING:
+    from pathlib import Path
+    from .evaluator import evaluate, compile_template, CompiledTemplate, shared_context, load_context
+    from .analysis import free_variables, FreeVariables
+    from .cache import MemoryCache, DiskCache, CacheStore
+    from .deferred import lazy, Lazy
+    from .async_evaluator import render_async
+    from .stats import RenderStats
+    from .profiler import TemplateProfile
+    from .memory import MemoryReport
+    from .build import execute_dir, BuildSummary, HelperCache, strip_ext, helper_export_prefix, helpers_dir_name
 
-from .evaluator import evaluate, shared_context, load_context
+# Most programs only need a few of these, so the modules defining them are
+# only imported when they are first accessed.
+_lazy_attributes = {
+    'evaluate': 'evaluator',
+    'compile_template': 'evaluator',
+    'CompiledTemplate': 'evaluator',
+    'shared_context': 'evaluator',
+    'load_context': 'evaluator',
+    'free_variables': 'analysis',
+    'FreeVariables': 'analysis',
+    'MemoryCache': 'cache',
+    'DiskCache': 'cache',
+    'CacheStore': 'cache',
+    'lazy': 'deferred',
+    'Lazy': 'deferred',
+    'render_async': 'async_evaluator',
+    'RenderStats': 'stats',
+    'TemplateProfile': 'profiler',
+    'MemoryReport': 'memory',
+    'execute_dir': 'build',
+    'BuildSummary': 'build',
+    'HelperCache': 'build',
+    'strip_ext': 'build',
+    'helper_export_prefix': 'build',
+    'helpers_dir_name': 'build',
+}
 
-def execute(filepath: Path, ctx={}, **kwargs) -> str:
+__all__ = [ 'execute', *_lazy_attributes ]
+
+def __getattr__(name: str) -> Any:
+    module_name = _lazy_attributes.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_lazy_attributes))
+
+def execute(filepath: 'Path', ctx={}, **kwargs) -> str:
+    from pathlib import Path
+    from .evaluator import evaluate
     with open(filepath, 'r') as f:
         contents = f.read()
     return evaluate(contents, ctx, filename=str(filepath.relative_to(Path.cwd())), **kwargs)
 
-helper_export_prefix = 'generate_'
-helpers_dir_name = '_helpers'
-
-def dynamic_import(name: str, path: Path) -> ModuleType:
+def dynamic_import(name: str, path: 'Path') -> ModuleType:
+    import importlib.util
     spec = importlib.util.spec_from_file_location(name, path)
     if spec is None:
         raise RuntimeError(f'failed to load module on path {path}')
@@ -27,74 +73,3 @@ def dynamic_import(name: str, path: Path) -> ModuleType:
     assert(spec.loader is not None)
     spec.loader.exec_module(module)
     return module
-
-def strip_ext(name: str) -> str:
-    chunks = name.split('.')[:-1]
-    return '.'.join(chunks)
-
-def execute_dir(dir: Path, dest_dir: Path, ctx: dict[str, Any] | None = None, force: bool = False, **kwargs) -> None:
-
-    if ctx is None:
-        ctx = {}
-
-    def is_ignored(path: Path) -> bool:
-        return path.name in [ '_helpers', '_helpers.py', '__pycache__' ]
-
-    def visit_helpers(path: Path, ctx) -> None:
-        if path.is_file():
-            if path.suffixes and path.suffixes[-1] == '.py':
-                with open(path, 'r') as f:
-                    code = f.read()
-                exec(compile(code, path, 'exec'), ctx)
-            return
-        if path.is_dir():
-            for path in path.iterdir():
-                visit_helpers(path, ctx)
-            return
-        warn(f'Skipping {path} because it is not a file nor a directory')
-
-    def visit_code(path: Path, ctx) -> None:
-        if is_ignored(path):
-            return
-        if path.is_file():
-            if path.suffixes and path.suffixes[-1] == '.tply':
-                with open(path, 'r') as f:
-                    contents = f.read()
-                result = evaluate(contents, ctx, filename=str(path.relative_to(Path.cwd())), **kwargs)
-                dest_path = dest_dir / path.parent.relative_to(dir) / strip_ext(path.name)
-                if not force and dest_path.exists():
-                    warn(f'Skipping {dest_path} because it already exists')
-                    return
-                with open(dest_path, 'w') as f:
-                    f.write(result)
-            else:
-                dest_path = dest_dir / path.relative_to(dir)
-                if not force and dest_path.exists():
-                    warn(f'Skipping {dest_path} because it already exists')
-                    return
-                shutil.copy2(path, dest_path)
-            return
-        if path.is_dir():
-            dest_path = dest_dir / path.relative_to(dir)
-            ctx = clone(ctx)
-            helpers_file = path / (helpers_dir_name + '.py')
-            if helpers_file.exists():
-                visit_helpers(helpers_file, ctx)
-            helpers_dir = path / helpers_dir_name
-            if helpers_dir.exists():
-                visit_helpers(helpers_dir, ctx)
-            dest_path.mkdir(parents=True, exist_ok=True)
-            for child_path in path.iterdir():
-                if child_path.name == helpers_dir_name:
-                    continue
-                visit_code(child_path, ctx)
-            return
-        warn(f'Skipping {path} because it is not a file nor a directory')
-
-    old_context = shared_context.value
-    shared_context.value = ctx
-    try:
-        visit_code(dir, ctx)
-    finally:
-        shared_context.value = old_context
-
@@ -0,0 +1,202 @@
+
+import ast
+import builtins
+
+from .ast import *
+from .scanner import OPERATORS, NAMED_OPERATORS
+
+SPECIAL_NAMES = { 'now', 'globals', 'locals' }
+
+OPERATOR_NAMES = set(OPERATORS) | set(NAMED_OPERATORS) | { 'in' }
+
+PYTHON_BUILTINS = set(dir(builtins))
+
+type VarPath = tuple[str, ...]
+
+class FreeVariables:
+
+    def __init__(self, names: frozenset[str], paths: frozenset[VarPath], dynamic: frozenset[str], builtins: frozenset[str], imports: frozenset[str] = frozenset()) -> None:
+        self.names = names
+        self.paths = paths
+        self.dynamic = dynamic
+        self.builtins = builtins
+        self.imports = imports
+
+    def __repr__(self) -> str:
+        return f'FreeVariables(names={sorted(self.names)!r}, paths={sorted(self.paths)!r}, dynamic={sorted(self.dynamic)!r}, builtins={sorted(self.builtins)!r}, imports={sorted(self.imports)!r})'
+
+def is_builtin_name(name: str) -> bool:
+    from .evaluator import DEFAULT_BUILTINS
+    return name in DEFAULT_BUILTINS \
+        or name in SPECIAL_NAMES \
+        or name in OPERATOR_NAMES
+
+def get_python_imports(module: ast.Module) -> set[str]:
+    out = set[str]()
+    for node in ast.walk(module):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                out.add(alias.name.split('.')[0])
+        elif isinstance(node, ast.ImportFrom) and node.module is not None and node.level == 0:
+            out.add(node.module.split('.')[0])
+    return out
+
+def get_python_names(module: ast.Module) -> tuple[set[str], set[str]]:
+    loaded = set[str]()
+    stored = set[str]()
+    for node in ast.walk(module):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.add(node.id)
+            else:
+                stored.add(node.id)
+        elif isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+            stored.add(node.name)
+        elif isinstance(node, ast.Import | ast.ImportFrom):
+            for alias in node.names:
+                if alias.asname is not None:
+                    stored.add(alias.asname)
+                else:
+                    stored.add(alias.name.split('.')[0])
+        elif isinstance(node, ast.arg):
+            stored.add(node.arg)
+    return loaded, stored
+
+def free_variables(template: Template | Node) -> FreeVariables:
+    names = set[str]()
+    paths = set[VarPath]()
+    dynamic = set[str]()
+    used_builtins = set[str]()
+    imports = set[str]()
+
+    scopes: list[set[str]] = [ set() ]
+
+    def is_bound(name: str) -> bool:
+        for scope in scopes:
+            if name in scope:
+                return True
+        return False
+
+    def reference(name: str, path: VarPath) -> None:
+        if is_bound(name):
+            return
+        if is_builtin_name(name):
+            used_builtins.add(name)
+            return
+        names.add(name)
+        paths.add(path)
+
+    def bind_pattern(pattern: Pattern) -> None:
+        if isinstance(pattern, VarPattern):
+            scopes[-1].add(pattern.name)
+            return
+        if isinstance(pattern, TuplePattern):
+            for element in pattern.elements:
+                bind_pattern(element)
+            return
+        raise RuntimeError(f'unexpected node {pattern}')
+
+    def visit_expr(expr: Expression) -> None:
+        if isinstance(expr, ConstExpression):
+            return
+        if isinstance(expr, VarRefExpression):
+            reference(expr.name, (expr.name,))
+            return
+        if isinstance(expr, MemberExpression):
+            if isinstance(expr.expression, VarRefExpression):
+                name = expr.expression.name
+                reference(name, (name, *expr.members))
+            else:
+                visit_expr(expr.expression)
+            return
+        if isinstance(expr, IndexExpression):
+            visit_expr(expr.expression)
+            visit_expr(expr.index)
+            return
+        if isinstance(expr, SliceExpression):
+            visit_expr(expr.expression)
+            if expr.min is not None:
+                visit_expr(expr.min)
+            if expr.max is not None:
+                visit_expr(expr.max)
+            return
+        if isinstance(expr, CallExpression):
+            visit_expr(expr.operator)
+            for operand in expr.operands:
+                visit_expr(operand)
+            return
+        if isinstance(expr, TupleExpression):
+            for element in expr.elements:
+                visit_expr(element)
+            return
+        raise RuntimeError(f'unexpected node {expr}')
+
+    def visit_loop(stmt: ForInStatement | JoinStatement) -> None:
+        visit_expr(stmt.expression)
+        scopes.append({ 'index' })
+        bind_pattern(stmt.pattern)
+        visit(stmt.body)
+        scopes.pop()
+
+    def visit(node: Node) -> None:
+        if isinstance(node, Template):
+            visit(node.body)
+            return
+        if isinstance(node, Body):
+            scopes[-1].add('write')
+            for element in node.elements:
+                visit(element)
+            return
+        if isinstance(node, TextStatement | CommentStatement):
+            return
+        if isinstance(node, ExpressionStatement):
+            visit_expr(node.expression)
+            return
+        if isinstance(node, IfStatement):
+            for case in node.cases:
+                if case.test is not None:
+                    visit_expr(case.test)
+                visit(case.body)
+            return
+        if isinstance(node, ForInStatement | JoinStatement):
+            if isinstance(node, JoinStatement):
+                visit_expr(node.separator)
+            visit_loop(node)
+            return
+        if isinstance(node, SetIndentStatement):
+            visit_expr(node.level)
+            visit(node.body)
+            return
+        if isinstance(node, CacheStatement):
+            visit_expr(node.key)
+            visit(node.body)
+            return
+        if isinstance(node, CodeBlock):
+            # We can't know for sure what a code block does with the names it
+            # reads, so they are reported separately from the other names.
+            loaded, stored = get_python_names(node.module)
+            for name in loaded - stored:
+                if is_bound(name):
+                    continue
+                if name in PYTHON_BUILTINS or is_builtin_name(name):
+                    used_builtins.add(name)
+                else:
+                    dynamic.add(name)
+            scopes[-1].update(stored)
+            imports.update(get_python_imports(node.module))
+            return
+        if isinstance(node, Expression):
+            visit_expr(node)
+            return
+        raise RuntimeError(f'unexpected node {node}')
+
+    visit(template)
+
+    return FreeVariables(
+        frozenset(names),
+        frozenset(paths),
+        frozenset(dynamic),
+        frozenset(used_builtins),
+        frozenset(imports),
+    )
+
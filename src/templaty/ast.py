@@ -101,11 +101,17 @@ class JoinStatement(Statement):
     expression: Expression
     separator: Expression
     body: Body
+    parallel: bool = False
+
+class CacheStatement(Statement):
+    key: Expression
+    body: Body
 
 class ForInStatement(Statement):
     pattern: Pattern
     expression: Expression
     body: Body
+    parallel: bool = False
 
 class Template(Node):
     body: Body
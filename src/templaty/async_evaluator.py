@@ -0,0 +1,156 @@
+
+import asyncio
+import inspect
+from typing import TYPE_CHECKING, Any
+import warnings
+
+from .ast import *
+from .evaluator import BlockOutput, CompiledTemplate, Cursor, Env, Output, RenderSetup, TextOutput, bind_iteration, call_value, exec_code_block, finish_render, lookup_var, make_writer
+
+if TYPE_CHECKING:
+    from .cache import CacheStore
+    from .stats import RenderStats
+    from .profiler import TemplateProfile
+
+def has_code_block(node: Node) -> bool:
+    if isinstance(node, CodeBlock):
+        return True
+    if isinstance(node, Body):
+        return any(has_code_block(element) for element in node.elements)
+    if isinstance(node, IfStatement):
+        return any(has_code_block(case.body) for case in node.cases)
+    if isinstance(node, ForInStatement | JoinStatement | SetIndentStatement | CacheStatement):
+        return has_code_block(node.body)
+    return False
+
+async def render_async(template: str | Template | CompiledTemplate, ctx: dict[str, Any] = {}, indentation = '  ', filename = "#<anonymous>", cache: 'CacheStore | None' = None, fragment_cache: 'CacheStore | None' = None, max_workers: int | None = None, stats: 'RenderStats | None' = None, profile: 'TemplateProfile | None' = None) -> str:
+
+    # These are accepted so that the arguments of evaluate() can be passed on
+    # as they are, but they only make sense for the synchronous evaluator.
+    for name, value in [ ('cache', cache), ('max_workers', max_workers), ('profile', profile) ]:
+        if value is not None:
+            raise TypeError(f"render_async() does not support the '{name}' argument")
+
+    # A coroutine can only be awaited once, so we keep the futures around
+    # for when the same value is referenced more than once. The values are
+    # stored alongside so that their ids can't be reused.
+    awaited = dict[int, tuple[Any, asyncio.Future]]()
+
+    async def wait_for(value: Any) -> Any:
+        if not inspect.isawaitable(value):
+            return value
+        entry = awaited.get(id(value))
+        if entry is None:
+            entry = (value, asyncio.ensure_future(value))
+            awaited[id(value)] = entry
+        return await entry[1]
+
+    async def eval_expr(expr: Expression, env: Env) -> Any:
+        if isinstance(expr, ConstExpression):
+            return expr.value
+        elif isinstance(expr, IndexExpression):
+            val = await eval_expr(expr.expression, env)
+            index = await eval_expr(expr.index, env)
+            return await wait_for(val[index])
+        elif isinstance(expr, SliceExpression):
+            val = await eval_expr(expr.expression, env)
+            low = expr.min and await eval_expr(expr.min, env)
+            high = expr.max and await eval_expr(expr.max, env)
+            return val[low:high]
+        elif isinstance(expr, MemberExpression):
+            out = await eval_expr(expr.expression, env)
+            for name in expr.members:
+                out = await wait_for(getattr(out, name))
+            return out
+        elif isinstance(expr, VarRefExpression):
+            return await wait_for(lookup_var(expr, env, shared, global_env))
+        elif isinstance(expr, CallExpression):
+            op = await eval_expr(expr.operator, env)
+            args = [ await eval_expr(arg, env) for arg in expr.operands ]
+            return await wait_for(call_value(op, args))
+        else:
+            raise RuntimeError("Could not evaluate Templately expression: unknown expression {}.".format(expr))
+
+    async def eval_loop(stmt: ForInStatement | JoinStatement, env: Env, cursor: Cursor) -> Output:
+        value = await eval_expr(stmt.expression, env)
+        if hasattr(value, '__aiter__'):
+            elements = [ element async for element in value ]
+        else:
+            elements = list(value)
+
+        if stmt.parallel:
+            message = 'parallel loops are evaluated concurrently on the event loop instead of in worker processes'
+            if stmt.span is not None:
+                message = f'{stmt.span.file.name}:{stmt.span.start_pos.line}:{stmt.span.start_pos.column}: {message}'
+            warnings.warn(message, RuntimeWarning)
+
+        if has_code_block(stmt.body):
+            # Code blocks may depend on what earlier iterations did, so these
+            # loops are evaluated one iteration at a time.
+            return BlockOutput([ await eval_stmt(stmt.body, bind_iteration(stmt, env, i, element), cursor) for i, element in enumerate(elements) ])
+
+        # Each iteration gets a cursor of its own while it is being evaluated.
+        # Replaying the results in order afterwards aligns them exactly like
+        # the synchronous evaluator would have done.
+        results = await asyncio.gather(*(eval_stmt(stmt.body, bind_iteration(stmt, env, i, element), Cursor()) for i, element in enumerate(elements)))
+        return BlockOutput([ cursor.replay(result) for result in results ])
+
+    async def eval_stmt(stmt: Node, env: Env, cursor: Cursor) -> Output:
+
+        if isinstance(stmt, Body):
+            out = BlockOutput()
+            env.set('write', make_writer(out, cursor))
+            for stmt in stmt.elements:
+                result = await eval_stmt(stmt, env, cursor)
+                out.children.append(result)
+            return out
+
+        if isinstance(stmt, TextStatement):
+            return cursor.text(stmt.text)
+
+        if isinstance(stmt, IfStatement):
+            for case in stmt.cases:
+                if case.test is None:
+                    return await eval_stmt(case.body, env, cursor)
+                value = await eval_expr(case.test, env)
+                if value:
+                    return await eval_stmt(case.body, env, cursor)
+            return TextOutput('')
+
+        if isinstance(stmt, ForInStatement | JoinStatement):
+            return await eval_loop(stmt, env, cursor)
+
+        if isinstance(stmt, ExpressionStatement):
+            return cursor.value(await eval_expr(stmt.expression, env))
+
+        if isinstance(stmt, CacheStatement):
+            fragment_key, result = setup.get_fragment(stmt, await eval_expr(stmt.key, env), cursor)
+            if result is not None:
+                return result
+            result = await eval_stmt(stmt.body, env, cursor)
+            setup.fragments.set(fragment_key, result)
+            return result
+
+        if isinstance(stmt, SetIndentStatement):
+            level = await eval_expr(stmt.level, env)
+            result = await eval_stmt(stmt.body, env, cursor)
+            result.indent_override = indentation * level
+            return result
+
+        if isinstance(stmt, CodeBlock):
+            exec_code_block(stmt, env, global_env, filename)
+            return TextOutput('')
+
+        raise RuntimeError(f'unexpected node {stmt}')
+
+    setup = RenderSetup(template, ctx, filename, fragment_cache, stats)
+    shared = setup.shared
+    global_env = setup.global_env
+
+    if stats is None:
+        output = await eval_stmt(setup.template.body, global_env, Cursor())
+    else:
+        with stats.measure('evaluate'):
+            output = await eval_stmt(setup.template.body, global_env, Cursor())
+
+    return finish_render(output, stats)
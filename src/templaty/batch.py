@@ -0,0 +1,121 @@
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from pathlib import Path
+import time
+from typing import Any
+
+from .evaluator import CompiledTemplate
+from .fs import write_if_changed as write_file_if_changed
+
+class BatchJob:
+
+    def __init__(self, template_path: Path, output_path: Path, data_path: Path | None = None, context: dict[str, Any] | None = None) -> None:
+        self.template_path = template_path
+        self.output_path = output_path
+        self.data_path = data_path
+        self.context = context
+
+class BatchResult:
+
+    def __init__(self, job: BatchJob, written: bool = False, error: str | None = None, elapsed: float = 0.0) -> None:
+        self.job = job
+        self.written = written
+        self.error = error
+        self.elapsed = elapsed
+
+class ManifestError(RuntimeError):
+    pass
+
+def parse_job_spec(spec: str) -> BatchJob:
+    chunks = spec.split(':')
+    if len(chunks) != 3 or not chunks[0] or not chunks[2]:
+        raise ManifestError(f'invalid job {spec!r}: expected TEMPLATE:DATA:OUTPUT')
+    template, data, output = chunks
+    return BatchJob(Path(template), Path(output), Path(data) if data else None)
+
+def load_manifest(path: Path) -> list[BatchJob]:
+    if path.suffix == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    else:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('jobs')
+    if not isinstance(data, list):
+        raise ManifestError(f'{path}: expected a list of jobs')
+    # Paths are relative to the manifest, not to where the command is run
+    root = path.parent
+    jobs = []
+    for i, entry in enumerate(data):
+        if not isinstance(entry, dict) or 'template' not in entry or 'output' not in entry:
+            raise ManifestError(f'{path}: job {i} must at least have a template and an output')
+        data_path = entry.get('data')
+        jobs.append(BatchJob(
+            root / entry['template'],
+            root / entry['output'],
+            root / data_path if data_path is not None else None,
+            entry.get('context'),
+        ))
+    return jobs
+
+_templates = dict[Path, CompiledTemplate]()
+_data = dict[Path, dict[str, Any]]()
+
+def get_template(path: Path) -> CompiledTemplate:
+    template = _templates.get(path)
+    if template is None:
+        with open(path, 'r') as f:
+            template = CompiledTemplate(f.read(), str(path))
+        _templates[path] = template
+    return template
+
+def get_data(path: Path) -> dict[str, Any]:
+    data = _data.get(path)
+    if data is None:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        _data[path] = data
+    return data
+
+def run_job(job: BatchJob, write_if_changed: bool = False) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        ctx = {}
+        if job.data_path is not None:
+            ctx.update(get_data(job.data_path))
+        if job.context is not None:
+            ctx.update(job.context)
+        result = get_template(job.template_path).evaluate(ctx)
+        job.output_path.parent.mkdir(parents=True, exist_ok=True)
+        if write_if_changed:
+            written = write_file_if_changed(job.output_path, result)
+        else:
+            with open(job.output_path, 'w') as f:
+                f.write(result)
+            written = True
+    except Exception as e:
+        return BatchResult(job, error=f'{type(e).__name__}: {e}', elapsed=time.perf_counter() - start)
+    return BatchResult(job, written, elapsed=time.perf_counter() - start)
+
+def _run_job_star(args: tuple[BatchJob, bool]) -> BatchResult:
+    return run_job(*args)
+
+def run_batch(jobs: list[BatchJob], max_workers: int | None = 1, write_if_changed: bool = False) -> list[BatchResult]:
+    if max_workers == 1 or len(jobs) < 2:
+        return [ run_job(job, write_if_changed) for job in jobs ]
+    # Jobs that share a template are kept together, so that every worker
+    # compiles as few templates as possible.
+    order = sorted(range(len(jobs)), key=lambda i: str(jobs[i].template_path))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * max_workers))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        sorted_results = list(executor.map(_run_job_star, ((jobs[i], write_if_changed) for i in order), chunksize=chunksize))
+    results: list[BatchResult] = [ None ] * len(jobs) # type: ignore
+    for i, result in zip(order, sorted_results):
+        results[i] = result
+    return results
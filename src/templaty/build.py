@@ -0,0 +1,455 @@
+
+from collections import OrderedDict
+from collections.abc import Hashable
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from pathlib import Path
+from types import CodeType
+from typing import TYPE_CHECKING, Any
+
+from sweetener import warn
+
+from .cache import UncacheableError, stable_hash
+from .deferred import Lazy
+from .evaluator import CompiledTemplate, evaluate, shared_context
+from .fs import CopyStrategy, copy_file, copy_if_changed, encode_text, is_copy_up_to_date, write_if_changed as write_file_if_changed
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+helper_export_prefix = 'generate_'
+helpers_dir_name = '_helpers'
+manifest_file_name = '.templaty-manifest.json'
+
+MANIFEST_VERSION = 1
+
+type HelperLevels = tuple[tuple[Path, ...], ...]
+
+def strip_ext(name: str) -> str:
+    chunks = name.split('.')[:-1]
+    return '.'.join(chunks)
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def get_file_stamp(path: Path) -> list[int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return [ st.st_size, st.st_mtime_ns ]
+
+class RenderJob:
+
+    def __init__(self, src_path: Path, dest_path: Path, filename: str, helpers: HelperLevels) -> None:
+        self.src_path = src_path
+        self.dest_path = dest_path
+        self.filename = filename
+        self.helpers = helpers
+
+class CopyJob:
+
+    def __init__(self, src_path: Path, dest_path: Path) -> None:
+        self.src_path = src_path
+        self.dest_path = dest_path
+
+type Job = RenderJob | CopyJob
+
+def is_ignored(path: Path) -> bool:
+    return path.name in [ '_helpers', '_helpers.py', '__pycache__' ]
+
+def collect_helpers(path: Path, out: list[Path]) -> None:
+    if path.is_file():
+        if path.suffixes and path.suffixes[-1] == '.py':
+            out.append(path)
+        return
+    if path.is_dir():
+        for child_path in sorted(path.iterdir()):
+            collect_helpers(child_path, out)
+        return
+    warn(f'Skipping {path} because it is not a file nor a directory')
+
+class HelperCache:
+
+    def __init__(self, max_namespaces: int = 64) -> None:
+        self.max_namespaces = max_namespaces
+        self._code = dict[Path, tuple[list[int] | None, str, CodeType]]()
+        self._namespaces = OrderedDict[Hashable, dict[str, Any]]()
+        self._lock = threading.Lock()
+
+    def get_code(self, path: Path) -> tuple[str, CodeType]:
+        stamp = get_file_stamp(path)
+        with self._lock:
+            cached = self._code.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if cached is not None and cached[1] == digest:
+            code = cached[2]
+        else:
+            code = compile(data, path, 'exec')
+        with self._lock:
+            self._code[path] = (stamp, digest, code)
+        return digest, code
+
+    def get_namespace(self, key: Hashable) -> dict[str, Any] | None:
+        with self._lock:
+            ns = self._namespaces.get(key)
+            if ns is not None:
+                self._namespaces.move_to_end(key)
+            return ns
+
+    def set_namespace(self, key: Hashable, ns: dict[str, Any]) -> None:
+        with self._lock:
+            self._namespaces[key] = ns
+            while len(self._namespaces) > self.max_namespaces:
+                self._namespaces.popitem(last=False)
+
+class HelperLoader:
+
+    def __init__(self, ctx: dict[str, Any], cache: HelperCache | None = None) -> None:
+        # Namespaces are only shared between runs through a cache that was
+        # passed in, and only for contexts with the same stable hash. The
+        # caller might change the context in between, so nothing is kept
+        # for the context object itself.
+        self.shared = cache is not None
+        if cache is None:
+            cache = HelperCache()
+        self.ctx = ctx
+        self.cache = cache
+        self._contexts: dict[HelperLevels, dict[str, Any]] = { (): ctx }
+        self._keys: dict[HelperLevels, Hashable | None] = {}
+
+    def get_context_key(self) -> Hashable | None:
+        if () not in self._keys:
+            key = None
+            # Hashing would force lazy values, and a namespace holding a lazy
+            # value from an earlier run might hold a stale result.
+            if self.shared and not any(isinstance(value, Lazy) for value in self.ctx.values()):
+                try:
+                    key = stable_hash(self.ctx)
+                except UncacheableError:
+                    pass
+            self._keys[()] = key
+        return self._keys[()]
+
+    def load(self, levels: HelperLevels) -> dict[str, Any]:
+        ctx = self._contexts.get(levels)
+        if ctx is not None:
+            return ctx
+        parent = self.load(levels[:-1])
+        parent_key = self._keys[levels[:-1]] if len(levels) > 1 else self.get_context_key()
+        codes = [ self.cache.get_code(path) for path in levels[-1] ]
+        key = None
+        if parent_key is not None:
+            key = (parent_key, tuple((str(path), digest) for path, (digest, _) in zip(levels[-1], codes)))
+        self._keys[levels] = key
+        ctx = self.cache.get_namespace(key) if key is not None else None
+        if ctx is None:
+            # Helpers must be executed in a real dictionary so that the
+            # functions they define can see everything that is in scope.
+            ctx = dict(parent)
+            for _, code in codes:
+                exec(code, ctx)
+            if key is not None:
+                self.cache.set_namespace(key, ctx)
+        self._contexts[levels] = ctx
+        return ctx
+
+def plan_dir(dir: Path, dest_dir: Path) -> list[Job]:
+
+    jobs = list[Job]()
+
+    def visit(path: Path, helpers: HelperLevels) -> None:
+        if is_ignored(path):
+            return
+        if path.is_file():
+            if path.suffixes and path.suffixes[-1] == '.tply':
+                dest_path = dest_dir / path.parent.relative_to(dir) / strip_ext(path.name)
+                jobs.append(RenderJob(path, dest_path, str(path.relative_to(Path.cwd())), helpers))
+            else:
+                jobs.append(CopyJob(path, dest_dir / path.relative_to(dir)))
+            return
+        if path.is_dir():
+            dest_path = dest_dir / path.relative_to(dir)
+            helper_paths = []
+            helpers_file = path / (helpers_dir_name + '.py')
+            if helpers_file.exists():
+                collect_helpers(helpers_file, helper_paths)
+            helpers_dir = path / helpers_dir_name
+            if helpers_dir.exists():
+                collect_helpers(helpers_dir, helper_paths)
+            if helper_paths:
+                helpers = helpers + (tuple(helper_paths),)
+            dest_path.mkdir(parents=True, exist_ok=True)
+            for child_path in sorted(path.iterdir()):
+                visit(child_path, helpers)
+            return
+        warn(f'Skipping {path} because it is not a file nor a directory')
+
+    visit(dir, ())
+
+    return jobs
+
+class Manifest:
+
+    def __init__(self, path: Path, entries: dict[str, dict[str, Any]] | None = None) -> None:
+        if entries is None:
+            entries = {}
+        self.path = path
+        self.entries = entries
+
+    @staticmethod
+    def load(path: Path) -> 'Manifest':
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return Manifest(path)
+        if data.get('version') != MANIFEST_VERSION:
+            return Manifest(path)
+        return Manifest(path, data['outputs'])
+
+    def save(self) -> None:
+        data = { 'version': MANIFEST_VERSION, 'outputs': self.entries }
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+class InputHasher:
+
+    def __init__(self, ctx: dict[str, Any], kwargs: dict[str, Any], helper_cache: HelperCache) -> None:
+        self.helper_cache = helper_cache
+        # Lazy values that no template reads must not be resolved, so outputs
+        # are always rendered again while one of them is still unresolved.
+        try:
+            self.context_digest = stable_hash([ ctx, kwargs ], resolve_lazy=False)
+        except UncacheableError:
+            self.context_digest = None
+        self._helper_digests = dict[HelperLevels, str]()
+
+    def get_helpers_digest(self, levels: HelperLevels) -> str:
+        digest = self._helper_digests.get(levels)
+        if digest is None:
+            h = hashlib.sha256()
+            for paths in levels:
+                for path in paths:
+                    h.update(str(path).encode('utf-8'))
+                    digest, _ = self.helper_cache.get_code(path)
+                    h.update(digest.encode('ascii'))
+            digest = h.hexdigest()
+            self._helper_digests[levels] = digest
+        return digest
+
+    def get_inputs(self, job: 'Job') -> dict[str, Any] | None:
+        if isinstance(job, CopyJob):
+            return { 'source': get_file_stamp(job.src_path) }
+        if self.context_digest is None:
+            return None
+        return {
+            'template': hash_file(job.src_path),
+            'helpers': self.get_helpers_digest(job.helpers),
+            'context': self.context_digest,
+        }
+
+def render_job(job: RenderJob, ctx: dict[str, Any], root_ctx: dict[str, Any], kwargs: dict[str, Any], template: CompiledTemplate | None = None) -> str:
+    if template is None:
+        with open(job.src_path, 'r') as f:
+            contents = f.read()
+    with shared_context.bind(root_ctx):
+        if template is not None:
+            return evaluate(template, ctx, **kwargs)
+        return evaluate(contents, ctx, filename=job.filename, **kwargs)
+
+_worker_loader: HelperLoader | None = None
+_worker_kwargs: dict[str, Any] = {}
+
+def _init_worker(ctx: dict[str, Any], kwargs: dict[str, Any]) -> None:
+    global _worker_loader, _worker_kwargs
+    # Tasks run on the same thread as the initializer, so this holds for the
+    # helpers that are loaded later on as well.
+    shared_context.value = ctx
+    _worker_loader = HelperLoader(ctx)
+    _worker_kwargs = kwargs
+
+def _render_in_worker(job: RenderJob) -> str:
+    assert(_worker_loader is not None)
+    return render_job(job, _worker_loader.load(job.helpers), _worker_loader.ctx, _worker_kwargs)
+
+def is_picklable(value: Any) -> bool:
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+    return True
+
+class BuildSummary:
+
+    def __init__(self) -> None:
+        self.written = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.up_to_date = 0
+        self.deleted = 0
+        self.failed = 0
+
+    def __repr__(self) -> str:
+        return f'BuildSummary(written={self.written}, unchanged={self.unchanged}, skipped={self.skipped}, up_to_date={self.up_to_date}, deleted={self.deleted}, failed={self.failed})'
+
+def execute_dir(dir: Path, dest_dir: Path, ctx: dict[str, Any] | None = None, force: bool = False, jobs: int | None = 1, incremental: bool = False, write_if_changed: bool = False, helper_cache: HelperCache | None = None, copy_strategy: CopyStrategy = 'copy', **kwargs) -> BuildSummary:
+    if ctx is None:
+        ctx = {}
+    # Helpers may call load_context() while they are being executed
+    with shared_context.bind(ctx):
+        return _execute_dir(dir, dest_dir, ctx, force, jobs, incremental, write_if_changed, helper_cache, copy_strategy, kwargs)
+
+def _execute_dir(dir: Path, dest_dir: Path, ctx: dict[str, Any], force: bool, jobs: int | None, incremental: bool, write_if_changed: bool, helper_cache: HelperCache | None, copy_strategy: CopyStrategy, kwargs: dict[str, Any]) -> BuildSummary:
+
+    summary = BuildSummary()
+
+    # Discovery and helper loading always happen in this process, so that
+    # errors in helpers are reported in the same way for every mode.
+    planned = plan_dir(dir, dest_dir)
+    loader = HelperLoader(ctx, helper_cache)
+
+    manifest = None
+    old_entries = {}
+    hasher = None
+    inputs = dict[Job, dict[str, Any] | None]()
+    if incremental:
+        manifest = Manifest.load(dest_dir / manifest_file_name)
+        old_entries = manifest.entries
+        manifest.entries = {}
+        hasher = InputHasher(ctx, kwargs, loader.cache)
+
+    def get_entry_name(job: Job) -> str:
+        return job.dest_path.relative_to(dest_dir).as_posix()
+
+    pending = list[Job]()
+    for job in planned:
+        if isinstance(job, RenderJob):
+            loader.load(job.helpers)
+        owned = False
+        if hasher is not None:
+            name = get_entry_name(job)
+            entry = old_entries.get(name)
+            job_inputs = hasher.get_inputs(job)
+            inputs[job] = job_inputs
+            if entry is not None:
+                if job_inputs is not None \
+                        and entry['inputs'] == job_inputs \
+                        and entry['output'] == get_file_stamp(job.dest_path):
+                    manifest.entries[name] = entry
+                    summary.up_to_date += 1
+                    continue
+                # This output was generated by us, so we may overwrite it.
+                owned = True
+        if isinstance(job, CopyJob) and is_copy_up_to_date(job.src_path, job.dest_path, copy_strategy):
+            summary.unchanged += 1
+            if manifest is not None:
+                manifest.entries[get_entry_name(job)] = {
+                    'inputs': inputs[job],
+                    'output': get_file_stamp(job.dest_path),
+                    'digest': None,
+                }
+            continue
+        if not owned and not force and job.dest_path.exists():
+            warn(f'Skipping {job.dest_path} because it already exists')
+            summary.skipped += 1
+            continue
+        pending.append(job)
+
+    render_jobs = [ job for job in pending if isinstance(job, RenderJob) ]
+
+    if jobs != 1 and len(render_jobs) > 1 and not (is_picklable(ctx) and is_picklable(kwargs)):
+        warn('Rendering sequentially because the context cannot be sent to worker processes')
+        jobs = 1
+
+    results = dict[RenderJob, 'Future[str]']()
+    executor = None
+    if jobs != 1 and len(render_jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(ctx, kwargs))
+        for job in render_jobs:
+            results[job] = executor.submit(_render_in_worker, job)
+
+    succeeded = False
+    try:
+        for job in pending:
+            digest = None
+            if isinstance(job, RenderJob):
+                if executor is not None:
+                    result = results[job].result()
+                else:
+                    result = render_job(job, loader.load(job.helpers), ctx, kwargs)
+                if write_if_changed:
+                    data = encode_text(result)
+                    old_digest = None
+                    entry = old_entries.get(get_entry_name(job))
+                    if entry is not None and entry['output'] == get_file_stamp(job.dest_path):
+                        old_digest = entry.get('digest')
+                    written = write_file_if_changed(job.dest_path, data, old_digest)
+                    digest = hashlib.sha256(data).hexdigest()
+                else:
+                    with open(job.dest_path, 'w') as f:
+                        f.write(result)
+                    written = True
+            else:
+                if write_if_changed:
+                    written = copy_if_changed(job.src_path, job.dest_path, copy_strategy)
+                else:
+                    copy_file(job.src_path, job.dest_path, copy_strategy)
+                    written = True
+            if written:
+                summary.written += 1
+            else:
+                summary.unchanged += 1
+            if manifest is not None:
+                manifest.entries[get_entry_name(job)] = {
+                    'inputs': inputs[job],
+                    'output': get_file_stamp(job.dest_path),
+                    'digest': digest,
+                }
+        succeeded = True
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if manifest is not None:
+            planned_names = set(get_entry_name(job) for job in planned)
+            for name, entry in old_entries.items():
+                if name in planned_names:
+                    if name not in manifest.entries:
+                        # Keep the old entry so that a failed run is retried
+                        # without losing track of the output.
+                        manifest.entries[name] = { 'inputs': None, 'output': entry['output'] }
+                    continue
+                if not succeeded:
+                    # Stale outputs are only deleted by a run that went all
+                    # the way through.
+                    manifest.entries[name] = entry
+                    continue
+                stale_path = dest_dir / name
+                if stale_path.is_file():
+                    stale_path.unlink()
+                    summary.deleted += 1
+            manifest.save()
+
+    return summary
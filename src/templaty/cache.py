@@ -0,0 +1,306 @@
+
+from collections import OrderedDict
+from enum import Enum
+import hashlib
+import os
+from pathlib import Path
+import pickle
+import tempfile
+import threading
+import types
+from typing import TYPE_CHECKING, Any, Protocol
+
+from .analysis import FreeVariables
+from .deferred import Lazy
+
+if TYPE_CHECKING:
+    from .evaluator import CompiledTemplate
+    from .stats import RenderStats
+    from .profiler import TemplateProfile
+
+CACHE_VERSION = 1
+
+NONDETERMINISTIC_NAMES = { 'now' }
+
+NONDETERMINISTIC_MODULES = { 'random', 'secrets', 'time', 'datetime', 'uuid' }
+
+class CacheStore(Protocol):
+
+    def get(self, key: str) -> Any | None: ...
+
+    def set(self, key: str, value: Any) -> None: ...
+
+class MemoryCache:
+
+    def __init__(self, max_entries: int | None = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries = OrderedDict[str, Any]()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class DiskCache:
+
+    def __init__(self, path: Path | str, max_size: int = 256 * 1024 * 1024) -> None:
+        self.path = Path(path)
+        self.max_size = max_size
+        self._total_size: int | None = None
+        self._lock = threading.Lock()
+
+    def _get_entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / key
+
+    def _iter_entries(self):
+        if not self.path.exists():
+            return
+        for bucket in self.path.iterdir():
+            if not bucket.is_dir():
+                continue
+            for entry in bucket.iterdir():
+                yield entry
+
+    def get(self, key: str) -> Any | None:
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            # Bump the modification time so that eviction is least-recently-used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        entry_path = self._get_entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            old_size = entry_path.stat().st_size if entry_path.exists() else 0
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(entry.stat().st_size for entry in self._iter_entries())
+            else:
+                self._total_size += len(data) - old_size
+            if self._total_size > self.max_size:
+                self._evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in self._iter_entries():
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry))
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        self._total_size = total_size
+
+class UncacheableError(RuntimeError):
+    pass
+
+def _hash_value(value: Any, h: Any, seen: set[int], resolve_lazy: bool) -> None:
+
+    def write(tag: str, data: str | bytes = b'') -> None:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        h.update(tag.encode('ascii'))
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+
+    if value is None or isinstance(value, bool | int | float | complex):
+        write(type(value).__name__, repr(value))
+        return
+    if isinstance(value, str):
+        write('str', value)
+        return
+    if isinstance(value, bytes | bytearray):
+        write('bytes', bytes(value))
+        return
+    if isinstance(value, Enum):
+        write('enum', f'{type(value).__module__}.{type(value).__qualname__}.{value.name}')
+        return
+    if isinstance(value, Lazy):
+        # What matters is the value the template will see, but nothing says
+        # what a provider will return without running it.
+        if not resolve_lazy and not value.resolved:
+            raise UncacheableError(f'cannot hash {value!r} without resolving it')
+        _hash_value(value.get(), h, seen, resolve_lazy)
+        return
+
+    if id(value) in seen:
+        write('cycle')
+        return
+    seen.add(id(value))
+
+    if isinstance(value, list | tuple):
+        write(type(value).__name__, str(len(value)))
+        for element in value:
+            _hash_value(element, h, seen, resolve_lazy)
+    elif isinstance(value, dict):
+        write('dict', str(len(value)))
+        for key_digest, val in sorted(((stable_hash(k, resolve_lazy), v) for k, v in value.items()), key=lambda pair: pair[0]):
+            write('key', key_digest)
+            _hash_value(val, h, seen, resolve_lazy)
+    elif isinstance(value, set | frozenset):
+        write('set', str(len(value)))
+        for digest in sorted(stable_hash(element, resolve_lazy) for element in value):
+            write('element', digest)
+    elif isinstance(value, types.FunctionType):
+        write('function', f'{value.__module__}.{value.__qualname__}')
+        _hash_code(value.__code__, h)
+        _hash_value(value.__defaults__, h, seen, resolve_lazy)
+        if value.__closure__ is not None:
+            for cell in value.__closure__:
+                _hash_value(cell.cell_contents, h, seen, resolve_lazy)
+        # Helpers usually read other helpers or context variables through
+        # their globals, so these are part of the function's identity.
+        for name in sorted(_get_code_names(value.__code__)):
+            if name in value.__globals__:
+                write('global', name)
+                _hash_value(value.__globals__[name], h, seen, resolve_lazy)
+    elif isinstance(value, types.ModuleType):
+        write('module', value.__name__)
+    elif isinstance(value, types.BuiltinFunctionType | type):
+        write('ref', f'{value.__module__}.{value.__qualname__}')
+    elif hasattr(value, '__dict__') and not callable(value):
+        cls = type(value)
+        write('object', f'{cls.__module__}.{cls.__qualname__}')
+        _hash_value(vars(value), h, seen, resolve_lazy)
+    else:
+        raise UncacheableError(f'cannot hash {value!r} in a stable way')
+
+    seen.remove(id(value))
+
+def _hash_code(code: types.CodeType, h: Any) -> None:
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(const, h)
+        else:
+            h.update(repr(const).encode('utf-8'))
+
+def _get_code_names(code: types.CodeType) -> set[str]:
+    out = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            out.update(_get_code_names(const))
+    return out
+
+def stable_hash(value: Any, resolve_lazy: bool = True) -> str:
+    h = hashlib.sha256()
+    _hash_value(value, h, set(), resolve_lazy)
+    return h.hexdigest()
+
+def is_deterministic(free: FreeVariables) -> bool:
+    return not (free.builtins & NONDETERMINISTIC_NAMES) \
+        and not (free.imports & NONDETERMINISTIC_MODULES)
+
+_MISSING = object()
+
+def get_context_fingerprint(free: FreeVariables, ctx: dict[str, Any]) -> str:
+    from .evaluator import shared_context
+    shared = shared_context.value
+    if 'globals' in free.builtins or 'locals' in free.builtins:
+        # The template can inspect every variable, so we have to hash them all
+        names = set(ctx) | set(shared)
+    else:
+        names = free.names | free.dynamic | (free.builtins & (set(ctx) | set(shared)))
+    h = hashlib.sha256()
+    for name in sorted(names):
+        if name in shared:
+            value = shared[name]
+        else:
+            value = ctx.get(name, _MISSING)
+        h.update(name.encode('utf-8'))
+        if value is _MISSING:
+            h.update(b'\0')
+        else:
+            h.update(stable_hash(value).encode('ascii'))
+    return h.hexdigest()
+
+def get_template_digest(source: str) -> str:
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def evaluate_cached(template: 'str | CompiledTemplate', ctx: dict[str, Any], cache: CacheStore, indentation = '  ', filename = "#<anonymous>", stats: 'RenderStats | None' = None, profile: 'TemplateProfile | None' = None) -> str:
+
+    from .evaluator import CompiledTemplate, evaluate
+
+    if isinstance(template, CompiledTemplate):
+        source = template.source
+        filename = template.filename
+    else:
+        source = template
+    template_digest = get_template_digest(source)
+
+    # The analysis results are stored separately so that a cache hit does not
+    # require the template to be parsed again.
+    free_key = f'free-{CACHE_VERSION}-{template_digest}'
+    free = cache.get(free_key)
+    if free is None:
+        if isinstance(template, str):
+            template = CompiledTemplate(template, filename)
+        free = template.free_variables()
+        cache.set(free_key, free)
+
+    if not is_deterministic(free):
+        return evaluate(template, ctx, indentation, filename=filename, stats=stats, profile=profile)
+
+    try:
+        ctx_digest = get_context_fingerprint(free, ctx)
+    except UncacheableError:
+        return evaluate(template, ctx, indentation, filename=filename, stats=stats, profile=profile)
+
+    output_key = hashlib.sha256(f'{CACHE_VERSION}\0{template_digest}\0{indentation}\0{ctx_digest}'.encode('utf-8')).hexdigest()
+    output = cache.get(output_key)
+    if output is not None:
+        if stats is not None:
+            stats.cache_hits += 1
+            stats.renders += 1
+            stats.output_bytes += len(output.encode('utf-8'))
+        return output
+
+    if stats is not None:
+        stats.cache_misses += 1
+    output = evaluate(template, ctx, indentation, filename=filename, stats=stats, profile=profile)
+    cache.set(output_key, output)
+    return output
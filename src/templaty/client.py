@@ -0,0 +1,91 @@
+
+import json
+import os
+from pathlib import Path
+import socket
+import stat
+import tempfile
+from typing import Any
+
+SOCKET_ENV_VAR = 'TEMPLATY_SOCKET'
+
+class RemoteError(RuntimeError):
+
+    def __init__(self, message: str, error_type: str | None = None) -> None:
+        super().__init__(message)
+        # The qualified name of the exception the server ran into, if any
+        self.error_type = error_type
+
+    def to_local_error(self) -> Exception:
+        # Rebuilds the exception that rendering in-process would have raised,
+        # as long as it is a built-in one or one of our own.
+        if self.error_type is None:
+            return self
+        module_name, _, name = self.error_type.rpartition('.')
+        if module_name == 'builtins':
+            import builtins
+            cls = getattr(builtins, name, None)
+        elif module_name == 'templaty' or module_name.startswith('templaty.'):
+            from importlib import import_module
+            try:
+                cls = getattr(import_module(module_name), name, None)
+            except ImportError:
+                cls = None
+        else:
+            cls = None
+        if not (isinstance(cls, type) and issubclass(cls, Exception)):
+            return self
+        try:
+            return cls(str(self))
+        except Exception:
+            return self
+
+class LocalRenderRequired(RemoteError):
+    pass
+
+class UntrustedSocketError(RemoteError):
+    pass
+
+def get_default_socket_path() -> Path:
+    path = os.environ.get(SOCKET_ENV_VAR)
+    if path:
+        return Path(path)
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return Path(runtime_dir) / 'templaty.sock'
+    return Path(tempfile.gettempdir()) / f'templaty-{os.getuid()}.sock'
+
+def check_socket(socket_path: Path) -> None:
+    # The fallback path is in a directory anyone can write to, so make sure
+    # the templates and data are not sent to a server of another user
+    st = os.stat(socket_path)
+    if not stat.S_ISSOCK(st.st_mode):
+        raise UntrustedSocketError(f'{socket_path} is not a socket')
+    if st.st_uid != os.getuid():
+        raise UntrustedSocketError(f'{socket_path} is owned by another user')
+
+def is_server_running(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+def render_remote(request: dict[str, Any], socket_path: Path | None = None) -> str:
+    if socket_path is None:
+        socket_path = get_default_socket_path()
+    check_socket(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f'server on {socket_path} closed the connection')
+    response = json.loads(line)
+    if not response['ok']:
+        if response.get('local'):
+            raise LocalRenderRequired(response['error'])
+        raise RemoteError(response['error'], response.get('type'))
+    return response['output']
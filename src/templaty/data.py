@@ -0,0 +1,113 @@
+
+from collections.abc import Callable
+import gc
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+import stat
+from typing import Any
+
+from sweetener import warn
+
+from .fs import write_atomic
+
+SNAPSHOT_VERSION = 1
+
+def get_default_cache_dir() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    if cache_home:
+        return Path(cache_home) / 'templaty' / 'data'
+    return Path.home() / '.cache' / 'templaty' / 'data'
+
+def _without_gc[T](fn: Callable[[bytes], T], data: bytes) -> T:
+    # Loading creates a lot of containers but no cycles, so there is no
+    # point in letting the garbage collector scan them over and over again.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return fn(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _is_private(st: os.stat_result) -> bool:
+    # Snapshots are unpickled, so anyone who can write to them can run code
+    # in this process.
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def _get_snapshot_path(path: Path, cache_dir: Path) -> Path:
+    return cache_dir / hashlib.sha256(os.fsencode(path.absolute())).hexdigest()
+
+class _Snapshot:
+
+    def __init__(self, path: Path, size: int, mtime_ns: int, digest: str) -> None:
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+
+    def load(self) -> Any:
+        # The data comes right after the header
+        with open(self.path, 'rb') as f:
+            pickle.load(f)
+            return _without_gc(pickle.loads, f.read())
+
+def _read_snapshot(snapshot_path: Path) -> _Snapshot | None:
+    try:
+        with open(snapshot_path, 'rb') as f:
+            if not _is_private(os.fstat(f.fileno())):
+                return None
+            header = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    if not isinstance(header, tuple) or len(header) != 4 or header[0] != SNAPSHOT_VERSION:
+        return None
+    return _Snapshot(snapshot_path, header[1], header[2], header[3])
+
+def load_data_file(path: Path, cache_dir: Path | None = None) -> Any:
+    if cache_dir is None:
+        with open(path, 'rb') as f:
+            return _without_gc(json.loads, f.read())
+
+    try:
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        cache_dir_st = os.stat(cache_dir)
+    except OSError:
+        return load_data_file(path)
+    if not _is_private(cache_dir_st):
+        warn(f'Not using {cache_dir} as a data cache because other users can write to it')
+        return load_data_file(path)
+
+    snapshot_path = _get_snapshot_path(path, cache_dir)
+    st = path.stat()
+    snapshot = _read_snapshot(snapshot_path)
+    if snapshot is not None and snapshot.size == st.st_size and snapshot.mtime_ns == st.st_mtime_ns:
+        return snapshot.load()
+
+    with open(path, 'rb') as f:
+        contents = f.read()
+    digest = hashlib.sha256(contents).hexdigest()
+    if snapshot is not None and snapshot.digest == digest:
+        # The file was touched but its contents are still the same
+        data = snapshot.load()
+    else:
+        data = _without_gc(json.loads, contents)
+    try:
+        header = pickle.dumps((SNAPSHOT_VERSION, len(contents), st.st_mtime_ns, digest), protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(snapshot_path, header + pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        # A cache that can't be written to should never prevent the template
+        # from being rendered.
+        pass
+    return data
+
+def load_data_files(paths: list[Path], cache_dir: Path | None = None) -> dict[str, Any]:
+    ctx = {}
+    for path in paths:
+        data = load_data_file(path, cache_dir)
+        if not isinstance(data, dict):
+            raise ValueError(f'{path}: expected a JSON object at the top level')
+        ctx.update(data)
+    return ctx
@@ -0,0 +1,51 @@
+
+import threading
+from typing import Any, Callable
+
+class Lazy[T]:
+
+    def __init__(self, fn: Callable[[], T]) -> None:
+        self.fn = fn
+        self._resolved = False
+        self._value: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def resolved(self) -> bool:
+        return self._resolved
+
+    def get(self) -> T:
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._value = self.fn()
+                    self._resolved = True
+        return self._value
+
+    def __getstate__(self) -> tuple[Callable[[], T], bool, Any]:
+        return self.fn, self._resolved, self._value
+
+    def __setstate__(self, state: tuple[Callable[[], T], bool, Any]) -> None:
+        self.fn, self._resolved, self._value = state
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        if self._resolved:
+            return f'lazy({self._value!r})'
+        return f'lazy({self.fn!r})'
+
+def lazy[T](fn: Callable[[], T]) -> Lazy[T]:
+    return Lazy(fn)
+
+def resolve(value: Any) -> Any:
+    if isinstance(value, Lazy):
+        return value.get()
+    return value
+
+class ResolvingDict(dict[str, Any]):
+
+    def __getitem__(self, key: str) -> Any:
+        value = super().__getitem__(key)
+        if isinstance(value, Lazy):
+            return value.get()
+        return value
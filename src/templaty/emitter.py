@@ -49,6 +49,14 @@ def emit(node: Node, out = sys.stdout) -> None:
             out.write('{% endsetindent %}')
             return
 
+        if isinstance(node, CacheStatement):
+            out.write('{% cache ')
+            visit(node.key)
+            out.write(' %}')
+            visit(node.body)
+            out.write('{% endcache %}')
+            return
+
         if isinstance(node, JoinStatement):
             out.write('{% join ')
             visit(node.pattern)
@@ -56,6 +64,8 @@ def emit(node: Node, out = sys.stdout) -> None:
             visit(node.expression)
             out.write(' with ')
             visit(node.separator)
+            if node.parallel:
+                out.write(' parallel')
             out.write(' %}')
             visit(node.body)
             out.write('{% endfor %}')
@@ -66,6 +76,8 @@ def emit(node: Node, out = sys.stdout) -> None:
             visit(node.pattern)
             out.write('  in ')
             visit(node.expression)
+            if node.parallel:
+                out.write(' parallel')
             out.write(' %}')
             visit(node.body)
             out.write('{% endfor %}')
@@ -1,12 +1,26 @@
 
-from typing import Any, assert_never, cast
+from typing import TYPE_CHECKING, Any, assert_never, cast
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from sweetener import set_parent_nodes, warn
-from datetime import datetime
+import hashlib
+import itertools
+import os
+import time
+import warnings
 from textwrap import indent, dedent
 
 from .outline import outline
 from .ast import *
 from .util import is_blank, to_snake_case, to_camel_case
+from .deferred import Lazy, ResolvingDict
+
+if TYPE_CHECKING:
+    from .analysis import FreeVariables
+    from .cache import CacheStore
+    from .stats import RenderStats
+    from .profiler import TemplateProfile
 
 class OutputBase:
 
@@ -15,9 +29,11 @@ class OutputBase:
 
 class TextOutput(OutputBase):
 
-    def __init__(self, text = '') -> None:
+    def __init__(self, text = '', raw: str | None = None) -> None:
         super().__init__()
         self.text = text
+        # Set when `text` was aligned to the indentation of the call site
+        self.raw = raw
 
 class BlockOutput(OutputBase):
 
@@ -96,27 +112,342 @@ DEFAULT_BUILTINS = {
     }
 
 
+_MISSING = object()
+
 class Ref[T]:
 
     def __init__(self, value: T) -> None:
         self.value = value
 
-shared_context = Ref[dict[str, Any]]({})
+class ContextRef[T]:
+
+    def __init__(self, name: str, default: T) -> None:
+        self._var = ContextVar[T](name, default=default)
+
+    @property
+    def value(self) -> T:
+        return self._var.get()
+
+    @value.setter
+    def value(self, value: T) -> None:
+        self._var.set(value)
+
+    @contextmanager
+    def bind(self, value: T) -> Iterator[T]:
+        token = self._var.set(value)
+        try:
+            yield value
+        finally:
+            self._var.reset(token)
+
+# Every thread and every asyncio task sees its own value, so that renders
+# that run concurrently don't see each other's context.
+shared_context = ContextRef[dict[str, Any]]('shared_context', {})
 
 def load_context() -> dict[str, Any]:
     return shared_context.value
 
-def evaluate(template: str | Template, ctx: dict[str, Any] = {}, indentation = '  ', filename = "#<anonymous>"):
+def parse(source: str, filename = "#<anonymous>", stats: 'RenderStats | None' = None) -> Template:
+    from .scanner import Scanner
+    from .parser import Parser
+    scanner = Scanner(filename, source)
+    if stats is None:
+        parser = Parser(scanner)
+        template = parser.parse_all()
+        set_parent_nodes(template)
+        return template
+    from .stats import TimedScanner
+    timed_scanner = TimedScanner(scanner, stats)
+    stats.enter_phase('parse')
+    try:
+        start = time.perf_counter()
+        parser = Parser(timed_scanner)
+        template = parser.parse_all()
+        set_parent_nodes(template)
+        elapsed = time.perf_counter() - start
+        stats.add_time('scan', timed_scanner.elapsed)
+        stats.add_time('parse', elapsed - timed_scanner.elapsed)
+    finally:
+        stats.exit_phase('parse')
+    return template
+
+class CompiledTemplate:
+
+    def __init__(self, source: str, filename = "#<anonymous>") -> None:
+        self.source = source
+        self.filename = filename
+        self.template = parse(source, filename)
+        outline(self.template)
+        from .cache import MemoryCache
+        self.fragment_cache: 'CacheStore' = MemoryCache()
+        self._free_variables: 'FreeVariables | None' = None
+        self._digest: str | None = None
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.source.encode('utf-8')).hexdigest()
+        return self._digest
+
+    def free_variables(self) -> 'FreeVariables':
+        if self._free_variables is None:
+            from .analysis import free_variables
+            self._free_variables = free_variables(self.template)
+        return self._free_variables
+
+    def evaluate(self, ctx: dict[str, Any] = {}, indentation = '  ', **kwargs) -> str:
+        return evaluate(self, ctx, indentation, filename=self.filename, **kwargs)
+
+def compile_template(source: str, filename = "#<anonymous>") -> CompiledTemplate:
+    return CompiledTemplate(source, filename)
+
+def bind_pattern(pattern: Pattern, value: Any, env: Env) -> None:
+    if isinstance(pattern, VarPattern):
+        env.set(pattern.name, value)
+        return
+    if isinstance(pattern, TuplePattern):
+        for i, element in enumerate(pattern.elements):
+            bind_pattern(element, value[i], env)
+        return
+    raise RuntimeError(f'unexpected node {pattern}')
+
+def bind_iteration(stmt: ForInStatement | JoinStatement, env: Env, i: int, element: Any) -> Env:
+    inner_env = Env(env)
+    inner_env.set('index', i)
+    bind_pattern(stmt.pattern, element, inner_env)
+    return inner_env
+
+def call_value(op: Any, args: list[Any]) -> Any:
+    if not callable(op):
+        raise RuntimeError("Could not evaluate Templately expression: result is not applicable.".format(op))
+    return op(*args)
+
+def lookup_var(expr: VarRefExpression, env: Env, shared: dict[str, Any], global_env: Env) -> Any:
+    if expr.name in shared:
+        value = shared[expr.name]
+    elif expr.name in env:
+        value = env.lookup(expr.name)
+    else:
+        value = _MISSING
+    if value is not _MISSING:
+        if isinstance(value, Lazy):
+            return value.get()
+        return value
+    if expr.name == 'globals':
+        return lambda: global_env
+    elif expr.name == 'locals':
+        return lambda: env
+    else:
+        message = ''
+        span = expr.span
+        if span is not None:
+            message += f'{span.file.name}:{span.start_pos.line}:{span.start_pos.column}: '
+        message += f"variable '{expr.name}' is not defined"
+        raise RuntimeError(message)
+
+def get_fragment_key(digest: str, stmt: CacheStatement, key: Any) -> str:
+    from .cache import UncacheableError, stable_hash
+    try:
+        key_digest = stable_hash(key)
+    except UncacheableError as e:
+        message = ''
+        span = stmt.span
+        if span is not None:
+            message += f'{span.file.name}:{span.start_pos.line}:{span.start_pos.column}: '
+        message += f'the key of this cache block cannot be used: {e}'
+        raise UncacheableError(message) from e
+    return f'fragment-{digest}-{stmt.span.start_pos.offset if stmt.span else 0}-{key_digest}'
+
+def exec_code_block(stmt: CodeBlock, env: Env, global_env: Env, filename: str) -> None:
+    globals = global_env.to_dict()
+    # Lazy values are resolved when the code reads them by name
+    locals = ResolvingDict(env.to_dict())
+    exec(compile(stmt.module, filename=filename, mode='exec'), globals, locals)
+    for k, v in locals.items():
+        if k not in env or env.lookup(k) != v:
+            env.set(k, v)
+
+class Cursor:
+
+    # Keeps track of the indentation of the line that is being generated, so
+    # that multi-line values can be aligned with it.
+
+    def __init__(self) -> None:
+        self.at_blank_line = True
+        self.curr_indent = 0
 
-    def bind_pattern(pattern: Pattern, value: Any, env: Env) -> None:
-        if isinstance(pattern, VarPattern):
-            env.set(pattern.name, value)
-            return
-        if isinstance(pattern, TuplePattern):
-            for i, element in enumerate(pattern.elements):
-                bind_pattern(element, value[i], env)
-            return
-        raise RuntimeError(f'unexpected node {pattern}')
+    def advance(self, text: str) -> None:
+        at_blank_line = self.at_blank_line
+        curr_indent = self.curr_indent
+        for ch in text:
+            if ch == '\n':
+                at_blank_line = True
+                curr_indent = 0
+            else:
+                if at_blank_line:
+                    if is_blank(ch):
+                        curr_indent += 1
+                    else:
+                        at_blank_line = False
+        self.at_blank_line = at_blank_line
+        self.curr_indent = curr_indent
+
+    def align(self, text: str) -> str:
+        if text.find('\n') != -1:
+            text = indent(dedent(text), ' ' * self.curr_indent).lstrip()
+        return text
+
+    def text(self, text: str) -> TextOutput:
+        self.advance(text)
+        return TextOutput(text)
+
+    def value(self, value: Any) -> TextOutput:
+        text = str(value)
+        return TextOutput(self.align(text), raw=text)
+
+    def replay(self, output: Output) -> Output:
+        # Rebuild a previously evaluated subtree as if it was evaluated at the
+        # current position, so that aligned expressions follow the call site.
+        if isinstance(output, TextOutput):
+            if output.raw is not None:
+                result = TextOutput(self.align(output.raw), raw=output.raw)
+            else:
+                self.advance(output.text)
+                result = TextOutput(output.text)
+        elif isinstance(output, BlockOutput):
+            result = BlockOutput([ self.replay(child) for child in output.children ])
+        else:
+            assert_never(output)
+        result.indent_override = output.indent_override
+        return result
+
+def make_writer(out: BlockOutput, cursor: Cursor) -> Callable[[str], None]:
+    # Lets code blocks call write() to add text to the body they are in
+    def write(text: str) -> None:
+        out.children.append(cursor.text(text))
+    return write
+
+# Worker processes are forked while a parallel loop is being evaluated and
+# inherit it through this mapping, so that neither the template nor the
+# variables in scope have to be pickled.
+_parallel_loops = dict[int, Callable[[int], Output]]()
+_parallel_loop_ids = itertools.count()
+_in_parallel_worker = False
+
+def _init_parallel_worker() -> None:
+    global _in_parallel_worker
+    _in_parallel_worker = True
+
+def _run_parallel_iteration(loop_id: int, i: int) -> Output:
+    return _parallel_loops[loop_id](i)
+
+def can_run_in_parallel() -> bool:
+    import multiprocessing
+    import threading
+    # Forking a process that has other threads running may leave locks held
+    # by those threads locked forever in the child.
+    return not _in_parallel_worker \
+        and threading.active_count() == 1 \
+        and 'fork' in multiprocessing.get_all_start_methods()
+
+def run_in_parallel(fn: Callable[[int], Output], count: int, max_workers: int | None = None) -> list[Output]:
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, count)
+    loop_id = next(_parallel_loop_ids)
+    _parallel_loops[loop_id] = fn
+    try:
+        with warnings.catch_warnings():
+            # The threads of a pool that was just shut down may not have fully
+            # exited yet, which Python would otherwise warn about.
+            warnings.filterwarnings('ignore', message='This process .* is multi-threaded', category=DeprecationWarning)
+            pool = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('fork'), initializer=_init_parallel_worker)
+            chunksize = max(1, count // (max_workers * 4))
+            results = pool.map(_run_parallel_iteration, itertools.repeat(loop_id, count), range(count), chunksize=chunksize)
+        with pool:
+            return list(results)
+    finally:
+        del _parallel_loops[loop_id]
+
+class RenderSetup:
+
+    def __init__(self, template: str | Template | CompiledTemplate, ctx: dict[str, Any], filename: str, fragment_cache: 'CacheStore | None', stats: 'RenderStats | None' = None) -> None:
+        self._digest = None
+        if isinstance(template, CompiledTemplate):
+            self._digest = template.digest
+            if fragment_cache is None:
+                fragment_cache = template.fragment_cache
+            template = template.template
+        else:
+            if isinstance(template, str):
+                template = parse(template, filename, stats)
+            if stats is None:
+                outline(template)
+            else:
+                with stats.measure('outline'):
+                    outline(template)
+        if stats is not None:
+            from .stats import count_nodes
+            stats.nodes += count_nodes(template)
+        self.template = template
+        self.stats = stats
+        self._fragment_cache = fragment_cache
+        self.shared = shared_context.value
+        self.global_env = Env()
+        self.global_env.update(DEFAULT_BUILTINS)
+        self.global_env.update(ctx)
+        self.global_env.set('now', time.strftime("%b %d %Y %H:%M:%S"))
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            source = self.template.span.file.text if self.template.span is not None else ''
+            self._digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        return self._digest
+
+    @property
+    def fragments(self) -> 'CacheStore':
+        if self._fragment_cache is None:
+            from .cache import MemoryCache
+            self._fragment_cache = MemoryCache(None)
+        return self._fragment_cache
+
+    def get_fragment(self, stmt: CacheStatement, key: Any, cursor: Cursor) -> tuple[str, Output | None]:
+        fragment_key = get_fragment_key(self.digest, stmt, key)
+        result = self.fragments.get(fragment_key)
+        if self.stats is not None:
+            if result is None:
+                self.stats.cache_misses += 1
+            else:
+                self.stats.cache_hits += 1
+        if result is not None:
+            result = cursor.replay(result)
+        return fragment_key, result
+
+def finish_render(output: Output, stats: 'RenderStats | None') -> str:
+    if stats is None:
+        return render_output(output)
+    from .stats import count_output_nodes
+    with stats.measure('render'):
+        result = render_output(output)
+    stats.renders += 1
+    stats.output_nodes += count_output_nodes(output)
+    stats.output_bytes += len(result.encode('utf-8'))
+    return result
+
+def evaluate(template: str | Template | CompiledTemplate, ctx: dict[str, Any] = {}, indentation = '  ', filename = "#<anonymous>", cache: 'CacheStore | None' = None, fragment_cache: 'CacheStore | None' = None, max_workers: int | None = None, stats: 'RenderStats | None' = None, profile: 'TemplateProfile | None' = None):
+
+    if cache is not None and not isinstance(template, Template):
+        from .cache import evaluate_cached
+        return evaluate_cached(template, ctx, cache, indentation, filename=filename, stats=stats, profile=profile)
+
+    output = evaluate_output(template, ctx, indentation, filename, fragment_cache, max_workers, stats, profile)
+
+    return finish_render(output, stats)
+
+def evaluate_output(template: str | Template | CompiledTemplate, ctx: dict[str, Any] = {}, indentation = '  ', filename = "#<anonymous>", fragment_cache: 'CacheStore | None' = None, max_workers: int | None = None, stats: 'RenderStats | None' = None, profile: 'TemplateProfile | None' = None) -> Output:
 
     def eval_expr(expr: Expression, env: Env) -> Any:
         if isinstance(expr, ConstExpression):
@@ -136,62 +467,35 @@ def evaluate(template: str | Template, ctx: dict[str, Any] = {}, indentation = '
                 out = getattr(out, name)
             return out
         elif isinstance(expr, VarRefExpression):
-            assert(shared_context.value is not None)
-            if expr.name in shared_context.value:
-                return shared_context.value[expr.name]
-            if expr.name in env:
-                return env.lookup(expr.name)
-            if expr.name == 'globals':
-                return lambda: global_env
-            elif expr.name == 'locals':
-                return lambda: env
-            else:
-                message = ''
-                span = expr.span
-                if span is not None:
-                    message += f'{span.file.name}:{span.start_pos.line}:{span.start_pos.column}: '
-                message += f"variable '{expr.name}' is not defined"
-                raise RuntimeError(message)
+            return lookup_var(expr, env, shared, global_env)
         elif isinstance(expr, CallExpression):
             op = eval_expr(expr.operator, env)
             args = list(eval_expr(arg, env) for arg in expr.operands)
-            if not callable(op):
-                raise RuntimeError("Could not evaluate Templately expression: result is not applicable.".format(op))
-            return op(*args)
+            return call_value(op, args)
         else:
             raise RuntimeError("Could not evaluate Templately expression: unknown expression {}.".format(expr))
 
-    def align(text: str) -> str:
-        if text.find('\n') != -1:
-            text = indent(dedent(text), ' ' * curr_indent).lstrip()
-        return text
-
-    at_blank_line = True
-    curr_indent = 0
-
-    def advance(text: str) -> None:
-        nonlocal at_blank_line, curr_indent
-        for ch in text:
-            if ch == '\n':
-                at_blank_line = True
-                curr_indent = 0
-            else:
-                if at_blank_line:
-                    if is_blank(ch):
-                        curr_indent += 1
-                    else:
-                        at_blank_line = False
-
     def eval_loop(stmt: ForInStatement | JoinStatement, env: Env, sep: Expression | None = None) -> Output:
         value = eval_expr(stmt.expression, env)
         out = BlockOutput()
         elements = list(value)
-        for i, element in enumerate(elements):
-            inner_env = Env(env)
-            inner_env.set('index', i)
-            bind_pattern(stmt.pattern, element, inner_env)
-            result = eval_stmt(stmt.body, inner_env)
-            out.children.append(result)
+
+        def eval_iteration(i: int) -> Output:
+            return eval_stmt(stmt.body, bind_iteration(stmt, env, i, elements[i]))
+
+        if stmt.parallel and len(elements) > 1 and can_run_in_parallel():
+            def eval_iteration_in_worker(i: int) -> Output:
+                nonlocal cursor
+                # Where the output ends up is only known once all iterations
+                # before it are done, so it is aligned again by replay().
+                cursor = Cursor()
+                return eval_iteration(i)
+            results = run_in_parallel(eval_iteration_in_worker, len(elements), max_workers)
+            out.children.extend(cursor.replay(result) for result in results)
+            return out
+
+        for i in range(len(elements)):
+            out.children.append(eval_iteration(i))
         # for i, res in enumerate(results):
         #     if sep_value and i < len(results)-1:
         #         k = rfind(res, lambda ch: not is_whitespace(ch))
@@ -205,19 +509,14 @@ def evaluate(template: str | Template, ctx: dict[str, Any] = {}, indentation = '
 
         if isinstance(stmt, Body):
             out = BlockOutput()
-            def write(text):
-                nonlocal out
-                advance(text)
-                out.children.append(TextOutput(text))
-            env.set('write', write)
+            env.set('write', make_writer(out, cursor))
             for stmt in stmt.elements:
                 result = eval_stmt(stmt, env)
                 out.children.append(result)
             return out
 
         if isinstance(stmt, TextStatement):
-            advance(stmt.text)
-            return TextOutput(stmt.text)
+            return cursor.text(stmt.text)
 
         if isinstance(stmt, IfStatement):
             for case in stmt.cases:
@@ -235,8 +534,15 @@ def evaluate(template: str | Template, ctx: dict[str, Any] = {}, indentation = '
             return eval_loop(stmt, env, sep=stmt.separator)
 
         if isinstance(stmt, ExpressionStatement):
-            value = eval_expr(stmt.expression, env)
-            return TextOutput(align(str(value)))
+            return cursor.value(eval_expr(stmt.expression, env))
+
+        if isinstance(stmt, CacheStatement):
+            fragment_key, result = setup.get_fragment(stmt, eval_expr(stmt.key, env), cursor)
+            if result is not None:
+                return result
+            result = eval_stmt(stmt.body, env)
+            setup.fragments.set(fragment_key, result)
+            return result
 
         if isinstance(stmt, SetIndentStatement):
             level = eval_expr(stmt.level, env)
@@ -245,65 +551,65 @@ def evaluate(template: str | Template, ctx: dict[str, Any] = {}, indentation = '
             return result
 
         if isinstance(stmt, CodeBlock):
-            globals = global_env.to_dict()
-            locals = env.to_dict()
-            exec(compile(stmt.module, filename=filename, mode='exec'), globals, locals)
-            for k, v in locals.items():
-                if k not in env or env.lookup(k) != v:
-                    env.set(k, v)
+            exec_code_block(stmt, env, global_env, filename)
             return TextOutput('')
 
         raise RuntimeError(f'unexpected node {stmt}')
 
-    if isinstance(template, str):
-        from .scanner import Scanner
-        from .parser import Parser
-        scanner = Scanner(filename, template)
-        parser = Parser(scanner)
-        template = parser.parse_all()
-        set_parent_nodes(template)
-
-    global_env = Env()
-    global_env.update(DEFAULT_BUILTINS)
-    global_env.update(ctx)
-    global_env.set('now', datetime.now().strftime("%b %d %Y %H:%M:%S"))
-
-    outline(template)
+    setup = RenderSetup(template, ctx, filename, fragment_cache, stats)
+    shared = setup.shared
+    global_env = setup.global_env
+    cursor = Cursor()
+
+    if profile is not None:
+        # Recursive calls go through these names as well, so every node
+        # that is evaluated ends up in the profile.
+        eval_expr = profile.wrap_expr(eval_expr)
+        eval_stmt = profile.wrap_stmt(eval_stmt)
+
+    try:
+        if stats is None:
+            return eval_stmt(setup.template.body, global_env)
+        with stats.measure('evaluate'):
+            return eval_stmt(setup.template.body, global_env)
+    finally:
+        if profile is not None:
+            profile.finish()
+
+def get_indentation(output: Output, at_blank_line=True, default_indent=0, curr_indent=0) -> int:
+    min_indent = None
+    def visit(output: Output) -> None:
+        nonlocal at_blank_line, curr_indent, min_indent
+        if isinstance(output, TextOutput):
+            for ch in output.text:
+                if at_blank_line:
+                    if is_blank(ch):
+                        curr_indent += 1
+                        continue
+                    if ch == '\n':
+                        at_blank_line = False
+                    elif min_indent is None or curr_indent < min_indent:
+                        min_indent = curr_indent
+                else:
+                    if ch == '\n':
+                        at_blank_line = True
+                        curr_indent = 0
+            return
+        if isinstance(output, BlockOutput):
+            for child in output.children:
+                visit(child)
+            return
+        assert_never(output)
+    visit(output)
+    if min_indent is None:
+        min_indent = default_indent if at_blank_line else curr_indent 
+    return min_indent
 
-    output = eval_stmt(template.body, global_env)
+def render_output(output: Output) -> str:
 
     at_blank_line = True
     curr_indent = 0
 
-    def get_indentation(output: Output, at_blank_line=True, default_indent=0, curr_indent=0) -> int:
-        min_indent = None
-        def visit(output: Output) -> None:
-            nonlocal at_blank_line, curr_indent, min_indent
-            if isinstance(output, TextOutput):
-                for ch in output.text:
-                    if at_blank_line:
-                        if is_blank(ch):
-                            curr_indent += 1
-                            continue
-                        if ch == '\n':
-                            at_blank_line = False
-                        elif min_indent is None or curr_indent < min_indent:
-                            min_indent = curr_indent
-                    else:
-                        if ch == '\n':
-                            at_blank_line = True
-                            curr_indent = 0
-                return
-            if isinstance(output, BlockOutput):
-                for child in output.children:
-                    visit(child)
-                return
-            assert_never(output)
-        visit(output)
-        if min_indent is None:
-            min_indent = default_indent if at_blank_line else curr_indent 
-        return min_indent
-
     def render(output: Output, dedent_count: int | None, indentation: str | None) -> str:
         nonlocal at_blank_line, curr_indent
         if isinstance(output, TextOutput):
@@ -336,4 +642,3 @@ def evaluate(template: str | Template, ctx: dict[str, Any] = {}, indentation = '
         assert_never(output)
 
     return render(output, None, None)
-
@@ -0,0 +1,175 @@
+
+from collections.abc import Callable
+import hashlib
+import locale
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import BinaryIO, Literal
+
+CHUNK_SIZE = 1024 * 1024
+
+FICLONE = 0x40049409
+
+type CopyStrategy = Literal['copy', 'reflink', 'hardlink', 'symlink']
+
+_default_mode: int | None = None
+
+def get_default_mode() -> int:
+    global _default_mode
+    if _default_mode is None:
+        umask = os.umask(0)
+        os.umask(umask)
+        _default_mode = 0o666 & ~umask
+    return _default_mode
+
+def encode_text(text: str) -> bytes:
+    # This is the same encoding open() uses by default for text files
+    return text.encode(locale.getpreferredencoding(False))
+
+def file_equals(path: Path, data: bytes) -> bool:
+    view = memoryview(data)
+    offset = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return offset == len(data)
+            if view[offset:offset+len(chunk)] != chunk:
+                return False
+            offset += len(chunk)
+
+def files_equal(a: Path, b: Path) -> bool:
+    with open(a, 'rb') as f1, open(b, 'rb') as f2:
+        while True:
+            chunk1 = f1.read(CHUNK_SIZE)
+            chunk2 = f2.read(CHUNK_SIZE)
+            if chunk1 != chunk2:
+                return False
+            if not chunk1:
+                return True
+
+def write_atomic(path: Path, data: bytes) -> None:
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = get_default_mode()
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def write_if_changed(path: Path, text: str | bytes, digest: str | None = None) -> bool:
+    # If given, `digest` is the SHA-256 hash of what is currently in the file,
+    # which saves us from reading the file again.
+    data = encode_text(text) if isinstance(text, str) else text
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        size = None
+    if size == len(data):
+        if digest is not None:
+            if hashlib.sha256(data).hexdigest() == digest:
+                return False
+        elif file_equals(path, data):
+            return False
+    write_atomic(path, data)
+    return True
+
+def clone_file(src: BinaryIO, dest: BinaryIO) -> None:
+    import fcntl
+    fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+
+def copy_file_range(src: BinaryIO, dest: BinaryIO) -> None:
+    remaining = os.fstat(src.fileno()).st_size
+    while remaining > 0:
+        # The kernel copies the data without it ever reaching user space
+        n = os.copy_file_range(src.fileno(), dest.fileno(), remaining)
+        if n == 0:
+            break
+        remaining -= n
+
+def _copy_data(src: BinaryIO, dest: BinaryIO, strategy: CopyStrategy) -> None:
+    if strategy == 'reflink':
+        try:
+            clone_file(src, dest)
+            return
+        except (OSError, ImportError):
+            pass
+        try:
+            copy_file_range(src, dest)
+            return
+        except (OSError, AttributeError):
+            # Start over, in case some of the data was copied already
+            src.seek(0)
+            dest.seek(0)
+            dest.truncate()
+    shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+def _make_temp_link(link: Callable[[str], None], dest_path: Path) -> str:
+    # Like mkstemp(), except that the file is created by `link`, which fails
+    # rather than replace a file that another process put there.
+    for _ in range(tempfile.TMP_MAX):
+        tmp_path = os.path.join(dest_path.parent, f'.{dest_path.name}.{os.urandom(6).hex()}')
+        try:
+            link(tmp_path)
+            return tmp_path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f'no usable temporary file name found for {dest_path}')
+
+def copy_file(src_path: Path, dest_path: Path, strategy: CopyStrategy = 'copy') -> None:
+    # We never write into the destination directly, because it might be
+    # linked to the source file.
+    tmp_path = None
+    if strategy == 'symlink':
+        target = os.path.relpath(src_path, dest_path.parent)
+        tmp_path = _make_temp_link(lambda path: os.symlink(target, path), dest_path)
+    elif strategy == 'hardlink':
+        try:
+            tmp_path = _make_temp_link(lambda path: os.link(src_path, path), dest_path)
+        except OSError:
+            # Most likely the destination is on another file system
+            pass
+    try:
+        if tmp_path is None:
+            fd, tmp_path = tempfile.mkstemp(dir=dest_path.parent, prefix=f'.{dest_path.name}.')
+            with os.fdopen(fd, 'wb') as dest, open(src_path, 'rb') as src:
+                _copy_data(src, dest, strategy)
+            shutil.copystat(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if tmp_path is not None and os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def is_copy_up_to_date(src_path: Path, dest_path: Path, strategy: CopyStrategy = 'copy') -> bool:
+    try:
+        dest_st = os.lstat(dest_path)
+    except FileNotFoundError:
+        return False
+    if strategy == 'symlink':
+        return os.path.islink(dest_path) and os.path.realpath(dest_path) == os.path.realpath(src_path)
+    if os.path.islink(dest_path):
+        return False
+    src_st = os.stat(src_path)
+    return src_st.st_size == dest_st.st_size and src_st.st_mtime_ns == dest_st.st_mtime_ns
+
+def copy_if_changed(src_path: Path, dest_path: Path, strategy: CopyStrategy = 'copy') -> bool:
+    if is_copy_up_to_date(src_path, dest_path, strategy):
+        return False
+    if strategy != 'symlink' and not dest_path.is_symlink():
+        try:
+            dest_size = os.stat(dest_path).st_size
+        except FileNotFoundError:
+            dest_size = None
+        if dest_size == os.stat(src_path).st_size and files_equal(src_path, dest_path):
+            return False
+    copy_file(src_path, dest_path, strategy)
+    return True
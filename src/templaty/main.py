@@ -1,38 +1,278 @@
 
+import os
 import sys
 import argparse
 import json
+from pathlib import Path
+import time
 
-from .scanner import Scanner
-from .parser import Parser
-from .evaluator import evaluate
+# Only what is needed to parse the command line is imported up front. The
+# rest is imported when it is used, so that e.g. rendering through a running
+# server does not have to load the template engine at all.
+
+def watch_main(argv):
+
+    from .watch import watch_dir
+
+    parser = argparse.ArgumentParser(prog='templaty watch')
+    parser.add_argument('dir', help='The directory containing the templates')
+    parser.add_argument('dest_dir', help='The directory where the generated files will be written to')
+    parser.add_argument('--data-file', action='append', help='A JSON file containing variables that will be passed to the templates (may be given more than once)')
+    parser.add_argument('--poll', action='store_true', help='Check for changes periodically instead of using file system notifications')
+    parser.add_argument('--interval', type=float, default=0.25, help='How many seconds to wait between checks when polling')
+    parser.add_argument('--force', action='store_true', help='Overwrite files in the destination directory that were not generated by this command')
+
+    args = parser.parse_args(argv)
+
+    from .data import load_data_files
+
+    data_files = [ Path(name) for name in args.data_file or [] ]
+
+    def load_data():
+        return load_data_files(data_files)
+
+    def on_update(summary, elapsed):
+        print(f'Wrote {summary.written} file(s), skipped {summary.skipped}, deleted {summary.deleted}, {summary.failed} failed in {elapsed * 1000:.0f}ms', file=sys.stderr)
+
+    try:
+        watch_dir(Path(args.dir), Path(args.dest_dir), load_data, data_files, args.interval, args.poll, on_update, force=args.force)
+    except KeyboardInterrupt:
+        pass
+
+def batch_main(argv):
+
+    from .batch import ManifestError, load_manifest, parse_job_spec, run_batch
+
+    parser = argparse.ArgumentParser(prog='templaty batch')
+    parser.add_argument('jobs', nargs='*', metavar='TEMPLATE:DATA:OUTPUT', help='A template to render with the given JSON data file, which may be left empty')
+    parser.add_argument('-m', '--manifest', action='append', default=[], help='A JSON or TOML file with a list of jobs to run')
+    parser.add_argument('-j', '--jobs', dest='max_workers', type=int, default=1, help='How many processes to render with (0 means one per CPU)')
+    parser.add_argument('--write-if-changed', action='store_true', help='Only write to an output file if the generated code is different from what is already there')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report jobs that failed')
+
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = []
+        for manifest in args.manifest:
+            jobs.extend(load_manifest(Path(manifest)))
+        for spec in args.jobs:
+            jobs.append(parse_job_spec(spec))
+    except (OSError, ValueError, ManifestError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+
+    results = run_batch(jobs, args.max_workers or None, args.write_if_changed)
+
+    failed = 0
+    for result in results:
+        if result.error is not None:
+            failed += 1
+            print(f'FAIL {result.job.output_path}: {result.error}', file=sys.stderr)
+        elif not args.quiet:
+            status = 'written' if result.written else 'unchanged'
+            print(f'ok   {result.job.output_path} ({status}, {result.elapsed * 1000:.1f}ms)', file=sys.stderr)
+    if not args.quiet or failed:
+        print(f'{len(results) - failed} succeeded, {failed} failed', file=sys.stderr)
+
+    return 1 if failed else 0
+
+def jsonl_main(args):
+
+    from .evaluator import compile_template
+    from .stream import RecordError, iter_records, render_records
+
+    with open(args.file, 'r') as f:
+        template = compile_template(f.read(), filename=args.file)
+    name_template = None
+    if args.output_name is not None:
+        name_template = compile_template(args.output_name, filename='--output-name')
+
+    def iter_all_records():
+        if args.data_file is None:
+            yield from iter_records(sys.stdin, '<stdin>')
+            return
+        for name in args.data_file:
+            with open(name, 'r') as f:
+                yield from iter_records(f, name)
+
+    try:
+        if name_template is not None:
+            output = None
+        elif args.output is not None:
+            output = open(args.output, 'w')
+        else:
+            output = sys.stdout
+        try:
+            render_records(template, iter_all_records(), output, name_template, args.write_if_changed)
+        finally:
+            if output is not None and output is not sys.stdout:
+                output.close()
+    except RecordError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+
+def serve_main(argv):
+
+    from .server import get_default_socket_path, serve
+
+    parser = argparse.ArgumentParser(prog='templaty serve')
+    parser.add_argument('--socket', help=f'The path of the Unix domain socket to listen on (default: {get_default_socket_path()})')
+
+    args = parser.parse_args(argv)
+
+    try:
+        serve(Path(args.socket) if args.socket is not None else None)
+    except KeyboardInterrupt:
+        pass
+
+def render_with_server(args, stdin_data):
+    from .client import LocalRenderRequired, RemoteError, UntrustedSocketError, get_default_socket_path, render_remote
+    socket_path = get_default_socket_path()
+    if not socket_path.exists():
+        return None
+    request = { 'template': str(Path(args.file).absolute()), 'filename': args.file }
+    if args.data_file is not None:
+        request['data_files'] = [ str(Path(name).absolute()) for name in args.data_file ]
+    elif stdin_data is not None:
+        request['data'] = stdin_data
+    try:
+        return render_remote(request, socket_path)
+    except (ConnectionError, FileNotFoundError, LocalRenderRequired, UntrustedSocketError):
+        # Either the server is not running, even though it left its socket
+        # behind, the socket is not ours, or the server wants us to render the
+        # template ourselves, e.g. because it contains code blocks
+        return None
+    except RemoteError as e:
+        raise e.to_local_error() from None
 
 def main(argv=None):
 
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # A template that happens to have the name of a subcommand can still be
+    # rendered, as long as it exists in the current directory
+    command = argv[0] if argv and not os.path.isfile(argv[0]) else None
+
+    if command == 'watch':
+        return watch_main(argv[1:])
+
+    if command == 'batch':
+        return batch_main(argv[1:])
+
+    if command == 'serve':
+        return serve_main(argv[1:])
+
     parser = argparse.ArgumentParser()
     parser.add_argument('file', help='The template file from which code will be generated.')
     input_flags = parser.add_mutually_exclusive_group()
-    input_flags.add_argument('--data-file', help='A JSON file containing variables that will be passed to the template')
+    input_flags.add_argument('--data-file', action='append', help='A JSON file containing variables that will be passed to the template (may be given more than once, in which case later files override earlier ones)')
     input_flags.add_argument('--stdin', action='store_true', help='When present, reads JSON data from STDIN and passes it to the template')
+    parser.add_argument('--list-vars', action='store_true', help='Print the variables the template reads from its context as JSON instead of rendering it')
+    parser.add_argument('-o', '--output', help='Write the generated code to this file instead of to STDOUT')
+    parser.add_argument('--write-if-changed', action='store_true', help='Only write to the output file if the generated code is different from what is already there (requires -o, or --output-name with --jsonl)')
+    parser.add_argument('--jsonl', action='store_true', help='Read one JSON object per line from the data file or STDIN and render the template once for each of them')
+    parser.add_argument('--output-name', help='With --jsonl, a template that generates the name of the file to write each result to')
+    parser.add_argument('--data-cache', nargs='?', const='', metavar='DIR', help='Keep a binary snapshot of each data file in DIR (or in a default location) so that JSON does not have to be parsed again on the next run')
+    parser.add_argument('--no-server', action='store_true', help='Do not use a running `templaty serve` even if there is one')
+    parser.add_argument('--stats', action='store_true', help='Print how long each phase of rendering took, along with some counters, to STDERR')
+    parser.add_argument('--memory-report', action='store_true', help='Print how much memory each phase of rendering used and where it was allocated to STDERR')
+    parser.add_argument('--profile', action='store_true', help='Print where in the template the time was spent and which parts generated the most output to STDERR')
 
     args = parser.parse_args(argv)
 
-    if args.data_file is not None:
-        with open(args.data_file, 'r') as f:
-            data = json.loads(f.read())
-    elif args.stdin:
-        data = json.loads(sys.stdin.read())
-    else:
-        data = {}
+    if args.write_if_changed:
+        if args.jsonl and args.output_name is None:
+            parser.error('--write-if-changed with --jsonl requires --output-name')
+        if not args.jsonl and args.output is None:
+            parser.error('--write-if-changed requires -o/--output')
 
-    with open(args.file, 'r') as f:
-        contents = f.read()
+    if args.jsonl:
+        return jsonl_main(args)
+
+    if args.list_vars:
+        from .evaluator import compile_template
+        with open(args.file, 'r') as f:
+            template = compile_template(f.read(), filename=args.file)
+        free = template.free_variables()
+        print(json.dumps({
+            'names': sorted(free.names),
+            'paths': sorted('.'.join(path) for path in free.paths),
+            'dynamic': sorted(free.dynamic),
+        }, indent=2))
+        return
+
+    stats = None
+    if args.memory_report:
+        from .memory import MemoryReport
+        stats = MemoryReport()
+        stats.start()
+    elif args.stats:
+        from .stats import RenderStats
+        stats = RenderStats()
+
+    profile = None
+    if args.profile:
+        from .profiler import TemplateProfile
+        profile = TemplateProfile()
+
+    # Read only once, so that we can still render by ourselves when the
+    # server turns out to be unavailable
+    stdin_data = sys.stdin.read() if args.stdin else None
+
+    result = None
+    if not args.no_server and stats is None and profile is None:
+        result = render_with_server(args, stdin_data)
+
+    if result is None:
+
+        from .evaluator import evaluate
+
+        if stats is not None:
+            stats.enter_phase('load')
+        load_start = time.perf_counter()
+        if args.data_file is not None:
+            from .data import get_default_cache_dir, load_data_files
+            cache_dir = None
+            if args.data_cache is not None:
+                cache_dir = Path(args.data_cache) if args.data_cache else get_default_cache_dir()
+            data = load_data_files([ Path(name) for name in args.data_file ], cache_dir)
+        elif stdin_data is not None:
+            data = json.loads(stdin_data)
+        else:
+            data = {}
+        if stats is not None:
+            stats.add_time('load', time.perf_counter() - load_start)
+            stats.exit_phase('load')
+
+        with open(args.file, 'r') as f:
+            contents = f.read()
+
+        # sc = Scanner(args.file, contents)
+        # p = Parser(sc)
+        # root_node = p.parse_all()
+        # set_parent_nodes(root_node)
+
+        result = evaluate(contents, data, filename=args.file, stats=stats, profile=profile)
+
+    if args.output is None:
+        print(result)
+    elif args.write_if_changed:
+        from .fs import write_if_changed
+        write_if_changed(Path(args.output), result)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(result)
 
-    # sc = Scanner(args.file, contents)
-    # p = Parser(sc)
-    # root_node = p.parse_all()
-    # set_parent_nodes(root_node)
+    if stats is not None:
+        print(stats.format(), file=sys.stderr)
+        if args.memory_report:
+            stats.stop()
 
-    print(evaluate(contents, data, filename=args.file))
+    if profile is not None:
+        print(profile.format_report(), file=sys.stderr)
+        print(file=sys.stderr)
+        print(profile.annotate(), file=sys.stderr)
 
 
@@ -0,0 +1,128 @@
+
+from collections.abc import Callable
+import os
+import tracemalloc
+from typing import Any
+
+from .stats import PHASES, RenderStats
+
+PACKAGE_DIR = os.path.dirname(__file__)
+
+def get_location(traceback: tracemalloc.Traceback) -> str:
+    # Allocations are attributed to the innermost line of Templaty that led
+    # to them, since that is the line that can actually be changed.
+    for frame in reversed(traceback):
+        if frame.filename.startswith(PACKAGE_DIR):
+            return f'{frame.filename}:{frame.lineno}'
+    frame = traceback[-1]
+    return f'{frame.filename}:{frame.lineno}'
+
+def format_size(size: float) -> str:
+    for unit in [ 'B', 'KiB', 'MiB' ]:
+        if abs(size) < 1024:
+            return f'{size:.1f}{unit}' if unit != 'B' else f'{int(size)}B'
+        size /= 1024
+    return f'{size:.1f}GiB'
+
+class AllocationSite:
+
+    def __init__(self, location: str, size: int, count: int) -> None:
+        self.location = location
+        self.size = size
+        self.count = count
+
+class PhaseMemory:
+
+    def __init__(self) -> None:
+        self.peak = 0
+        self.retained = 0
+        self.sites = dict[str, AllocationSite]()
+
+    def get_top_sites(self, limit: int = 5) -> list[AllocationSite]:
+        return sorted(self.sites.values(), key=lambda site: site.size, reverse=True)[:limit]
+
+    def to_dict(self, limit: int = 5) -> dict[str, Any]:
+        return {
+            'peak': self.peak,
+            'retained': self.retained,
+            'top_sites': [ { 'location': site.location, 'size': site.size, 'count': site.count } for site in self.get_top_sites(limit) ],
+        }
+
+class MemoryReport(RenderStats):
+
+    # Takes a tracemalloc snapshot before and after every phase. Tracing
+    # makes rendering a few times slower, so this is only meant for finding
+    # out where memory goes.
+
+    def __init__(self, frames: int = 16, on_phase: Callable[[str, float], None] | None = None) -> None:
+        super().__init__(on_phase)
+        self.frames = frames
+        self.memory = dict[str, PhaseMemory]()
+        self._started = False
+        self._before: tuple[int, tracemalloc.Snapshot] | None = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started = True
+
+    def stop(self) -> None:
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, os.path.join(PACKAGE_DIR, 'stats.py')),
+        ])
+
+    def enter_phase(self, phase: str) -> None:
+        self.start()
+        snapshot = self._take_snapshot()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self._before = (current, snapshot)
+
+    def exit_phase(self, phase: str) -> None:
+        if self._before is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        start, before = self._before
+        self._before = None
+        after = self._take_snapshot()
+        memory = self.memory.setdefault(phase, PhaseMemory())
+        memory.peak = max(memory.peak, peak - start)
+        memory.retained += current - start
+        for diff in after.compare_to(before, 'traceback'):
+            if diff.size_diff <= 0:
+                continue
+            location = get_location(diff.traceback)
+            site = memory.sites.get(location)
+            if site is None:
+                site = memory.sites[location] = AllocationSite(location, 0, 0)
+            site.size += diff.size_diff
+            site.count += diff.count_diff
+
+    def to_dict(self) -> dict[str, Any]:
+        out = super().to_dict()
+        out['memory'] = dict((phase, memory.to_dict()) for phase, memory in self.memory.items())
+        return out
+
+    def format(self, limit: int = 5) -> str:
+        lines = [ super().format(), '' ]
+        lines.append(f'{"phase":<10} {"peak":>10} {"retained":>10}')
+        ordered = sorted(self.memory, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES))
+        for phase in ordered:
+            memory = self.memory[phase]
+            lines.append(f'{phase:<10} {format_size(memory.peak):>10} {format_size(memory.retained):>10}')
+        for phase in ordered:
+            sites = self.memory[phase].get_top_sites(limit)
+            if not sites:
+                continue
+            lines.append('')
+            lines.append(f'Top allocations during {phase}:')
+            for site in sites:
+                lines.append(f'{format_size(site.size):>10} {site.count:8} blocks  {site.location}')
+        return '\n'.join(lines)
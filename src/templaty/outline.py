@@ -16,9 +16,9 @@ def count_spaces(ch: str) -> int:
         return tab_size
     raise NotImplementedError()
 
-type NodeWithBody = Template | ForInStatement | JoinStatement | SetIndentStatement
+type NodeWithBody = Template | ForInStatement | JoinStatement | SetIndentStatement | CacheStatement
 
-type BlockNode = ForInStatement | JoinStatement | SetIndentStatement | CodeBlock
+type BlockNode = ForInStatement | JoinStatement | SetIndentStatement | CacheStatement | CodeBlock
 
 @cache
 def get_indent(node: Node, at_blank_line = True, curr_indent = 0) -> int | None:
@@ -51,7 +51,8 @@ def get_indent(node: Node, at_blank_line = True, curr_indent = 0) -> int | None:
         if isinstance(node, IfStatementCase) \
                 or isinstance(node, ForInStatement) \
                 or isinstance(node, JoinStatement) \
-                or isinstance(node, SetIndentStatement):
+                or isinstance(node, SetIndentStatement) \
+                or isinstance(node, CacheStatement):
             at_blank_line = False
             if curr_indent < min_indent:
                 min_indent = curr_indent
@@ -124,7 +125,8 @@ def dedent(node: Node, indent_level: int | None = None, outer_indent = 0, at_bla
         if isinstance(node, IfStatementCase) \
             or isinstance(node, ForInStatement) \
                 or isinstance(node, JoinStatement) \
-                or isinstance(node, SetIndentStatement):
+                or isinstance(node, SetIndentStatement) \
+                or isinstance(node, CacheStatement):
             at_blank_line = False
             visit(node.body, indent_level, is_last)
             return
@@ -205,7 +207,8 @@ def assign_indent_levels(template: Template) -> None:
             or isinstance(node, IfStatementCase) \
             or isinstance(node, ForInStatement) \
             or isinstance(node, JoinStatement) \
-            or isinstance(node, SetIndentStatement):
+            or isinstance(node, SetIndentStatement) \
+            or isinstance(node, CacheStatement):
             #inner_indent = get_indent(node.body, at_blank_line, curr_indent)
             visit(node.body)
             return
@@ -286,7 +289,8 @@ def has_body(node: Node) -> TypeGuard[NodeWithBody]:
         return isinstance(node, Template) \
             or isinstance(node, ForInStatement) \
             or isinstance(node, JoinStatement) \
-            or isinstance(node, SetIndentStatement)
+            or isinstance(node, SetIndentStatement) \
+            or isinstance(node, CacheStatement)
 
 def can_be_block(node: Node) -> TypeGuard[BlockNode]:
     return isinstance(node, CodeBlock) or has_body(node)
@@ -343,7 +347,8 @@ def outline(template: Template) -> None:
         if isinstance(node, Template) \
                 or isinstance(node, ForInStatement) \
                 or isinstance(node, JoinStatement) \
-                or isinstance(node, SetIndentStatement):
+                or isinstance(node, SetIndentStatement) \
+                or isinstance(node, CacheStatement):
             redent_blocks(node.body)
             return
         raise RuntimeError(f'unexpected {node}')
@@ -373,7 +378,8 @@ def outline(template: Template) -> None:
             return
         if isinstance(node, ForInStatement) \
             or isinstance(node, JoinStatement) \
-            or isinstance(node, SetIndentStatement):
+            or isinstance(node, SetIndentStatement) \
+            or isinstance(node, CacheStatement):
             if is_block(node) and node.prev_sibling is not None:
                 remove_left_while(node.prev_sibling, is_blank)
                 remove_left_while(node.body.last_child, is_blank)
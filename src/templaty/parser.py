@@ -74,10 +74,18 @@ class Parser:
     def __init__(self, scanner: Scanner) -> None:
         self.scanner = scanner
         self.file = scanner.file
-        self._token_stream = scanner.scan()
+        self._token_stream = self._scan_statement_keywords(scanner.scan())
         self._token_buffer = []
         self._statement_stack = []
 
+    def _scan_statement_keywords(self, tokens: Generator[Token, None, None]) -> Generator[Token, None, None]:
+        prev_type = None
+        for token in tokens:
+            if prev_type == OPEN_STATEMENT_BLOCK and token.type == IDENTIFIER and token.value in STATEMENT_KEYWORDS:
+                token = Token(STATEMENT_KEYWORDS[token.value], token.span, token.value)
+            prev_type = token.type
+            yield token
+
     def peek_token(self, count=1) -> Token:
         while len(self._token_buffer) < count:
             t0 = next(self._token_stream)
@@ -124,8 +132,9 @@ class Parser:
             self._raise_parse_error(t0, [IDENTIFIER])
         if isinstance(expr, MemberExpression):
             expr.members.append(t0.value)
+            expr.span = self._span_from(expr, t0)
         else:
-            expr = MemberExpression(expr, [t0.value])
+            expr = MemberExpression(expr, [t0.value], span=self._span_from(expr, t0))
         return expr
 
     def parse_func_args(self) -> Generator[Expression, None, None]:
@@ -148,8 +157,8 @@ class Parser:
     def parse_app_expression(self, expr: Expression) -> CallExpression:
         self._expect_token(OPEN_PAREN)
         args = list(self.parse_func_args())
-        self._expect_token(CLOSE_PAREN)
-        return CallExpression(expr, args)
+        t1 = self._expect_token(CLOSE_PAREN)
+        return CallExpression(expr, args, span=self._span_from(expr, t1))
 
     def parse_slice_expression(self, expr: Expression) -> Expression:
         self._expect_token(OPEN_BRACKET)
@@ -161,15 +170,15 @@ class Parser:
         t1 = self.get_token()
         if t1.type == CLOSE_BRACKET:
             assert(e1 is not None)
-            return IndexExpression(expr, e1)
+            return IndexExpression(expr, e1, span=self._span_from(expr, t1))
         elif t1.type == COLON:
             t2 = self.peek_token()
             if t2.type == CLOSE_BRACKET:
                 e2 = None
             else:
                 e2 = self.parse_expression()
-            self._expect_token(CLOSE_BRACKET)
-            return SliceExpression(expr, e1, e2)
+            t3 = self._expect_token(CLOSE_BRACKET)
+            return SliceExpression(expr, e1, e2, span=self._span_from(expr, t3))
         else:
             self._raise_parse_error(t1, [COLON, CLOSE_BRACKET])
 
@@ -199,7 +208,8 @@ class Parser:
                 break
         e = self.parse_chained_expression()
         while len(heap) > 0:
-            e = CallExpression(VarRefExpression(heapq.heappop(heap)[1].value), [e])
+            t1 = heapq.heappop(heap)[1]
+            e = CallExpression(VarRefExpression(t1.value, span=t1.span), [e], span=self._span_from(t1, e))
         return e
 
     def parse_prim_expression(self) -> Expression:
@@ -237,7 +247,7 @@ class Parser:
                     break
                 rhs = self.parse_binary_operators(rhs, t0_prec)
                 t0 = self.peek_token()
-            lhs = CallExpression(VarRefExpression(keep.value), [lhs, rhs])
+            lhs = CallExpression(VarRefExpression(keep.value, span=keep.span), [lhs, rhs], span=self._span_from(lhs, rhs))
         return lhs
 
     def parse_expression(self):
@@ -267,12 +277,26 @@ class Parser:
     def _get_text(self, token) -> str:
         return token.get_text(self.scanner._data)
 
+    def _span_from(self, first: Node | Token, last: Node | Token) -> TextSpan | None:
+        if first.span is None or last.span is None:
+            return None
+        return TextSpan(self.file, clone(first.span.start_pos), clone(last.span.end_pos))
+
     def _expect_token(self, tt) -> Token:
         t0 = self.get_token()
         if t0.type != tt:
             self._raise_parse_error(t0, [tt])
         return t0
 
+    def parse_parallel_modifier(self) -> bool:
+        # Not a keyword, so that existing templates can still use it as the
+        # name of a variable.
+        t0 = self.peek_token()
+        if t0.type == IDENTIFIER and t0.value == 'parallel':
+            self.get_token()
+            return True
+        return False
+
     def parse_statement(self) -> Statement:
         t0 = self._expect_token(OPEN_STATEMENT_BLOCK)
         t1 = self.get_token()
@@ -310,12 +334,13 @@ class Parser:
             patt = self.parse_pattern()
             self._expect_token(IN_KEYWORD)
             e = self.parse_expression()
+            parallel = self.parse_parallel_modifier()
             self._expect_token(CLOSE_STATEMENT_BLOCK)
             body = Body(list(self.parse_statement_block()))
             self._expect_token(OPEN_STATEMENT_BLOCK)
             self._expect_token(ENDFOR_KEYWORD)
             t7 = self._expect_token(CLOSE_STATEMENT_BLOCK)
-            return ForInStatement(patt, e, body, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t7.span.end_pos)))
+            return ForInStatement(patt, e, body, parallel=parallel, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t7.span.end_pos)))
         elif t1.type == JOIN_KEYWORD:
             self._statement_stack.append([ENDJOIN_KEYWORD])
             patt = self.parse_pattern()
@@ -323,12 +348,13 @@ class Parser:
             e = self.parse_expression()
             self._expect_token(WITH_KEYWORD)
             sep = self.parse_expression()
+            parallel = self.parse_parallel_modifier()
             self._expect_token(CLOSE_STATEMENT_BLOCK)
             body = Body(list(self.parse_statement_block()))
             self._expect_token(OPEN_STATEMENT_BLOCK)
             self._expect_token(ENDJOIN_KEYWORD)
             t6 = self._expect_token(CLOSE_STATEMENT_BLOCK)
-            return JoinStatement(patt, e, sep, body, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t6.span.end_pos)))
+            return JoinStatement(patt, e, sep, body, parallel=parallel, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t6.span.end_pos)))
         elif t1.type == SETINDENT_KEYWORD:
             self._statement_stack.append([ENDSETINDENT_KEYWORD])
             e = self.parse_expression()
@@ -346,8 +372,17 @@ class Parser:
             self._expect_token(ENDNOINDENT_KEYWORD)
             t5 = self._expect_token(CLOSE_STATEMENT_BLOCK)
             return SetIndentStatement(ConstExpression(0), body, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t5.span.end_pos)))
+        elif t1.type == CACHE_KEYWORD:
+            self._statement_stack.append([ENDCACHE_KEYWORD])
+            e = self.parse_expression()
+            self._expect_token(CLOSE_STATEMENT_BLOCK)
+            body = Body(list(self.parse_statement_block()))
+            self._expect_token(OPEN_STATEMENT_BLOCK)
+            self._expect_token(ENDCACHE_KEYWORD)
+            t5 = self._expect_token(CLOSE_STATEMENT_BLOCK)
+            return CacheStatement(e, body, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t5.span.end_pos)))
         else:
-            expected = [FOR_KEYWORD, JOIN_KEYWORD, IF_KEYWORD, NOINDENT_KEYWORD, SETINDENT_KEYWORD]
+            expected = [FOR_KEYWORD, JOIN_KEYWORD, IF_KEYWORD, NOINDENT_KEYWORD, SETINDENT_KEYWORD, CACHE_KEYWORD]
             if len(self._statement_stack) > 0:
                 expected.extend(self._statement_stack[-1])
             self._raise_parse_error(t1, expected)
@@ -363,13 +398,13 @@ class Parser:
                 yield self.parse()
 
     def parse_code_block(self) -> CodeBlock:
-        self._expect_token(OPEN_CODE_BLOCK)
-        t0 = self.get_token()
-        if t0.type != CODE_BLOCK_CONTENT:
-            self._raise_parse_error(t0, [CODE_BLOCK_CONTENT])
-        module = ast.parse(textwrap.dedent(t0.value))
-        self._expect_token(CLOSE_CODE_BLOCK)
-        return CodeBlock(module)
+        t0 = self._expect_token(OPEN_CODE_BLOCK)
+        t1 = self.get_token()
+        if t1.type != CODE_BLOCK_CONTENT:
+            self._raise_parse_error(t1, [CODE_BLOCK_CONTENT])
+        module = ast.parse(textwrap.dedent(t1.value))
+        t2 = self._expect_token(CLOSE_CODE_BLOCK)
+        return CodeBlock(module, span=TextSpan(self.file, clone(t0.span.start_pos), clone(t2.span.end_pos)))
 
     def parse(self) -> Statement:
         t0 = self.peek_token()
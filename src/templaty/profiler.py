@@ -0,0 +1,174 @@
+
+from collections.abc import Callable
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .ast import Expression, Node, TextSpan
+    from .evaluator import Env, Output
+
+class SpanProfile:
+
+    def __init__(self, node: 'Node', span: 'TextSpan') -> None:
+        self.kind = type(node).__name__
+        self.span = span
+        self.calls = 0
+        self.total_time = 0.0
+        self.self_time = 0.0
+        self.bytes = 0
+        self.self_bytes = 0
+
+    @property
+    def filename(self) -> str:
+        return self.span.file.name
+
+    @property
+    def line(self) -> int:
+        return self.span.start_pos.line
+
+    @property
+    def column(self) -> int:
+        return self.span.start_pos.column
+
+    @property
+    def source(self) -> str:
+        return self.span.file.text[self.span.start_pos.offset:self.span.end_pos.offset]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'file': self.filename,
+            'line': self.line,
+            'column': self.column,
+            'calls': self.calls,
+            'total_time': self.total_time,
+            'self_time': self.self_time,
+            'bytes': self.bytes,
+            'self_bytes': self.self_bytes,
+        }
+
+class TemplateProfile:
+
+    # Passing an instance to evaluate() records, for every statement and
+    # expression in the template, how often it ran, how long that took and
+    # how much output it produced. Results add up over several renders.
+
+    def __init__(self) -> None:
+        self.entries = dict[tuple[str, int, int, str], SpanProfile]()
+        # Time and bytes of the children of every node that is being profiled
+        self._stack = list[list[float]]()
+        self._sizes = dict[int, tuple['Output', int]]()
+
+    def _get_entry(self, node: 'Node', span: 'TextSpan') -> SpanProfile:
+        key = (span.file.name, span.start_pos.offset, span.end_pos.offset, type(node).__name__)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = SpanProfile(node, span)
+        return entry
+
+    def _get_size(self, output: 'Output') -> int:
+        from .evaluator import TextOutput
+        cached = self._sizes.get(id(output))
+        if cached is not None:
+            return cached[1]
+        if isinstance(output, TextOutput):
+            size = len(output.text.encode('utf-8'))
+        else:
+            size = sum(self._get_size(child) for child in output.children)
+        self._sizes[id(output)] = (output, size)
+        return size
+
+    def _record(self, node: 'Node', span: 'TextSpan', elapsed: float, size: int) -> None:
+        child_time, child_bytes = self._stack.pop()
+        if self._stack:
+            self._stack[-1][0] += elapsed
+            self._stack[-1][1] += size
+        entry = self._get_entry(node, span)
+        entry.calls += 1
+        entry.total_time += elapsed
+        entry.self_time += elapsed - child_time
+        entry.bytes += size
+        entry.self_bytes += size - int(child_bytes)
+
+    def wrap_stmt(self, eval_stmt: Callable[['Node', 'Env'], 'Output']) -> Callable[['Node', 'Env'], 'Output']:
+        def profiled(stmt: 'Node', env: 'Env') -> 'Output':
+            span = stmt.span
+            if span is None:
+                return eval_stmt(stmt, env)
+            self._stack.append([ 0.0, 0 ])
+            start = time.perf_counter()
+            try:
+                result = eval_stmt(stmt, env)
+            except BaseException:
+                self._record(stmt, span, time.perf_counter() - start, 0)
+                raise
+            elapsed = time.perf_counter() - start
+            self._record(stmt, span, elapsed, self._get_size(result))
+            return result
+        return profiled
+
+    def wrap_expr(self, eval_expr: Callable[['Expression', 'Env'], Any]) -> Callable[['Expression', 'Env'], Any]:
+        def profiled(expr: 'Expression', env: 'Env') -> Any:
+            span = expr.span
+            if span is None:
+                return eval_expr(expr, env)
+            self._stack.append([ 0.0, 0 ])
+            start = time.perf_counter()
+            try:
+                return eval_expr(expr, env)
+            finally:
+                self._record(expr, span, time.perf_counter() - start, 0)
+        return profiled
+
+    def finish(self) -> None:
+        self._sizes.clear()
+
+    def get_entries(self) -> list[SpanProfile]:
+        return sorted(self.entries.values(), key=lambda entry: entry.self_time, reverse=True)
+
+    @property
+    def total_time(self) -> float:
+        return sum(entry.self_time for entry in self.entries.values())
+
+    def format_report(self, limit: int | None = 20) -> str:
+        total = self.total_time
+        lines = [ f'{"self":>10} {"%":>6} {"total":>10} {"calls":>8} {"bytes":>10}  location' ]
+        for entry in self.get_entries()[:limit]:
+            percent = entry.self_time / total * 100 if total else 0.0
+            source = entry.source.split('\n', 1)[0]
+            if len(source) > 40:
+                source = source[:37] + '...'
+            lines.append(f'{entry.self_time * 1000:8.2f}ms {percent:5.1f}% {entry.total_time * 1000:8.2f}ms {entry.calls:8} {entry.bytes:10}  {entry.filename}:{entry.line}:{entry.column} {entry.kind} {source!r}')
+        return '\n'.join(lines)
+
+    def annotate(self, filename: str | None = None, hot_only: bool = True) -> str:
+        per_file = dict[str, dict[int, list[float]]]()
+        texts = dict[str, str]()
+        for entry in self.entries.values():
+            if filename is not None and entry.filename != filename:
+                continue
+            texts[entry.filename] = entry.span.file.text
+            per_line = per_file.setdefault(entry.filename, {})
+            line = per_line.setdefault(entry.line, [ 0.0, 0 ])
+            line[0] += entry.self_time
+            line[1] += entry.self_bytes
+        total = self.total_time
+        out = []
+        for name, per_line in per_file.items():
+            out.append(f'{name}:')
+            prev = 0
+            for lineno, text in enumerate(texts[name].split('\n'), 1):
+                stats = per_line.get(lineno)
+                if stats is None:
+                    if not hot_only:
+                        out.append(f'{"":>29} | {lineno:5} | {text}')
+                    continue
+                if hot_only and prev and lineno > prev + 1:
+                    out.append(f'{"":>29} | {"...":>5} |')
+                prev = lineno
+                percent = stats[0] / total * 100 if total else 0.0
+                out.append(f'{stats[0] * 1000:8.2f}ms {percent:5.1f}% {int(stats[1]):10}B | {lineno:5} | {text}')
+        return '\n'.join(out)
+
+    def to_dict(self) -> dict[str, Any]:
+        return { 'entries': [ entry.to_dict() for entry in self.get_entries() ] }
@@ -91,6 +91,8 @@ OR_OPERATOR                       = TokenType(61)
 NOT_OPERATOR                      = TokenType(62)
 AT                                = TokenType(63)
 COMMENT                           = TokenType(64)
+CACHE_KEYWORD                     = TokenType(65)
+ENDCACHE_KEYWORD                  = TokenType(66)
 
 OPERATORS = {
     '+': ADD_OPERATOR,
@@ -144,6 +146,13 @@ KEYWORDS = {
     'enddedent': ENDDEDENT_KEYWORD
     }
 
+# Only keywords directly after {%, so that existing templates can still use
+# them as the names of variables. The parser takes care of these.
+STATEMENT_KEYWORDS = {
+    'cache': CACHE_KEYWORD,
+    'endcache': ENDCACHE_KEYWORD,
+    }
+
 NAMED_OPERATORS = {
     'not': NOT_OPERATOR,
     'and': AND_OPERATOR,
@@ -259,6 +268,10 @@ def token_type_to_string(tt):
         return "'not'"
     elif tt == AT:
         return "'@'"
+    elif tt == CACHE_KEYWORD:
+        return "'cache'"
+    elif tt == ENDCACHE_KEYWORD:
+        return "'endcache'"
 
 class Token(Record):
 
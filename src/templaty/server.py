@@ -0,0 +1,138 @@
+
+import json
+import os
+from pathlib import Path
+import socketserver
+import threading
+from typing import Any
+
+from .async_evaluator import has_code_block
+from .cache import MemoryCache, get_template_digest
+from .client import LocalRenderRequired, RemoteError, get_default_socket_path, is_server_running
+from .evaluator import CompiledTemplate
+
+def get_stamp(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+class RenderService:
+
+    def __init__(self, max_sources: int = 256) -> None:
+        self._lock = threading.Lock()
+        self._templates = dict[tuple[Path, str], tuple[tuple[int, int], CompiledTemplate]]()
+        self._sources = MemoryCache(max_sources)
+        self._data = dict[Path, tuple[tuple[int, int], dict[str, Any]]]()
+
+    def get_template(self, path: Path, filename: str) -> CompiledTemplate:
+        stamp = get_stamp(path)
+        with self._lock:
+            cached = self._templates.get((path, filename))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, 'r') as f:
+            template = CompiledTemplate(f.read(), filename)
+        with self._lock:
+            self._templates[path, filename] = (stamp, template)
+        return template
+
+    def get_source_template(self, source: str, filename: str) -> CompiledTemplate:
+        key = f'{get_template_digest(source)}-{filename}'
+        with self._lock:
+            template = self._sources.get(key)
+        if template is None:
+            template = CompiledTemplate(source, filename)
+            with self._lock:
+                self._sources.set(key, template)
+        return template
+
+    def get_data(self, path: Path) -> dict[str, Any]:
+        stamp = get_stamp(path)
+        with self._lock:
+            cached = self._data.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, 'r') as f:
+            data = json.load(f)
+        with self._lock:
+            self._data[path] = (stamp, data)
+        return data
+
+    def render(self, request: dict[str, Any]) -> str:
+        filename = request.get('filename', '#<anonymous>')
+        if 'template' in request:
+            template = self.get_template(Path(request['template']), filename)
+        elif 'source' in request:
+            template = self.get_source_template(request['source'], filename)
+        else:
+            raise RemoteError('request must contain either a template or a source')
+        if has_code_block(template.template.body):
+            # Code blocks would see the working directory and the environment
+            # of the server instead of those of the client.
+            raise LocalRenderRequired('templates with code blocks must be rendered by the client')
+        if 'data_files' in request:
+            # The template might change the context, which we don't want to
+            # leak into the next request.
+            ctx = {}
+            for name in request['data_files']:
+                ctx.update(self.get_data(Path(name)))
+        elif 'data' in request:
+            ctx = json.loads(request['data'])
+        else:
+            ctx = request.get('context', {})
+        return template.evaluate(ctx)
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        try:
+            return { 'ok': True, 'output': self.render(request) }
+        except LocalRenderRequired as e:
+            return { 'ok': False, 'local': True, 'error': str(e) }
+        except Exception as e:
+            return { 'ok': False, 'error': str(e), 'type': f'{type(e).__module__}.{type(e).__qualname__}' }
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    server: 'RenderServer'
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                response = { 'ok': False, 'error': f'invalid request: {e}' }
+            else:
+                response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+class RenderServer(socketserver.ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, service: RenderService | None = None) -> None:
+        if service is None:
+            service = RenderService()
+        self.service = service
+        self.socket_path = socket_path
+        if os.path.lexists(socket_path):
+            if is_server_running(socket_path):
+                raise RuntimeError(f'a server is already listening on {socket_path}')
+            socket_path.unlink()
+        # Only the current user may connect to the socket
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(str(socket_path), _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+def serve(socket_path: Path | None = None) -> None:
+    if socket_path is None:
+        socket_path = get_default_socket_path()
+    with RenderServer(socket_path) as server:
+        server.serve_forever()
@@ -0,0 +1,125 @@
+
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+import time
+from typing import TYPE_CHECKING, Any
+
+from sweetener import BaseNode
+
+if TYPE_CHECKING:
+    from .evaluator import Output
+    from .scanner import Scanner, Token
+
+PHASES = [ 'load', 'scan', 'parse', 'outline', 'evaluate', 'render' ]
+
+def count_nodes(value: Any) -> int:
+    if isinstance(value, BaseNode):
+        return 1 + sum(count_nodes(child) for _, child in value.fields.items())
+    if isinstance(value, list | tuple):
+        return sum(count_nodes(element) for element in value)
+    return 0
+
+def count_output_nodes(output: 'Output') -> int:
+    from .evaluator import BlockOutput
+    count = 0
+    stack = [ output ]
+    while stack:
+        output = stack.pop()
+        count += 1
+        if isinstance(output, BlockOutput):
+            stack.extend(output.children)
+    return count
+
+class RenderStats:
+
+    # Passing an instance to evaluate() makes it record where the time went.
+    # Counters add up when the same instance is used for more than one render.
+
+    def __init__(self, on_phase: Callable[[str, float], None] | None = None) -> None:
+        self.on_phase = on_phase
+        self.phases = dict[str, float]()
+        self.renders = 0
+        self.tokens = 0
+        self.nodes = 0
+        self.output_nodes = 0
+        self.output_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        if self.on_phase is not None:
+            self.on_phase(phase, seconds)
+
+    def enter_phase(self, phase: str) -> None:
+        pass
+
+    def exit_phase(self, phase: str) -> None:
+        pass
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        self.enter_phase(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+            self.exit_phase(phase)
+
+    def get_time(self, phase: str) -> float:
+        return self.phases.get(phase, 0.0)
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.phases.values())
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'phases': dict(self.phases),
+            'total_time': self.total_time,
+            'renders': self.renders,
+            'tokens': self.tokens,
+            'nodes': self.nodes,
+            'output_nodes': self.output_nodes,
+            'output_bytes': self.output_bytes,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def format(self) -> str:
+        lines = []
+        total = self.total_time
+        for phase in sorted(self.phases, key=lambda name: PHASES.index(name) if name in PHASES else len(PHASES)):
+            seconds = self.phases[phase]
+            percent = seconds / total * 100 if total else 0.0
+            lines.append(f'{phase:<10} {seconds * 1000:10.2f}ms {percent:5.1f}%')
+        lines.append(f'{"total":<10} {total * 1000:10.2f}ms')
+        lines.append(f'tokens: {self.tokens}, AST nodes: {self.nodes}, output nodes: {self.output_nodes}, output bytes: {self.output_bytes}')
+        lines.append(f'cache hits: {self.cache_hits}, cache misses: {self.cache_misses}')
+        return '\n'.join(lines)
+
+class TimedScanner:
+
+    # The parser pulls tokens from the scanner as it goes, so the time spent
+    # scanning can only be told apart by timing every token separately.
+
+    def __init__(self, scanner: 'Scanner', stats: RenderStats) -> None:
+        self.file = scanner.file
+        self.elapsed = 0.0
+        self._scanner = scanner
+        self._stats = stats
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._scanner, name)
+
+    def scan(self) -> Iterator['Token']:
+        from .scanner import END_OF_FILE
+        tokens = self._scanner.scan()
+        while True:
+            start = time.perf_counter()
+            token = next(tokens)
+            self.elapsed += time.perf_counter() - start
+            if token.type != END_OF_FILE:
+                self._stats.tokens += 1
+            yield token
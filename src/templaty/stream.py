@@ -0,0 +1,43 @@
+
+from collections.abc import Iterable, Iterator
+import json
+from pathlib import Path
+from typing import Any, TextIO
+
+from .evaluator import CompiledTemplate
+from .fs import write_if_changed as write_file_if_changed
+
+class RecordError(RuntimeError):
+    pass
+
+def iter_records(f: TextIO, filename: str = '<stdin>') -> Iterator[dict[str, Any]]:
+    # Lines are read one at a time, so that memory use does not depend on
+    # the size of the input.
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise RecordError(f'{filename}:{lineno}: {e}') from None
+        if not isinstance(record, dict):
+            raise RecordError(f'{filename}:{lineno}: expected a JSON object')
+        yield record
+
+def render_records(template: CompiledTemplate, records: Iterable[dict[str, Any]], out: TextIO | None = None, name_template: CompiledTemplate | None = None, write_if_changed: bool = False) -> int:
+    count = 0
+    for record in records:
+        result = template.evaluate(record)
+        if name_template is None:
+            assert(out is not None)
+            out.write(result)
+        else:
+            path = Path(name_template.evaluate(record).strip())
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if write_if_changed:
+                write_file_if_changed(path, result)
+            else:
+                with open(path, 'w') as f:
+                    f.write(result)
+        count += 1
+    return count
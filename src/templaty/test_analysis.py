@@ -0,0 +1,41 @@
+
+import templaty
+
+def get_free(text: str) -> templaty.FreeVariables:
+    return templaty.compile_template(text).free_variables()
+
+def test_free_var_ref():
+    free = get_free("{{foo}} and {{bar}}")
+    assert(free.names == { 'foo', 'bar' })
+    assert(free.paths == { ('foo',), ('bar',) })
+    assert(len(free.dynamic) == 0)
+
+def test_free_member_paths():
+    free = get_free("{{foo.bar.baz}}{{foo.qux}}")
+    assert(free.names == { 'foo' })
+    assert(free.paths == { ('foo', 'bar', 'baz'), ('foo', 'qux') })
+
+def test_builtins_not_free():
+    free = get_free("{{'foo-bar' |> snake |> upper}}{% for i in range(0, n) %}{{i + 1}}{% endfor %}")
+    assert(free.names == { 'n' })
+    assert({ 'snake', 'upper', 'range', '+', '|>' } <= free.builtins)
+
+def test_loop_patterns_are_bound():
+    free = get_free("{% for a, b in zip(xs, ys) %}{{a.name}}{{b}}{{index}}{{y}}{% endfor %}")
+    assert(free.names == { 'xs', 'ys', 'y' })
+
+def test_loop_variable_does_not_escape():
+    free = get_free("{% for x in xs %}{{x}}{% endfor %}{{x}}")
+    assert(free.names == { 'xs', 'x' })
+
+def test_code_block_names_are_dynamic():
+    free = get_free("{! bar = foo + len(items) !}{{bar}}{{baz}}")
+    assert(free.dynamic == { 'foo', 'items' })
+    assert(free.names == { 'baz' })
+    assert('len' in free.builtins)
+
+def test_nondeterministic_builtin():
+    free = get_free("Generated on {{now}}")
+    assert(len(free.names) == 0)
+    assert('now' in free.builtins)
+
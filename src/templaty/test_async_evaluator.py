@@ -0,0 +1,73 @@
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+import templaty
+
+SNIPPETS_DIR = Path(__file__).parent.parent.parent / 'test-snippets'
+
+def test_same_output_as_evaluate():
+    paths = sorted(SNIPPETS_DIR.glob('*.tply'))
+    assert(paths)
+    for path in paths:
+        template = templaty.CompiledTemplate(path.read_text(), str(path))
+        expected = templaty.evaluate(template)
+        assert(asyncio.run(templaty.render_async(template)) == expected)
+
+def test_awaitable_values():
+    async def get_name():
+        return 'world'
+    async def double(x):
+        return x * 2
+    template = "Hello, {{name}}! {{double(21)}} {{name}}"
+    assert(asyncio.run(templaty.render_async(template, { 'name': get_name(), 'double': double })) == 'Hello, world! 42 world')
+
+def test_async_iterable():
+    async def items():
+        for i in range(3):
+            await asyncio.sleep(0)
+            yield i
+    assert(asyncio.run(templaty.render_async("{% for i in items %}{{i}};{% endfor %}", { 'items': items() })) == '0;1;2;')
+
+def test_loop_iterations_run_concurrently():
+    active = 0
+    max_active = 0
+    async def fetch(name):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return f'{name}:\n  {name.upper()}'
+    template = "{% for name in names %}  - {{fetch(name)}}\n{% endfor %}"
+    ctx = { 'names': [ 'a', 'b', 'c' ] }
+    expected = templaty.evaluate(template, { **ctx, 'fetch': lambda name: f'{name}:\n  {name.upper()}' })
+    assert(asyncio.run(templaty.render_async(template, { **ctx, 'fetch': fetch })) == expected)
+    assert(max_active == 3)
+
+def test_code_block_loops_run_in_order():
+    template = "{% for i in range(0, 3) %}{! seen.append(i) !}{{wait(i)}}{% endfor %}"
+    seen = []
+    async def wait(i):
+        await asyncio.sleep(0.01 * (3 - i))
+        return i
+    assert(asyncio.run(templaty.render_async(template, { 'seen': seen, 'wait': wait })) == '012')
+    assert(seen == [ 0, 1, 2 ])
+
+def test_stats():
+    stats = templaty.RenderStats()
+    template = "{% for i in range(0, 3) %}{% cache 1 %}{{i}}{% endcache %}{% endfor %}"
+    assert(asyncio.run(templaty.render_async(template, stats=stats)) == '000')
+    assert(stats.renders == 1)
+    assert(stats.cache_hits == 2 and stats.cache_misses == 1)
+    assert(stats.get_time('evaluate') > 0)
+
+def test_unsupported_arguments():
+    with pytest.raises(TypeError, match='max_workers'):
+        asyncio.run(templaty.render_async('{{1}}', max_workers=2))
+    with pytest.raises(TypeError, match='profile'):
+        asyncio.run(templaty.render_async('{{1}}', profile=templaty.TemplateProfile()))
+    with pytest.warns(RuntimeWarning, match='parallel'):
+        assert(asyncio.run(templaty.render_async('{% for i in range(0, 3) parallel %}{{i}}{% endfor %}')) == '012')
@@ -0,0 +1,62 @@
+
+import json
+from pathlib import Path
+
+import pytest
+
+from templaty.batch import BatchJob, ManifestError, load_manifest, parse_job_spec, run_batch
+from templaty.main import main
+
+def write_inputs(root: Path) -> None:
+    (root / 'greet.tply').write_text('Hello, {{name}}!')
+    (root / 'bob.json').write_text(json.dumps({ 'name': 'Bob' }))
+    (root / 'alice.json').write_text(json.dumps({ 'name': 'Alice' }))
+
+def test_parse_job_spec() -> None:
+    job = parse_job_spec('a.tply::out/a.txt')
+    assert(job.template_path == Path('a.tply'))
+    assert(job.data_path is None)
+    assert(job.output_path == Path('out/a.txt'))
+    with pytest.raises(ManifestError):
+        parse_job_spec('a.tply:out/a.txt')
+
+def test_load_manifest(tmp_path: Path) -> None:
+    (tmp_path / 'jobs.toml').write_text('[[jobs]]\ntemplate = "greet.tply"\ndata = "bob.json"\noutput = "out/bob.txt"\n\n[[jobs]]\ntemplate = "greet.tply"\noutput = "out/carol.txt"\ncontext = { name = "Carol" }\n')
+    (tmp_path / 'jobs.json').write_text(json.dumps([ { 'template': 'greet.tply', 'data': 'bob.json', 'output': 'out/bob.txt' } ]))
+    jobs = load_manifest(tmp_path / 'jobs.toml')
+    assert(len(jobs) == 2)
+    assert(jobs[0].data_path == tmp_path / 'bob.json')
+    assert(jobs[1].context == { 'name': 'Carol' })
+    assert(load_manifest(tmp_path / 'jobs.json')[0].output_path == tmp_path / 'out' / 'bob.txt')
+
+@pytest.mark.parametrize('max_workers', [ 1, 2 ])
+def test_run_batch(tmp_path: Path, max_workers: int) -> None:
+    write_inputs(tmp_path)
+    jobs = [
+        BatchJob(tmp_path / 'greet.tply', tmp_path / 'out' / 'bob.txt', tmp_path / 'bob.json'),
+        BatchJob(tmp_path / 'missing.tply', tmp_path / 'out' / 'missing.txt'),
+        BatchJob(tmp_path / 'greet.tply', tmp_path / 'out' / 'alice.txt', tmp_path / 'alice.json'),
+    ]
+    results = run_batch(jobs, max_workers)
+    assert([ result.job.output_path.name for result in results ] == [ 'bob.txt', 'missing.txt', 'alice.txt' ])
+    assert(results[1].error is not None and 'missing.tply' in results[1].error)
+    assert((tmp_path / 'out' / 'bob.txt').read_text() == 'Hello, Bob!')
+    assert((tmp_path / 'out' / 'alice.txt').read_text() == 'Hello, Alice!')
+
+def test_batch_cli(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_inputs(tmp_path)
+    assert(main([ 'batch', 'greet.tply:bob.json:bob.txt', 'greet.tply:alice.json:alice.txt' ]) == 0)
+    assert((tmp_path / 'alice.txt').read_text() == 'Hello, Alice!')
+    assert(main([ 'batch', '--write-if-changed', 'greet.tply:bob.json:bob.txt', 'greet.tply::broken.txt' ]) == 1)
+    err = capsys.readouterr().err
+    assert('bob.txt (unchanged' in err)
+    assert('FAIL broken.txt' in err)
+    assert('1 succeeded, 1 failed' in err)
+
+def test_template_named_like_command(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_inputs(tmp_path)
+    (tmp_path / 'batch').write_text('Hello, {{name}}!')
+    main([ 'batch', '--data-file', 'bob.json', '--no-server' ])
+    assert(capsys.readouterr().out == 'Hello, Bob!\n')
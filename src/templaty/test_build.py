@@ -0,0 +1,213 @@
+
+from pathlib import Path
+
+import pytest
+
+import templaty
+
+def write_tree(root: Path, files: dict[str, str]) -> None:
+    for name, contents in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(contents)
+
+def read_tree(root: Path) -> dict[str, str]:
+    return dict((str(path.relative_to(root)), path.read_text()) for path in sorted(root.rglob('*')) if path.is_file())
+
+SAMPLE_TREE = {
+    'src/_helpers.py': 'def greet(name):\n    return f"Hello, {name}!"\n',
+    'src/hello.txt.tply': '{{greet(name)}}\n',
+    'src/static.txt': 'Just a file\n',
+    'src/sub/_helpers/extra.py': 'def shout(text):\n    return greet(text).upper()\n',
+    'src/sub/shout.txt.tply': '{{shout(name)}}\n',
+    'src/sub/a.txt.tply': '{% for i in range(0, 3) %}{{i}}{% endfor %}\n',
+}
+
+EXPECTED_TREE = {
+    'hello.txt': 'Hello, Bob!\n',
+    'static.txt': 'Just a file\n',
+    'sub/a.txt': '012\n',
+    'sub/shout.txt': 'HELLO, BOB!\n',
+}
+
+@pytest.mark.parametrize('jobs', [ 1, 2 ])
+def test_execute_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, jobs: int) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', { 'name': 'Bob' }, jobs=jobs)
+    assert(read_tree(tmp_path / 'out') == EXPECTED_TREE)
+
+def test_execute_dir_skips_existing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    write_tree(tmp_path, { 'out/hello.txt': 'Old\n', 'out/sub/a.txt': 'Old\n' })
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', { 'name': 'Bob' }, jobs=2)
+    assert(read_tree(tmp_path / 'out')['hello.txt'] == 'Old\n')
+    lines = capsys.readouterr().err.splitlines()
+    assert(lines == [
+        f'Warning: Skipping {tmp_path / "out" / "hello.txt"} because it already exists',
+        f'Warning: Skipping {tmp_path / "out" / "sub" / "a.txt"} because it already exists',
+    ])
+
+def test_execute_dir_parallel_error(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    write_tree(tmp_path, { 'src/b.txt.tply': '{{undefined_a}}', 'src/c.txt.tply': '{{undefined_b}}' })
+    with pytest.raises(RuntimeError, match='undefined_a'):
+        templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', { 'name': 'Bob' }, jobs=2)
+
+def test_execute_dir_incremental(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    src_dir = tmp_path / 'src'
+    out_dir = tmp_path / 'out'
+    templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, incremental=True)
+    assert(read_tree(out_dir) == EXPECTED_TREE | { '.templaty-manifest.json': (out_dir / '.templaty-manifest.json').read_text() })
+    stamps = dict((path.name, path.stat().st_mtime_ns) for path in out_dir.rglob('*.txt'))
+    (src_dir / 'sub' / 'a.txt.tply').write_text('{% for i in range(0, 5) %}{{i}}{% endfor %}\n')
+    (src_dir / 'hello.txt.tply').unlink()
+    templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, incremental=True)
+    assert((out_dir / 'sub' / 'a.txt').read_text() == '01234\n')
+    assert(not (out_dir / 'hello.txt').exists())
+    assert((out_dir / 'sub' / 'shout.txt').stat().st_mtime_ns == stamps['shout.txt'])
+    assert((out_dir / 'static.txt').stat().st_mtime_ns == stamps['static.txt'])
+    templaty.execute_dir(src_dir, out_dir, { 'name': 'Alice' }, incremental=True)
+    assert((out_dir / 'sub' / 'shout.txt').read_text() == 'HELLO, ALICE!\n')
+    (src_dir / 'sub' / '_helpers' / 'extra.py').write_text('def shout(text):\n    return text.upper()\n')
+    templaty.execute_dir(src_dir, out_dir, { 'name': 'Alice' }, incremental=True)
+    assert((out_dir / 'sub' / 'shout.txt').read_text() == 'ALICE\n')
+
+def test_execute_dir_incremental_failed_run(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    src_dir = tmp_path / 'src'
+    out_dir = tmp_path / 'out'
+    templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, incremental=True)
+    (src_dir / 'hello.txt.tply').unlink()
+    (src_dir / 'sub' / 'a.txt.tply').write_text('{{undefined}}')
+    with pytest.raises(RuntimeError, match='undefined'):
+        templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, incremental=True)
+    assert((out_dir / 'hello.txt').read_text() == 'Hello, Bob!\n')
+    (src_dir / 'sub' / 'a.txt.tply').write_text('fixed\n')
+    summary = templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, incremental=True)
+    assert(summary.deleted == 1)
+    assert(not (out_dir / 'hello.txt').exists())
+    assert((out_dir / 'sub' / 'a.txt').read_text() == 'fixed\n')
+
+def test_execute_dir_write_if_changed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    src_dir = tmp_path / 'src'
+    out_dir = tmp_path / 'out'
+    summary = templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, write_if_changed=True)
+    assert(summary.written == 4 and summary.unchanged == 0)
+    stamps = dict((path.name, path.stat().st_mtime_ns) for path in out_dir.rglob('*.txt'))
+    (src_dir / 'sub' / 'a.txt.tply').write_text('{% for i in range(0, 5) %}{{i}}{% endfor %}\n')
+    summary = templaty.execute_dir(src_dir, out_dir, { 'name': 'Bob' }, force=True, write_if_changed=True)
+    assert(summary.written == 1 and summary.unchanged == 3)
+    assert((out_dir / 'sub' / 'a.txt').read_text() == '01234\n')
+    assert((out_dir / 'hello.txt').stat().st_mtime_ns == stamps['hello.txt'])
+    assert((out_dir / 'static.txt').stat().st_mtime_ns == stamps['static.txt'])
+
+class HelperRuns:
+
+    count = 0
+
+def test_execute_dir_helper_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, {
+        'src/_helpers.py': 'HelperRuns.count += 1\ndef greet():\n    return "Hello!"\n',
+        'src/hello.txt.tply': '{{greet()}}',
+        'src/sub/world.txt.tply': '{{greet()}}',
+    })
+    cache = templaty.HelperCache()
+    ctx = { 'HelperRuns': HelperRuns }
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True, helper_cache=cache)
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True, helper_cache=cache)
+    assert(HelperRuns.count == 1)
+    (tmp_path / 'src' / '_helpers.py').write_text('def greet():\n    return "Bye!"\n')
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True, helper_cache=cache)
+    assert((tmp_path / 'out' / 'sub' / 'world.txt').read_text() == 'Bye!')
+
+@pytest.mark.parametrize('jobs', [ 1, 2 ])
+def test_execute_dir_helper_loads_context(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, jobs: int) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, {
+        'src/_helpers.py': 'from templaty import load_context\nNAME = load_context().get("name", "MISSING")\n',
+        'src/a.txt.tply': '{{NAME}}',
+        'src/b.txt.tply': '{{NAME}}!',
+    })
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', { 'name': 'Bob' }, jobs=jobs, helper_cache=templaty.HelperCache())
+    assert(read_tree(tmp_path / 'out') == { 'a.txt': 'Bob', 'b.txt': 'Bob!' })
+
+def test_execute_dir_does_not_hash_context(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, {
+        'src/hello.txt.tply': 'Hello, {{name}}!',
+        'src/helped/_helpers.py': 'def greet():\n    return "Hi!"\n',
+        'src/helped/greet.txt.tply': '{{greet()}}',
+    })
+    def fail(value):
+        raise AssertionError('the context should not have been hashed')
+    monkeypatch.setattr('templaty.build.stable_hash', fail)
+    ctx = { 'name': 'Bob' }
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx)
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True)
+    assert((tmp_path / 'out' / 'helped' / 'greet.txt').read_text() == 'Hi!')
+    (tmp_path / 'src' / 'helped' / '_helpers.py').unlink()
+    (tmp_path / 'src' / 'helped' / 'greet.txt.tply').unlink()
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True, helper_cache=templaty.HelperCache())
+    assert((tmp_path / 'out' / 'hello.txt').read_text() == 'Hello, Bob!')
+
+def test_execute_dir_context_changed(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, {
+        'src/_helpers.py': 'def get_v():\n    return v\n',
+        'src/v.txt.tply': '{{get_v()}}',
+    })
+    ctx = { 'v': 1 }
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx)
+    assert((tmp_path / 'out' / 'v.txt').read_text() == '1')
+    ctx['v'] = 2
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True)
+    assert((tmp_path / 'out' / 'v.txt').read_text() == '2')
+    cache = templaty.HelperCache()
+    ctx['v'] = 3
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True, helper_cache=cache)
+    assert((tmp_path / 'out' / 'v.txt').read_text() == '3')
+    ctx['v'] = 4
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, force=True, helper_cache=cache)
+    assert((tmp_path / 'out' / 'v.txt').read_text() == '4')
+
+@pytest.mark.parametrize('strategy', [ 'reflink', 'hardlink', 'symlink' ])
+def test_execute_dir_copy_strategy(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, strategy) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    summary = templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', { 'name': 'Bob' }, copy_strategy=strategy)
+    assert(summary.written == 4)
+    assert(read_tree(tmp_path / 'out') == EXPECTED_TREE)
+    assert((tmp_path / 'out' / 'static.txt').is_symlink() == (strategy == 'symlink'))
+    summary = templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', { 'name': 'Bob' }, force=True, copy_strategy=strategy)
+    assert(summary.written == 3 and summary.unchanged == 1)
+
+def test_execute_dir_lazy_context(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    calls = []
+    def get_name():
+        calls.append(1)
+        return 'Bob'
+    ctx = { 'name': templaty.lazy(get_name), 'unused': templaty.lazy(lambda: 1 / 0) }
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx)
+    assert(read_tree(tmp_path / 'out') == EXPECTED_TREE)
+    assert(len(calls) == 1)
+
+def test_execute_dir_incremental_lazy_context(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    write_tree(tmp_path, SAMPLE_TREE)
+    ctx = { 'name': templaty.lazy(lambda: 'Bob'), 'unused': templaty.lazy(lambda: 1 / 0) }
+    templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, incremental=True)
+    summary = templaty.execute_dir(tmp_path / 'src', tmp_path / 'out', ctx, incremental=True)
+    assert(summary.up_to_date == 1)
+    assert(read_tree(tmp_path / 'out') == EXPECTED_TREE | { '.templaty-manifest.json': (tmp_path / 'out' / '.templaty-manifest.json').read_text() })
+    assert(not ctx['unused'].resolved)
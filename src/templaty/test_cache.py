@@ -0,0 +1,70 @@
+
+from pathlib import Path
+
+import templaty
+from templaty.cache import stable_hash
+
+class Counter:
+
+    def __init__(self) -> None:
+        self.count = 0
+
+class Greeter:
+
+    calls = 0
+
+    @staticmethod
+    def greet(name: str) -> str:
+        Greeter.calls += 1
+        return f'Hello, {name}!'
+
+def test_memory_cache_hit():
+    cache = templaty.MemoryCache()
+    template = "{{Greeter.greet(name)}}"
+    assert(templaty.evaluate(template, { 'Greeter': Greeter, 'name': 'Bob' }, cache=cache) == 'Hello, Bob!')
+    assert(templaty.evaluate(template, { 'Greeter': Greeter, 'name': 'Bob' }, cache=cache) == 'Hello, Bob!')
+    assert(Greeter.calls == 1)
+    assert(templaty.evaluate(template, { 'Greeter': Greeter, 'name': 'Alice' }, cache=cache) == 'Hello, Alice!')
+    assert(Greeter.calls == 2)
+
+def test_unused_context_does_not_invalidate():
+    cache = templaty.MemoryCache()
+    template = templaty.compile_template("{{foo}}")
+    assert(templaty.evaluate(template, { 'foo': 1, 'bar': 1 }, cache=cache) == '1')
+    assert(templaty.evaluate(template, { 'foo': 1, 'bar': [] }, cache=cache) == '1')
+    assert(len(cache) == 2)
+
+def test_nondeterministic_template_not_cached():
+    cache = templaty.MemoryCache()
+    templaty.evaluate("{{now}}", cache=cache)
+    templaty.evaluate("{! import random !}{{random.random()}}", cache=cache)
+    for key in cache._entries:
+        assert(key.startswith('free-'))
+
+def test_disk_cache_eviction(tmp_path: Path):
+    cache = templaty.DiskCache(tmp_path, max_size=1000)
+    for i in range(0, 20):
+        cache.set(f'{i:064x}', 'x' * 200)
+    total = sum(entry.stat().st_size for entry in tmp_path.glob('*/*'))
+    assert(total <= 1000)
+    assert(cache.get(f'{19:064x}') == 'x' * 200)
+    assert(cache.get(f'{0:064x}') is None)
+
+def test_disk_cache_render(tmp_path: Path):
+    cache = templaty.DiskCache(tmp_path)
+    assert(templaty.evaluate("{{a + b}}", { 'a': 1, 'b': 2 }, cache=cache) == '3')
+    assert(templaty.evaluate("{{a + b}}", { 'a': 1, 'b': 2 }, cache=templaty.DiskCache(tmp_path)) == '3')
+
+def test_stable_hash():
+    assert(stable_hash({ 'a': [1, 2], 'b': { 3 } }) == stable_hash({ 'b': { 3 }, 'a': [1, 2] }))
+    assert(stable_hash([1, 2]) != stable_hash((1, 2)))
+    c1 = Counter()
+    c2 = Counter()
+    assert(stable_hash(c1) == stable_hash(c2))
+    c2.count += 1
+    assert(stable_hash(c1) != stable_hash(c2))
+
+def test_lazy_value_fingerprint():
+    cache = templaty.MemoryCache()
+    assert(templaty.evaluate("{{name}}", { 'name': templaty.lazy(lambda: 'Bob'), 'other': templaty.lazy(lambda: 1 / 0) }, cache=cache) == 'Bob')
+    assert(templaty.evaluate("{{name}}", { 'name': templaty.lazy(lambda: 'Alice') }, cache=cache) == 'Alice')
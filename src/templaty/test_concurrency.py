@@ -0,0 +1,36 @@
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import templaty
+
+N = 64
+
+TEMPLATE = "{% for i in range(0, 3) %}{% cache name %}{{name |> upper}}{% endcache %}-{{suffix}}-{{i}}\n{% endfor %}"
+
+def expected(i: int) -> str:
+    return ''.join(f'USER{i}-s{i}-{j}\n' for j in range(3))
+
+def test_concurrent_renders_threads():
+    template = templaty.compile_template(TEMPLATE)
+    barrier = threading.Barrier(N)
+    def render(i: int) -> str:
+        with templaty.shared_context.bind({ 'suffix': f's{i}' }):
+            barrier.wait()
+            return template.evaluate({ 'name': f'user{i}' })
+    with ThreadPoolExecutor(max_workers=N) as executor:
+        results = list(executor.map(render, range(N)))
+    assert(results == [ expected(i) for i in range(N) ])
+
+def test_concurrent_renders_tasks():
+    template = templaty.compile_template(TEMPLATE)
+    async def render(i: int) -> str:
+        templaty.shared_context.value = { 'suffix': f's{i}' }
+        # Let all other tasks set their own context first
+        await asyncio.sleep(0)
+        return template.evaluate({ 'name': f'user{i}' })
+    async def main():
+        return await asyncio.gather(*(render(i) for i in range(N)))
+    assert(asyncio.run(main()) == [ expected(i) for i in range(N) ])
+    assert(templaty.shared_context.value == {})
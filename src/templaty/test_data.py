@@ -0,0 +1,65 @@
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from templaty.data import load_data_file, load_data_files
+from templaty.main import main
+
+def test_load_data_file_snapshot(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_dir = tmp_path / 'cache'
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps({ 'tables': [ { 'name': 'users', 'columns': [ 'id', 'name' ] } ] }))
+    data = load_data_file(path, cache_dir)
+    assert(len(list(cache_dir.iterdir())) == 1)
+    def fail(*args, **kwargs):
+        raise AssertionError('JSON should not have been parsed')
+    monkeypatch.setattr(json, 'loads', fail)
+    assert(load_data_file(path, cache_dir) == data)
+    # Only touching the file should not cause it to be parsed again either
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert(load_data_file(path, cache_dir) == data)
+    monkeypatch.undo()
+    path.write_text(json.dumps({ 'tables': [] }))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 2000))
+    assert(load_data_file(path, cache_dir) == { 'tables': [] })
+
+def test_load_data_files(tmp_path: Path) -> None:
+    (tmp_path / 'a.json').write_text(json.dumps({ 'a': 1, 'b': 1 }))
+    (tmp_path / 'b.json').write_text(json.dumps({ 'b': 2 }))
+    (tmp_path / 'c.json').write_text(json.dumps([ 1, 2 ]))
+    assert(load_data_files([ tmp_path / 'a.json', tmp_path / 'b.json' ]) == { 'a': 1, 'b': 2 })
+    with pytest.raises(ValueError, match='c.json'):
+        load_data_files([ tmp_path / 'c.json' ])
+
+def test_cli_data_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('{{greeting}}, {{name}}!')
+    (tmp_path / 'a.json').write_text(json.dumps({ 'greeting': 'Hello', 'name': 'Bob' }))
+    (tmp_path / 'b.json').write_text(json.dumps({ 'name': 'Alice' }))
+    for _ in range(2):
+        main([ 'greet.tply', '--no-server', '--data-file', 'a.json', '--data-file', 'b.json', '--data-cache', 'cache' ])
+        assert(capsys.readouterr().out == 'Hello, Alice!\n')
+    assert(len(list((tmp_path / 'cache').iterdir())) == 2)
+
+def test_load_data_file_untrusted_snapshot(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    cache_dir = tmp_path / 'cache'
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps({ 'name': 'Bob' }))
+    assert(load_data_file(path, cache_dir) == { 'name': 'Bob' })
+    assert(cache_dir.stat().st_mode & 0o777 == 0o700)
+    def load_json_only(fn, data):
+        assert(fn is json.loads)
+        return fn(data)
+    monkeypatch.setattr('templaty.data._without_gc', load_json_only)
+    next(cache_dir.iterdir()).chmod(0o666)
+    assert(load_data_file(path, cache_dir) == { 'name': 'Bob' })
+    cache_dir.chmod(0o777)
+    assert(load_data_file(path, cache_dir) == { 'name': 'Bob' })
+    assert('other users can write' in capsys.readouterr().err)
+    cache_dir.chmod(0o700)
+    monkeypatch.setattr('os.getuid', lambda: cache_dir.stat().st_uid + 1)
+    assert(load_data_file(path, cache_dir) == { 'name': 'Bob' })
@@ -2,6 +2,10 @@
 import templaty
 from types import SimpleNamespace
 
+import pytest
+
+from templaty.cache import UncacheableError
+
 def test_if_else():
     assert(templaty.evaluate("{% if True %}Yes!{% endif %}") == "Yes!")
     assert(templaty.evaluate("{% if False %}Yes!{% endif %}") == "")
@@ -30,3 +34,80 @@ def test_variable_existence():
     assert(templaty.evaluate("{{'foo' in globals()}}", { 'foo': 42 }) == 'True')
     assert(templaty.evaluate("{{'foo' in globals()}}") == 'False')
 
+
+def test_cache_statement_hit():
+    calls = []
+    def table():
+        calls.append(1)
+        return 'a\nb'
+    template = "{% for i in range(0, 3) %}{% if i == 1 %}    {% endif %}[{% cache 0 %}{{table()}}{% endcache %}]\n{% endfor %}"
+    assert(templaty.evaluate(template, { 'table': table }) == '[a\nb]\n    [a\n    b]\n[a\nb]\n')
+    assert(len(calls) == 1)
+
+def test_cache_statement_key():
+    assert(templaty.evaluate("{% for i in xs %}{% cache i %}{{i * 10}}{% endcache %},{% endfor %}", { 'xs': [1, 1, 2] }) == '10,10,20,')
+
+def test_cache_statement_compiled_template():
+    calls = []
+    def f(x):
+        calls.append(x)
+        return x
+    template = templaty.compile_template("{% cache 'k' %}{{f(x)}}{% endcache %}")
+    assert(template.evaluate({ 'f': f, 'x': 1 }) == '1')
+    assert(template.evaluate({ 'f': f, 'x': 2 }) == '1')
+    assert(len(calls) == 1)
+    assert(template.evaluate({ 'f': f, 'x': 2 }, fragment_cache=templaty.MemoryCache()) == '2')
+
+def test_cache_statement_uncacheable_key():
+    with pytest.raises(UncacheableError, match='^#<anonymous>:2:3: '):
+        templaty.evaluate("\n  {% cache key %}foo{% endcache %}", { 'key': object() })
+
+def test_cache_as_variable():
+    assert(templaty.evaluate("{{cache}}", { 'cache': 'foo' }) == 'foo')
+    assert(templaty.evaluate("{{cache.size}}", { 'cache': SimpleNamespace(size=3) }) == '3')
+    assert(templaty.evaluate("{% for cache in xs %}{{cache}}{% endfor %}", { 'xs': [ 1, 2 ] }) == '12')
+    assert(templaty.evaluate("{% cache cache %}{{endcache}}{% endcache %}", { 'cache': 1, 'endcache': 'bar' }) == 'bar')
+
+def test_lazy_value():
+    calls = []
+    def get_tables():
+        calls.append(1)
+        return [ 'users', 'posts' ]
+    ctx = { 'tables': templaty.lazy(get_tables), 'unused': templaty.lazy(lambda: 1 / 0) }
+    template = templaty.compile_template("{% for t in tables %}{{t}}{% endfor %}:{{tables[0] |> upper}}{! n = len(tables) !}:{{n}}")
+    assert(template.evaluate(ctx) == 'usersposts:USERS:2')
+    assert(template.evaluate(ctx) == 'usersposts:USERS:2')
+    assert(len(calls) == 1)
+    assert(not ctx['unused'].resolved)
+
+def test_parallel_loop():
+    template = """class A:
+  {% for x in xs parallel %}
+  def f{{x}}(self):
+    {{body(x)}}
+  {% endfor %}
+{% join x in xs with ', ' parallel %}
+  {% for y in range(0, x) parallel %}{{y}}{% endfor %}
+{% endjoin %}
+"""
+    ctx = { 'xs': list(range(0, 8)), 'body': lambda x: f'a = {x}\nreturn a' }
+    expected = templaty.evaluate(template.replace(' parallel', ''), ctx)
+    assert(templaty.evaluate(template, ctx, max_workers=2) == expected)
+
+def test_parallel_loop_uses_processes():
+    import os
+    template = "{% for x in range(0, 4) parallel %}{{getpid()}}\n{% endfor %}"
+    pids = templaty.evaluate(template, { 'getpid': os.getpid }, max_workers=2).split()
+    assert(len(pids) == 4)
+    assert(str(os.getpid()) not in pids)
+
+def test_parallel_is_not_a_keyword():
+    assert(templaty.evaluate("{% for x in parallel %}{{x}}{% endfor %}", { 'parallel': [1, 2] }) == '12')
+
+def test_star_import():
+    namespace = {}
+    exec('from templaty import *', namespace)
+    for name in [ 'execute', 'evaluate', 'execute_dir', 'load_context', 'shared_context', 'lazy', 'Lazy' ]:
+        assert(namespace[name] is getattr(templaty, name))
+    for name in [ 'sys', 'Any', 'ModuleType', 'TYPE_CHECKING', 'dynamic_import' ]:
+        assert(name not in namespace)
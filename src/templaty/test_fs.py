@@ -0,0 +1,88 @@
+
+import os
+from pathlib import Path
+
+import pytest
+
+from templaty.fs import write_if_changed, copy_if_changed, copy_file, is_copy_up_to_date
+
+def test_write_if_changed(tmp_path: Path) -> None:
+    path = tmp_path / 'foo.txt'
+    assert(write_if_changed(path, 'foo'))
+    assert(not write_if_changed(path, 'foo'))
+    assert(write_if_changed(path, 'bar'))
+    assert(write_if_changed(path, 'barbaz'))
+    assert(path.read_text() == 'barbaz')
+    assert(list(tmp_path.iterdir()) == [ path ])
+
+def test_write_if_changed_digest(tmp_path: Path) -> None:
+    import hashlib
+    path = tmp_path / 'foo.txt'
+    path.write_text('foo')
+    assert(not write_if_changed(path, 'foo', hashlib.sha256(b'foo').hexdigest()))
+    assert(write_if_changed(path, 'bar', hashlib.sha256(b'foo').hexdigest()))
+    assert(path.read_text() == 'bar')
+
+def test_copy_if_changed(tmp_path: Path) -> None:
+    src = tmp_path / 'src.bin'
+    dest = tmp_path / 'dest.bin'
+    src.write_bytes(b'\x00' * 3000000)
+    assert(copy_if_changed(src, dest))
+    assert(not copy_if_changed(src, dest))
+    src.write_bytes(b'\x00' * 2999999 + b'\x01')
+    assert(copy_if_changed(src, dest))
+    assert(dest.read_bytes() == src.read_bytes())
+
+@pytest.mark.parametrize('strategy', [ 'copy', 'reflink', 'hardlink', 'symlink' ])
+def test_copy_file_strategies(tmp_path: Path, strategy) -> None:
+    src = tmp_path / 'src.bin'
+    dest = tmp_path / 'dest.bin'
+    src.write_bytes(b'foo' * 100000)
+    dest.write_bytes(b'old')
+    copy_file(src, dest, strategy)
+    assert(dest.read_bytes() == src.read_bytes())
+    assert(dest.is_symlink() == (strategy == 'symlink'))
+    assert(is_copy_up_to_date(src, dest, strategy))
+    assert(sorted(path.name for path in tmp_path.iterdir()) == [ 'dest.bin', 'src.bin' ])
+
+def test_copy_file_into_hardlink(tmp_path: Path) -> None:
+    src = tmp_path / 'src.txt'
+    dest = tmp_path / 'dest.txt'
+    src.write_text('foo')
+    copy_file(src, dest, 'hardlink')
+    assert(os.path.samefile(src, dest))
+    copy_file(src, dest, 'copy')
+    assert(not os.path.samefile(src, dest))
+    assert(src.read_text() == 'foo')
+
+def test_is_copy_up_to_date(tmp_path: Path) -> None:
+    src = tmp_path / 'src.txt'
+    dest = tmp_path / 'dest.txt'
+    src.write_text('foo')
+    assert(not is_copy_up_to_date(src, dest))
+    copy_file(src, dest)
+    assert(is_copy_up_to_date(src, dest))
+    assert(not is_copy_up_to_date(src, dest, 'symlink'))
+    os.utime(src, ns=(0, 0))
+    assert(not is_copy_up_to_date(src, dest))
+
+@pytest.mark.parametrize('strategy', [ 'copy', 'reflink', 'hardlink', 'symlink' ])
+def test_copy_file_keeps_temp_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, strategy) -> None:
+    src = tmp_path / 'src.txt'
+    dest = tmp_path / 'dest.txt'
+    src.write_text('foo')
+    opened = []
+    def open_file(path, *args, **kwargs):
+        opened.append(str(path))
+        return open(path, *args, **kwargs)
+    monkeypatch.setattr('templaty.fs.open', open_file, raising=False)
+    # Someone else already has a file with the first name that is tried
+    taken = tmp_path / f'.dest.txt.{bytes(6).hex()}'
+    taken.write_text('theirs')
+    names = iter([ bytes(6), b'\x01' * 6 ])
+    monkeypatch.setattr('os.urandom', lambda n: next(names))
+    copy_file(src, dest, strategy)
+    # The temporary file is only ever written through its descriptor
+    assert(opened == ([] if strategy in [ 'hardlink', 'symlink' ] else [ str(src) ]))
+    assert(dest.read_text() == 'foo')
+    assert(taken.read_text() == 'theirs')
@@ -0,0 +1,49 @@
+
+from pathlib import Path
+import tracemalloc
+
+import pytest
+
+import templaty
+from templaty.main import main
+from templaty.memory import MemoryReport
+
+def test_memory_report():
+    report = MemoryReport()
+    try:
+        result = templaty.evaluate("{% for i in range(0, 200) %}{{line}}\n{% endfor %}", { 'line': 'x' * 100 }, stats=report)
+    finally:
+        report.stop()
+    assert(not tracemalloc.is_tracing())
+    assert(len(result) == 200 * 101)
+    assert(set(report.memory) == { 'parse', 'outline', 'evaluate', 'render' })
+    evaluate = report.memory['evaluate']
+    # The output tree is still alive when the phase ends
+    assert(evaluate.retained > 0)
+    assert(evaluate.peak >= evaluate.retained)
+    assert(any('evaluator.py' in site.location for site in evaluate.get_top_sites()))
+    # The rendered string is the result of the last phase
+    assert(report.memory['render'].retained >= len(result))
+    assert('Top allocations during evaluate:' in report.format())
+
+def test_memory_report_keeps_tracing():
+    tracemalloc.start()
+    try:
+        report = MemoryReport()
+        templaty.evaluate("{{name}}", { 'name': 'foo' }, stats=report)
+        report.stop()
+        assert(tracemalloc.is_tracing())
+    finally:
+        tracemalloc.stop()
+
+def test_cli_memory_report(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'data.json').write_text('{ "name": "Bob" }')
+    main([ 'greet.tply', '--memory-report', '--data-file', 'data.json' ])
+    captured = capsys.readouterr()
+    assert(captured.out == 'Hello, Bob!\n')
+    for phase in [ 'load', 'parse', 'outline', 'evaluate', 'render' ]:
+        assert(f'\n{phase} ' in captured.err)
+    assert('retained' in captured.err)
+    assert(not tracemalloc.is_tracing())
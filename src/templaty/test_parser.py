@@ -288,3 +288,13 @@ def test_parse_complex_access():
     assert(isinstance(e4, VarRefExpression))
     assert(e4.name == 'foo')
 
+
+def test_parse_cache_statement():
+    sc = Scanner('#<cache_statement>', "{% cache foo.bar %}Foo!{% endcache %}")
+    p = Parser(sc)
+    s = p.parse_statement()
+    assert(isinstance(s, CacheStatement))
+    assert(isinstance(s.key, MemberExpression))
+    assert(len(s.body.elements) == 1)
+    assert(isinstance(s.body.elements[0], TextStatement))
+    assert(s.body.elements[0].text == 'Foo!')
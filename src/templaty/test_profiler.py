@@ -0,0 +1,50 @@
+
+from pathlib import Path
+
+import pytest
+
+import templaty
+from templaty.main import main
+from templaty.profiler import TemplateProfile
+
+def test_profile_counts_calls_and_bytes():
+    profile = TemplateProfile()
+    template = "{% for i in range(0, 3) %}{{name}}\n{% endfor %}"
+    result = templaty.evaluate(template, { 'name': 'foo' }, filename='foo.tply', profile=profile)
+    assert(result == 'foo\nfoo\nfoo\n')
+    entries = dict((entry.kind, entry) for entry in profile.get_entries())
+    assert(entries['ForInStatement'].calls == 1)
+    assert(entries['ForInStatement'].bytes == len(result))
+    assert(entries['ExpressionStatement'].calls == 3)
+    assert(entries['ExpressionStatement'].bytes == 9)
+    assert(entries['ExpressionStatement'].line == 1)
+    assert(entries['ExpressionStatement'].source == '{{name}}')
+    for entry in profile.get_entries():
+        assert(entry.self_time <= entry.total_time)
+        assert(entry.filename == 'foo.tply')
+
+def test_profile_attributes_helper_time():
+    import time
+    def slow():
+        time.sleep(0.02)
+        return 'x'
+    profile = TemplateProfile()
+    templaty.evaluate("a\n{{slow()}}\n{! y = 1 !}", { 'slow': slow }, profile=profile)
+    hottest = profile.get_entries()[0]
+    assert(hottest.kind == 'CallExpression')
+    assert(hottest.source == 'slow()')
+    assert(hottest.self_time >= 0.02)
+    assert(any(entry.kind == 'CodeBlock' for entry in profile.get_entries()))
+    annotated = profile.annotate()
+    assert('{{slow()}}' in annotated)
+    assert('|     2 |' in annotated)
+
+def test_cli_profile(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name |> upper}}!')
+    (tmp_path / 'data.json').write_text('{ "name": "Bob" }')
+    main([ 'greet.tply', '--profile', '--data-file', 'data.json' ])
+    captured = capsys.readouterr()
+    assert(captured.out == 'Hello, BOB!\n')
+    assert('greet.tply:1:8 ExpressionStatement' in captured.err)
+    assert('|     1 | Hello, {{name |> upper}}!' in captured.err)
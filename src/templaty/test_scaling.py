@@ -0,0 +1,136 @@
+
+from collections.abc import Callable
+from functools import cache
+import gc
+import math
+import time
+from typing import Any
+
+from templaty import text, util
+from templaty.evaluator import evaluate_output, parse, render_output
+from templaty.outline import outline
+from templaty.scanner import END_OF_FILE, Scanner
+
+# Every phase is run at sizes N, 2N, 4N and 8N, after which the exponent k in
+# time = c * size^k is fitted. Anything that is linear should stay well below
+# MAX_EXPONENT while something quadratic ends up close to 2, so this catches
+# algorithmic regressions without depending on how fast the machine is.
+
+SCALES = [ 1, 2, 4, 8 ]
+
+MAX_EXPONENT = 1.4
+
+def fit_exponent(sizes: list[int], times: list[float]) -> float:
+    xs = [ math.log(size) for size in sizes ]
+    ys = [ math.log(max(t, 1e-9)) for t in times ]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) \
+        / sum((x - mean_x) ** 2 for x in xs)
+
+def measure_exponent[T](make_input: Callable[[int], T], fn: Callable[[T], Any], n: int, repeats: int = 3) -> float:
+    sizes = [ n * scale for scale in SCALES ]
+    times = []
+    for size in sizes:
+        best = math.inf
+        for _ in range(repeats):
+            arg = make_input(size)
+            # A collection that happens to fall in one of the samples would
+            # make it look a lot slower than it is
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                fn(arg)
+                best = min(best, time.perf_counter() - start)
+            finally:
+                gc.enable()
+        times.append(best)
+    return fit_exponent(sizes, times)
+
+def assert_linear[T](make_input: Callable[[int], T], fn: Callable[[T], Any], n: int) -> None:
+    exponent = measure_exponent(make_input, fn, n)
+    if exponent > MAX_EXPONENT:
+        # Measure once more in case the machine was busy with something else
+        exponent = min(exponent, measure_exponent(make_input, fn, n))
+    assert exponent <= MAX_EXPONENT, f'time grows with size^{exponent:.2f}'
+
+def make_template(size: int) -> str:
+    out = ''
+    for i in range(size):
+        out += f'def function_{i}(self):\n'
+        out += '  {% for x in range(0, 2) %}\n'
+        out += '  value = {{x}} + {{name |> snake}}\n'
+        out += '  {% endfor %}\n'
+    return out
+
+def make_text(size: int) -> str:
+    return '  foo(bar)\n    baz\t"qux"\n' * size
+
+LOOP_TEMPLATE = """\
+{% for i in range(0, count) %}
+def function_{{i}}(self):
+  return {{i}} + {{name |> snake}}
+{% endfor %}
+"""
+
+CTX = { 'name': 'fooBar' }
+
+# Scanning is by far the slowest phase, so the inputs that are not changed
+# by the phase that is measured are only created once for every size.
+
+@cache
+def make_outlined_template(size: int):
+    template = parse(make_template(size))
+    outline(template)
+    return template
+
+@cache
+def make_output(size: int):
+    return evaluate_output(parse(LOOP_TEMPLATE), { 'count': size, **CTX })
+
+def scan_all(source: str) -> None:
+    for token in Scanner('#<scaling>', source).scan():
+        if token.type == END_OF_FILE:
+            break
+
+def test_fit_exponent():
+    sizes = [ 10, 20, 40, 80 ]
+    assert(round(fit_exponent(sizes, [ 3.0 * size for size in sizes ]), 6) == 1)
+    assert(round(fit_exponent(sizes, [ 0.5 * size * size for size in sizes ]), 6) == 2)
+
+def test_scan_scales_linearly():
+    assert_linear(make_template, scan_all, 3)
+
+def test_scan_text_scales_linearly():
+    assert_linear(make_text, scan_all, 100)
+
+def test_parse_scales_linearly():
+    assert_linear(make_template, lambda source: parse(source), 3)
+
+def test_outline_scales_linearly():
+    assert_linear(lambda size: parse(make_template(size)), outline, 4)
+
+def test_evaluate_scales_linearly():
+    assert_linear(make_outlined_template, lambda template: evaluate_output(template, CTX), 5)
+
+def test_render_scales_linearly():
+    assert_linear(make_output, render_output, 500)
+
+def test_render_text_scales_linearly():
+    assert_linear(lambda size: evaluate_output(parse('{{body}}'), { 'body': make_text(size) }), render_output, 1000)
+
+def test_util_scales_linearly():
+    assert_linear(make_text, util.escape, 2000)
+    assert_linear(make_text, util.indent, 2000)
+    assert_linear(make_text, util.dedent, 2000)
+    assert_linear(make_text, util.get_indentation, 2000)
+
+def test_text_indent_scales_linearly():
+    assert_linear(lambda size: text.Text(make_text(size)), lambda contents: text.indent(contents, '  '), 1000)
+
+def test_text_edits_scale_linearly():
+    def edit(contents: text.Text) -> None:
+        for offset in range(0, len(contents), 20):
+            contents.insert_at(offset, 'x')
+            del contents[offset]
+    assert_linear(lambda size: text.Text(make_text(size)), edit, 1000)
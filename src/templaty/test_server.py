@@ -0,0 +1,95 @@
+
+import json
+from pathlib import Path
+import threading
+
+import pytest
+
+from templaty.main import main
+from templaty.client import LocalRenderRequired, RemoteError, UntrustedSocketError, render_remote
+from templaty.server import RenderServer
+
+@pytest.fixture
+def server(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    socket_path = tmp_path / 'templaty.sock'
+    monkeypatch.setenv('TEMPLATY_SOCKET', str(socket_path))
+    server = RenderServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+    assert(not socket_path.exists())
+
+def test_render_remote(tmp_path: Path, server: RenderServer) -> None:
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'data.json').write_text(json.dumps({ 'name': 'Bob' }))
+    assert(render_remote({ 'source': '{{1 + 2}}' }) == '3')
+    assert(render_remote({ 'template': str(tmp_path / 'greet.tply'), 'data_files': [ str(tmp_path / 'data.json') ] }) == 'Hello, Bob!')
+    (tmp_path / 'greet.tply').write_text('Bye, {{name}}!')
+    assert(render_remote({ 'template': str(tmp_path / 'greet.tply'), 'context': { 'name': 'Alice' } }) == 'Bye, Alice!')
+    with pytest.raises(RemoteError, match='missing'):
+        render_remote({ 'source': '{{missing}}' })
+
+def test_cli_uses_server(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], server: RenderServer) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'data.json').write_text(json.dumps({ 'name': 'Bob' }))
+    main([ 'greet.tply', '--data-file', 'data.json' ])
+    assert(capsys.readouterr().out == 'Hello, Bob!\n')
+    assert(len(server.service._templates) == 1)
+
+def test_code_blocks_render_locally(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], server: RenderServer) -> None:
+    with pytest.raises(LocalRenderRequired):
+        render_remote({ 'source': '{! import os !}{{1 + 2}}' })
+    sub_dir = tmp_path / 'sub'
+    sub_dir.mkdir()
+    monkeypatch.chdir(sub_dir)
+    monkeypatch.setenv('TEMPLATY_TEST_VAR', 'caller')
+    (sub_dir / 'where.tply').write_text('{!\nimport os\ncwd = os.getcwd()\nvar = os.environ["TEMPLATY_TEST_VAR"]\n!}{{cwd}} {{var}}')
+    main([ 'where.tply' ])
+    assert(capsys.readouterr().out == f'{sub_dir} caller\n')
+    # A '{!' in a string is not a code block
+    (sub_dir / 'text.tply').write_text("{{'{!'}}")
+    main([ 'text.tply' ])
+    assert(capsys.readouterr().out == '{!\n')
+    assert(len(server.service._templates) == 2)
+
+def test_cli_reports_original_error(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, server: RenderServer) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'missing.tply').write_text('{{missing}}')
+    (tmp_path / 'divide.tply').write_text('{{1 / 0}}')
+    with pytest.raises(RemoteError) as info:
+        render_remote({ 'source': '{{1 / 0}}' })
+    assert(info.value.error_type == 'builtins.ZeroDivisionError')
+    for name, error_type in [ ('missing.tply', RuntimeError), ('divide.tply', ZeroDivisionError) ]:
+        with pytest.raises(Exception) as remote:
+            main([ name ])
+        with pytest.raises(Exception) as local:
+            main([ name, '--no-server' ])
+        assert(type(remote.value) is type(local.value) is error_type)
+        assert(str(remote.value) == str(local.value))
+
+def test_untrusted_socket(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], server: RenderServer) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'data.json').write_text(json.dumps({ 'name': 'Bob' }))
+    with monkeypatch.context() as m:
+        m.setattr('os.getuid', lambda: server.socket_path.stat().st_uid + 1)
+        with pytest.raises(UntrustedSocketError, match='another user'):
+            render_remote({ 'source': '{{1 + 2}}' })
+        main([ 'greet.tply', '--data-file', 'data.json' ])
+    assert(capsys.readouterr().out == 'Hello, Bob!\n')
+    assert(len(server.service._templates) == 0)
+    not_a_socket = tmp_path / 'not-a-socket'
+    not_a_socket.write_text('')
+    with pytest.raises(UntrustedSocketError, match='not a socket'):
+        render_remote({ 'source': '{{1 + 2}}' }, not_a_socket)
+    monkeypatch.setenv('TEMPLATY_SOCKET', str(not_a_socket))
+    main([ 'greet.tply', '--data-file', 'data.json' ])
+    assert(capsys.readouterr().out == 'Hello, Bob!\n')
+
+def test_server_already_running(tmp_path: Path, server: RenderServer) -> None:
+    with pytest.raises(RuntimeError, match='already'):
+        RenderServer(server.socket_path)
@@ -0,0 +1,60 @@
+
+from pathlib import Path
+
+import pytest
+
+import templaty
+from templaty.cache import MemoryCache
+from templaty.main import main
+from templaty.stats import RenderStats
+
+def test_render_stats():
+    phases = []
+    stats = RenderStats(on_phase=lambda phase, seconds: phases.append(phase))
+    result = templaty.evaluate("{% for i in range(0, 3) %}{% cache 0 %}{{name}}{% endcache %}\n{% endfor %}", { 'name': 'foo' }, stats=stats)
+    assert(result == 'foo\nfoo\nfoo\n')
+    assert(phases == [ 'scan', 'parse', 'outline', 'evaluate', 'render' ])
+    assert(set(stats.phases) == set(phases))
+    assert(all(seconds >= 0 for seconds in stats.phases.values()))
+    assert(stats.renders == 1)
+    assert(stats.tokens > 0)
+    assert(stats.nodes > 0)
+    assert(stats.output_nodes > 3)
+    assert(stats.output_bytes == len(result))
+    assert(stats.cache_hits == 2)
+    assert(stats.cache_misses == 1)
+
+def test_render_stats_parse_error():
+    from templaty.parser import ParseError
+    with pytest.raises(ParseError, match='foo.tply:1:'):
+        templaty.evaluate("{% for %}", filename='foo.tply', stats=RenderStats())
+
+def test_render_stats_accumulate():
+    template = templaty.compile_template("Hello, {{name}}!")
+    stats = RenderStats()
+    template.evaluate({ 'name': 'a' }, stats=stats)
+    template.evaluate({ 'name': 'bc' }, stats=stats)
+    # A compiled template was already parsed before it was rendered
+    assert('parse' not in stats.phases)
+    assert(stats.renders == 2)
+    assert(stats.output_bytes == len('Hello, a!') + len('Hello, bc!'))
+
+def test_render_stats_output_cache():
+    cache = MemoryCache()
+    stats = RenderStats()
+    for _ in range(2):
+        templaty.evaluate("Hello, {{name}}!", { 'name': 'foo' }, cache=cache, stats=stats)
+    assert(stats.renders == 2)
+    assert(stats.cache_hits == 1)
+    assert(stats.cache_misses == 1)
+
+def test_cli_stats(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'data.json').write_text('{ "name": "Bob" }')
+    main([ 'greet.tply', '--stats', '--data-file', 'data.json' ])
+    captured = capsys.readouterr()
+    assert(captured.out == 'Hello, Bob!\n')
+    for phase in [ 'load', 'scan', 'parse', 'outline', 'evaluate', 'render', 'total' ]:
+        assert(phase in captured.err)
+    assert('output bytes: 11' in captured.err)
@@ -0,0 +1,43 @@
+
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+import templaty
+from templaty.main import main
+from templaty.stream import RecordError, iter_records, render_records
+
+def test_iter_records() -> None:
+    records = iter_records(io.StringIO('{"a": 1}\n\n{"a": 2}\n[3]\n'))
+    assert(next(records) == { 'a': 1 })
+    assert(next(records) == { 'a': 2 })
+    with pytest.raises(RecordError, match='<stdin>:4'):
+        next(records)
+
+def test_render_records_concatenated() -> None:
+    out = io.StringIO()
+    template = templaty.compile_template('{{name}};')
+    assert(render_records(template, iter_records(io.StringIO('{"name": "a"}\n{"name": "b"}\n')), out) == 2)
+    assert(out.getvalue() == 'a;b;')
+
+def test_jsonl_cli_output_name(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'people.jsonl').write_text('\n'.join(json.dumps({ 'id': i, 'name': name }) for i, name in enumerate([ 'Bob', 'Alice' ])))
+    main([ 'greet.tply', '--jsonl', '--data-file', 'people.jsonl', '--output-name', 'out/{{id}}-{{name |> lower}}.txt' ])
+    assert((tmp_path / 'out' / '0-bob.txt').read_text() == 'Hello, Bob!')
+    assert((tmp_path / 'out' / '1-alice.txt').read_text() == 'Hello, Alice!')
+
+def test_write_if_changed_requires_output(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'greet.tply').write_text('Hello, {{name}}!')
+    (tmp_path / 'people.jsonl').write_text(json.dumps({ 'name': 'Bob' }))
+    with pytest.raises(SystemExit):
+        main([ 'greet.tply', '--write-if-changed' ])
+    assert('requires -o/--output' in capsys.readouterr().err)
+    with pytest.raises(SystemExit):
+        main([ 'greet.tply', '--jsonl', '--data-file', 'people.jsonl', '-o', 'out.txt', '--write-if-changed' ])
+    assert('requires --output-name' in capsys.readouterr().err)
+    assert(not (tmp_path / 'out.txt').exists())
@@ -0,0 +1,61 @@
+
+import random
+
+from templaty.text import CHUNK_SIZE, Text, dedent, indent
+
+def test_text_edits():
+    text = Text('foo baz')
+    text.insert_at(4, 'bar ')
+    assert(str(text) == 'foo bar baz')
+    del text[0:4]
+    assert(str(text) == 'bar baz')
+    del text[0]
+    assert(str(text) == 'ar baz')
+    del text[-1]
+    assert(str(text) == 'ar ba')
+    text + '!'
+    text + Text('?')
+    assert(text.contents == 'ar ba!?')
+    assert(text[3] == 'b' and text[-1] == '?' and text[1:4] == 'r b')
+    assert(list(text) == list('ar ba!?'))
+    assert(len(text) == 7)
+    assert(not text)
+    assert(Text())
+
+def test_text_large_edits():
+    source = ''.join(chr(ord('a') + i % 26) for i in range(CHUNK_SIZE * 10))
+    text = Text(source)
+    text.insert_at(CHUNK_SIZE * 3 + 7, source)
+    del text[CHUNK_SIZE:CHUNK_SIZE * 8]
+    expected = source[:CHUNK_SIZE * 3 + 7] + source + source[CHUNK_SIZE * 3 + 7:]
+    expected = expected[:CHUNK_SIZE] + expected[CHUNK_SIZE * 8:]
+    assert(str(text) == expected)
+    assert(text[CHUNK_SIZE * 2:CHUNK_SIZE * 5] == expected[CHUNK_SIZE * 2:CHUNK_SIZE * 5])
+    assert(''.join(text) == expected)
+
+def test_text_random_edits():
+    rng = random.Random(42)
+    expected = ''
+    text = Text()
+    for _ in range(2000):
+        offset = rng.randint(0, len(expected))
+        if rng.random() < 0.6:
+            chunk = ''.join(rng.choice('ab \n') for _ in range(rng.choice([ 1, 5, 100, CHUNK_SIZE + 1 ])))
+            text.insert_at(offset, chunk)
+            expected = expected[:offset] + chunk + expected[offset:]
+        else:
+            stop = min(len(expected), offset + rng.choice([ 1, 3, 50, CHUNK_SIZE * 2 ]))
+            del text[offset:stop]
+            expected = expected[:offset] + expected[stop:]
+        assert(len(text) == len(expected))
+        if expected:
+            i = rng.randrange(len(expected))
+            assert(text[i] == expected[i])
+    assert(str(text) == expected)
+
+def test_text_indent_dedent():
+    text = Text('foo\n  bar\n\nbaz\n')
+    indent(text, '  ')
+    assert(str(text) == '  foo\n    bar\n\n  baz\n')
+    dedent(text, indentation=2)
+    assert(str(text) == 'foo\n  bar\n\nbaz\n')
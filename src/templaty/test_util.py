@@ -55,3 +55,23 @@ def test_get_indentation_nested_multiline():
 #      def test_mixed():
 #          assert(indent('\n\nfoo\n  bar\nbaz\n\n'), '\n\n  foo\n    bar\n  baz\n\n')
 #  
+
+def test_get_indentation_blank_lines():
+    assert(get_indentation("  \n  foo\n    bar") == 4)
+    assert(get_indentation("foo\n  bar", at_blank_line=False) == 2)
+    assert(get_indentation("\n \n", default_indent=4) == 4)
+
+def test_indent():
+    assert(indent("foo\n  bar\n\n", '--') == "--foo\n  --bar\n\n")
+    assert(indent("foo\nbar", '--', at_blank_line=False) == "foo\n--bar")
+    assert(indent(" \tfoo", '--') == " \t--foo")
+
+def test_dedent():
+    assert(dedent("  foo\n    bar\n  baz\n") == "foo\n  bar\nbaz\n")
+    assert(dedent("  foo  bar\n \n  baz") == "foobar\n\n baz")
+
+def test_escape():
+    assert(escape("a\tb\r\n") == "a\\tb\\r\\n")
+    assert(escape("back\\slash") == "back\\slash")
+    assert(escape("\x00\x1b\x7f") == "\\x00\\x1B\\x7F")
+    assert(escape("caf\u00e9 \u200b \U0001f600") == "caf\u00e9 \\u200B \U0001f600")
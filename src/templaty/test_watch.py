@@ -0,0 +1,115 @@
+
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+from templaty.test_build import write_tree, read_tree, SAMPLE_TREE, EXPECTED_TREE
+from templaty.watch import WatchBuild, PollingWatcher, InotifyWatcher
+
+def make_build(tmp_path: Path) -> WatchBuild:
+    write_tree(tmp_path, SAMPLE_TREE)
+    (tmp_path / 'data.json').write_text(json.dumps({ 'name': 'Bob' }))
+    def load_ctx():
+        return json.loads((tmp_path / 'data.json').read_text())
+    return WatchBuild(tmp_path / 'src', tmp_path / 'out', load_ctx, [ tmp_path / 'data.json' ])
+
+def test_watch_build_template_change(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    build = make_build(tmp_path)
+    build.build()
+    assert(read_tree(tmp_path / 'out') == EXPECTED_TREE)
+    path = tmp_path / 'src' / 'sub' / 'a.txt.tply'
+    path.write_text('{% for i in range(0, 5) %}{{i}}{% endfor %}\n')
+    summary = build.update({ path })
+    assert(summary.written == 1)
+    assert((tmp_path / 'out' / 'sub' / 'a.txt').read_text() == '01234\n')
+
+def test_watch_build_helper_change(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    build = make_build(tmp_path)
+    build.build()
+    path = tmp_path / 'src' / '_helpers.py'
+    path.write_text('def greet(name):\n    return f"Bye, {name}!"\n')
+    summary = build.update({ path })
+    assert(summary.written == 2)
+    assert((tmp_path / 'out' / 'hello.txt').read_text() == 'Bye, Bob!\n')
+    assert((tmp_path / 'out' / 'sub' / 'shout.txt').read_text() == 'BYE, BOB!\n')
+
+def test_watch_build_data_and_tree_changes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    build = make_build(tmp_path)
+    build.build()
+    (tmp_path / 'data.json').write_text(json.dumps({ 'name': 'Alice' }))
+    summary = build.update({ tmp_path / 'data.json' })
+    assert(summary.written == 2)
+    assert((tmp_path / 'out' / 'hello.txt').read_text() == 'Hello, Alice!\n')
+    (tmp_path / 'src' / 'static.txt').unlink()
+    (tmp_path / 'src' / 'new.txt.tply').write_text('{{name}}')
+    summary = build.update({ tmp_path / 'src' / 'static.txt', tmp_path / 'src' / 'new.txt.tply' })
+    assert(summary.deleted == 1 and summary.written == 1)
+    assert(not (tmp_path / 'out' / 'static.txt').exists())
+    assert((tmp_path / 'out' / 'new.txt').read_text() == 'Alice')
+
+def test_watch_build_reports_errors(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    build = make_build(tmp_path)
+    build.build()
+    path = tmp_path / 'src' / 'hello.txt.tply'
+    path.write_text('{{missing()}}')
+    summary = build.update({ path })
+    assert(summary.failed == 1)
+    assert('hello.txt' in capsys.readouterr().err)
+
+def test_watch_build_helper_loads_context(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    build = make_build(tmp_path)
+    helpers = tmp_path / 'src' / '_helpers.py'
+    helpers.write_text('from templaty import load_context\nNAME = load_context().get("name", "MISSING")\n')
+    (tmp_path / 'src' / 'hello.txt.tply').write_text('{{NAME}}\n')
+    build.build()
+    assert((tmp_path / 'out' / 'hello.txt').read_text() == 'Bob\n')
+
+def test_watch_build_skips_existing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    build = make_build(tmp_path)
+    write_tree(tmp_path, { 'out/hello.txt': 'Old\n' })
+    summary = build.build()
+    assert(summary.skipped == 1)
+    assert((tmp_path / 'out' / 'hello.txt').read_text() == 'Old\n')
+    assert('Skipping' in capsys.readouterr().err)
+    (tmp_path / 'src' / 'hello.txt.tply').unlink()
+    summary = build.update({ tmp_path / 'src' / 'hello.txt.tply' })
+    assert(summary.deleted == 0)
+    assert((tmp_path / 'out' / 'hello.txt').read_text() == 'Old\n')
+    path = tmp_path / 'src' / 'sub' / 'a.txt.tply'
+    path.write_text('changed\n')
+    summary = build.update({ path })
+    assert(summary.written == 1)
+    assert((tmp_path / 'out' / 'sub' / 'a.txt').read_text() == 'changed\n')
+    write_tree(tmp_path, { 'out/hello.txt': 'Old\n' })
+    (tmp_path / 'src' / 'hello.txt.tply').write_text('{{greet(name)}}\n')
+    forced = WatchBuild(tmp_path / 'src', tmp_path / 'out', lambda: { 'name': 'Bob' }, force=True)
+    forced.build()
+    assert(read_tree(tmp_path / 'out') == EXPECTED_TREE | { 'sub/a.txt': 'changed\n' })
+
+def test_polling_watcher(tmp_path: Path) -> None:
+    (tmp_path / 'a.txt').write_text('a')
+    watcher = PollingWatcher([ tmp_path ], interval=0.01)
+    assert(watcher.wait(0) == set())
+    (tmp_path / 'a.txt').write_text('aa')
+    (tmp_path / 'b.txt').write_text('b')
+    assert(watcher.wait(1) == { tmp_path / 'a.txt', tmp_path / 'b.txt' })
+
+@pytest.mark.skipif(sys.platform != 'linux', reason='inotify is only available on Linux')
+def test_inotify_watcher(tmp_path: Path) -> None:
+    watcher = InotifyWatcher([ tmp_path ])
+    try:
+        assert(watcher.wait(0) == set())
+        (tmp_path / 'sub').mkdir()
+        (tmp_path / 'sub' / 'a.txt').write_text('a')
+        changed = watcher.wait(1)
+        assert(tmp_path / 'sub' / 'a.txt' in changed)
+    finally:
+        watcher.close()
@@ -1,52 +1,250 @@
 
+import random
+
+# Text is stored as a treap of string chunks, ordered by position. Every node
+# knows the length of the text in its subtree, so an offset can be found in
+# O(log n) time. Small edits are made directly in the chunk they fall in,
+# which keeps the number of nodes down.
+#
+# This is meant for editing text in place. render_output() does not use it:
+# it only ever appends, and plain strings are several times faster at that.
+
+CHUNK_SIZE = 512
+
+class _Node:
+
+    __slots__ = ('chunk', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, chunk):
+        self.chunk = chunk
+        self.priority = random.random()
+        self.size = len(chunk)
+        self.left = None
+        self.right = None
+
+def _size(node):
+    return 0 if node is None else node.size
+
+def _update(node):
+    node.size = _size(node.left) + len(node.chunk) + _size(node.right)
+    return node
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+def _split(node, offset):
+    if node is None:
+        return None, None
+    left_size = _size(node.left)
+    if offset <= left_size:
+        left, right = _split(node.left, offset)
+        node.left = right
+        return left, _update(node)
+    offset -= left_size
+    if offset >= len(node.chunk):
+        left, right = _split(node.right, offset - len(node.chunk))
+        node.right = left
+        return _update(node), right
+    tail = _Node(node.chunk[offset:])
+    right = node.right
+    node.chunk = node.chunk[:offset]
+    node.right = None
+    return _update(node), _merge(tail, right)
+
+def _build(text):
+    root = None
+    for i in range(0, len(text), CHUNK_SIZE):
+        root = _merge(root, _Node(text[i:i+CHUNK_SIZE]))
+    return root
+
+def _insert_in_chunk(node, offset, text):
+    if node is None:
+        return False
+    left_size = _size(node.left)
+    if offset <= left_size and node.left is not None:
+        if not _insert_in_chunk(node.left, offset, text):
+            return False
+    elif offset - left_size <= len(node.chunk):
+        if len(node.chunk) + len(text) > CHUNK_SIZE:
+            return False
+        offset -= left_size
+        node.chunk = node.chunk[:offset] + text + node.chunk[offset:]
+    elif not _insert_in_chunk(node.right, offset - left_size - len(node.chunk), text):
+        return False
+    node.size += len(text)
+    return True
+
+def _delete_in_chunk(node, start, stop):
+    if node is None:
+        return False
+    left_size = _size(node.left)
+    if stop <= left_size:
+        if not _delete_in_chunk(node.left, start, stop):
+            return False
+    elif start >= left_size + len(node.chunk):
+        offset = left_size + len(node.chunk)
+        if not _delete_in_chunk(node.right, start - offset, stop - offset):
+            return False
+    elif start >= left_size and stop <= left_size + len(node.chunk):
+        node.chunk = node.chunk[:start-left_size] + node.chunk[stop-left_size:]
+    else:
+        return False
+    node.size -= stop - start
+    return True
+
+def _iter_chunks(node):
+    stack = []
+    while stack or node is not None:
+        while node is not None:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        yield node.chunk
+        node = node.right
+
+def _clamp(index, length):
+    # Mimics how Python treats the bounds of a slice
+    if index < 0:
+        index += length
+    return min(max(index, 0), length)
+
 class Text:
 
     def __init__(self, contents=''):
         self.contents = contents
 
+    @property
+    def contents(self):
+        if self._string is None:
+            self._string = ''.join(_iter_chunks(self._root))
+        return self._string
+
+    @contents.setter
+    def contents(self, contents):
+        self._root = _build(contents)
+        self._string = contents
+        self._finger = None
+
+    def _changed(self):
+        self._string = None
+        self._finger = None
+
+    def _find_chunk(self, offset):
+        # Remembers the last chunk that was found, so that reading the text
+        # from left to right does not have to search the tree every time.
+        if self._finger is not None:
+            start, chunk = self._finger
+            if start <= offset < start + len(chunk):
+                return start, chunk
+        node = self._root
+        start = 0
+        while True:
+            left_size = _size(node.left)
+            if offset < left_size:
+                node = node.left
+            elif offset < left_size + len(node.chunk):
+                start += left_size
+                self._finger = (start, node.chunk)
+                return start, node.chunk
+            else:
+                offset -= left_size + len(node.chunk)
+                start += left_size + len(node.chunk)
+                node = node.right
+
+    def _delete(self, start, stop):
+        if start >= stop:
+            return
+        if not _delete_in_chunk(self._root, start, stop):
+            left, rest = _split(self._root, start)
+            _, right = _split(rest, stop - start)
+            self._root = _merge(left, right)
+        self._changed()
+
     def __delitem__(self, key):
+        length = len(self)
         if isinstance(key, slice):
             start = 0 if key.start is None else key.start
-            stop = len(self.contents) if key.stop is None else key.stop
+            stop = length if key.stop is None else key.stop
             if start < 0:
-                start = len(self.contents)+start
+                start = length+start
             if stop < 0:
-                stop = len(self.contents)-1-(stop+1)
-            self.contents = self.contents[:start] + self.contents[stop:]
+                stop = length-1-(stop+1)
+            start = _clamp(start, length)
+            stop = _clamp(stop, length)
+            if start <= stop:
+                self._delete(start, stop)
+            else:
+                # The text between the bounds ends up in the result twice
+                self.insert_at(start, self[stop:start])
         elif isinstance(key, int):
-            offset = len(self.contents)-1-(key+1) if key < 0 else key
-            self.contents = self.contents[:offset] + self.contents[offset+1:]
+            offset = length-1-(key+1) if key < 0 else key
+            if 0 <= offset < length:
+                self._delete(offset, offset+1)
         else:
             raise TypeError(f'text indices must be integers')
 
     def insert_at(self, offset, chunk):
         if isinstance(chunk, Text):
-            self.contents = self.contents[:offset] + chunk.contents + self.contents[offset:]
-        elif isinstance(chunk, str):
-            self.contents = self.contents[:offset] + chunk + self.contents[offset:]
-        else:
+            chunk = chunk.contents
+        elif not isinstance(chunk, str):
             raise TypeError(f'{chunk} must be of type Text or str')
+        if not chunk:
+            return
+        offset = _clamp(offset, len(self))
+        if not _insert_in_chunk(self._root, offset, chunk):
+            left, right = _split(self._root, offset)
+            self._root = _merge(_merge(left, _build(chunk)), right)
+        self._changed()
 
     def __bool__(self):
-        return len(self.contents) == 0
+        return len(self) == 0
 
     def __str__(self):
         return self.contents
 
     def __getitem__(self, key):
-        return self.contents[key]
+        if isinstance(key, int):
+            length = len(self)
+            offset = key + length if key < 0 else key
+            if not 0 <= offset < length:
+                raise IndexError('text index out of range')
+            start, chunk = self._find_chunk(offset)
+            return chunk[offset - start]
+        if self._string is not None or not isinstance(key, slice):
+            return self.contents[key]
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            return self.contents[key]
+        out = []
+        offset = 0
+        for chunk in _iter_chunks(self._root):
+            if offset >= stop:
+                break
+            if offset + len(chunk) > start:
+                out.append(chunk[max(start - offset, 0):stop - offset])
+            offset += len(chunk)
+        return ''.join(out)
 
     def __iter__(self):
-        return iter(self.contents)
+        for chunk in _iter_chunks(self._root):
+            yield from chunk
 
     def __len__(self):
-        return len(self.contents)
+        return _size(self._root)
 
     def __add__(self, chunk):
         if isinstance(chunk, Text):
-            self.contents += chunk.contents
+            self.insert_at(len(self), chunk.contents)
         elif isinstance(chunk, str):
-            self.contents += chunk
+            self.insert_at(len(self), chunk)
         else:
             raise TypeError(f'cannot add {chunk} to text')
         return self
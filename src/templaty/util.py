@@ -57,34 +57,41 @@ def remove_last_newline(text: str) -> str:
         i += 1
     return text[0:i+1]
 
+_WHITESPACE_RUN = re.compile(r'[ \t\n]+')
+
 def dedent(text: str, at_blank_line=True) -> str:
+    # Up to indent_length blanks are dropped after every non-blank character,
+    # not only at the start of a line, and a newline does not reset the count
     indent_length = get_indentation(text, at_blank_line)
-    curr_removed = 0
-    out = ''
-    for ch in text:
-        if ch == '\n':
-            at_blank_line = True
-        elif is_blank(ch):
-            if curr_removed < indent_length:
-                curr_removed += 1
-                continue
-        else:
-            curr_removed = 0
-        out += ch
-    return out
+    if indent_length == 0:
+        return text
+    def remove_blanks(match: re.Match[str]) -> str:
+        run = match.group()
+        if '\n' not in run:
+            return run[indent_length:]
+        count = indent_length
+        lines = run.split('\n')
+        for i, line in enumerate(lines):
+            if count == 0:
+                break
+            removed = min(count, len(line))
+            lines[i] = line[removed:]
+            count -= removed
+        return '\n'.join(lines)
+    return _WHITESPACE_RUN.sub(remove_blanks, text)
+
+_LINE_START = re.compile(r'^[ \t]*(?=[^ \t\n])', re.MULTILINE)
 
 def indent(text: str, indentation='  ', at_blank_line=True) -> str:
-    out = ''
-    for ch in text:
-        if not at_blank_line:
-            at_blank_line = ch == '\n'
-        elif ch == '\n':
-            at_blank_line = True
-        elif not is_blank(ch):
-            at_blank_line = False
-            out += indentation
-        out += ch
-    return out
+    # The indentation is added after any blanks the line already starts with
+    head = ''
+    if not at_blank_line:
+        i = text.find('\n')
+        if i == -1:
+            return text
+        head = text[:i+1]
+        text = text[i+1:]
+    return head + _LINE_START.sub(lambda match: match.group() + indentation, text)
 
 def is_last_line_blank(text: str) -> bool:
     for ch in reversed(text):
@@ -95,20 +102,21 @@ def is_last_line_blank(text: str) -> bool:
     return True
 
 def get_indentation(text: str, at_blank_line=True, default_indent=0):
+    # Blank lines do not reset the indentation that has been counted so far
     min_indent = None
     curr_indent = 0
-    for ch in text:
-        if at_blank_line:
-            if is_blank(ch):
-                curr_indent += 1
+    for i, line in enumerate(text.split('\n')):
+        if not at_blank_line:
+            if i == 0:
                 continue
-            at_blank_line = ch == '\n'
-            if not at_blank_line and (min_indent is None or curr_indent < min_indent):
+            at_blank_line = True
+            curr_indent = 0
+        content = line.lstrip(' \t')
+        curr_indent += len(line) - len(content)
+        if content:
+            at_blank_line = False
+            if min_indent is None or curr_indent < min_indent:
                 min_indent = curr_indent
-        else:
-            if ch == '\n':
-                at_blank_line = True
-                curr_indent = 0
     if min_indent is None:
         min_indent = default_indent if at_blank_line else curr_indent 
     return min_indent
@@ -131,16 +139,29 @@ SPECIAL_CHARS = {
         '\x5C': '\\',
         }
 
-def escape(text: str) -> str:
-    out = ''
-    for ch in text:
+class _EscapeTable(dict[int, str]):
+
+    # The escaped form of every character is only computed the first time it
+    # is seen.
+
+    def __missing__(self, code: int) -> str:
+        ch = chr(code)
         if ch in SPECIAL_CHARS:
-            out += SPECIAL_CHARS[ch]
+            out = SPECIAL_CHARS[ch]
         elif ch.isprintable():
-        #  elif ord(ch) >= 0x20 and ord(ch) <= 0x7E:
-            out += ch
+            out = ch
         else:
-            code = ord(ch)
-            out += f"\\x{code:02X}" if code <= 0x7F else f'\\u{code:04X}'
-    return out
+            out = f"\\x{code:02X}" if code <= 0x7F else f'\\u{code:04X}'
+        self[code] = out
+        return out
 
+_escape_table = _EscapeTable()
+
+_MAYBE_SPECIAL = re.compile(r'[^\x20-\x7E]')
+
+def escape(text: str) -> str:
+    # None of the special characters are printable except for the backslash,
+    # which is left alone
+    if text.isprintable():
+        return text
+    return _MAYBE_SPECIAL.sub(lambda match: _escape_table[ord(match.group())], text)
@@ -0,0 +1,305 @@
+
+import ctypes
+import ctypes.util
+import errno
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+import time
+from typing import Any, Callable, Protocol
+
+from sweetener import warn
+
+from .build import BuildSummary, HelperCache, HelperLoader, Job, RenderJob, get_file_stamp, plan_dir, render_job
+from .evaluator import CompiledTemplate, shared_context
+from .fs import copy_if_changed, write_if_changed
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+def scan_files(roots: list[Path]) -> dict[Path, list[int]]:
+    out = dict[Path, list[int]]()
+    for root in roots:
+        if root.is_dir():
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [ name for name in dirnames if name != '__pycache__' ]
+                for name in filenames:
+                    path = Path(dirpath) / name
+                    stamp = get_file_stamp(path)
+                    if stamp is not None:
+                        out[path] = stamp
+        else:
+            stamp = get_file_stamp(root)
+            if stamp is not None:
+                out[root] = stamp
+    return out
+
+class FileWatcher(Protocol):
+
+    def wait(self, timeout: float | None = None) -> set[Path]: ...
+
+    def close(self) -> None: ...
+
+class PollingWatcher:
+
+    def __init__(self, roots: list[Path], interval: float = 0.25) -> None:
+        self.roots = roots
+        self.interval = interval
+        self._stamps = scan_files(roots)
+
+    def wait(self, timeout: float | None = None) -> set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stamps = scan_files(self.roots)
+            changed = set(path for path in stamps.keys() | self._stamps.keys() if stamps.get(path) != self._stamps.get(path))
+            self._stamps = stamps
+            if changed:
+                return changed
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+            else:
+                time.sleep(self.interval)
+
+    def close(self) -> None:
+        pass
+
+class InotifyWatcher:
+
+    def __init__(self, roots: list[Path], debounce: float = 0.02) -> None:
+        self.debounce = debounce
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._dirs = dict[int, Path]()
+        for root in roots:
+            if root.is_dir():
+                self._add_tree(root)
+            else:
+                # Editors usually save a file by replacing it, so we watch the
+                # directory it lives in rather than the file itself.
+                self._add_watch(root.parent)
+
+    def _add_watch(self, path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOENT:
+                return
+            raise OSError(err, os.strerror(err), str(path))
+        self._dirs[wd] = path
+
+    def _add_tree(self, root: Path) -> set[Path]:
+        files = set[Path]()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [ name for name in dirnames if name != '__pycache__' ]
+            self._add_watch(Path(dirpath))
+            for name in filenames:
+                files.add(Path(dirpath) / name)
+        return files
+
+    def _read_events(self) -> set[Path]:
+        changed = set[Path]()
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset+length].rstrip(b'\0')
+            offset += length
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            dir = self._dirs.get(wd)
+            if dir is None:
+                continue
+            path = dir / os.fsdecode(name) if name else dir
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may have been created before the new directory was
+                # being watched, so we report everything that is in it.
+                changed.update(self._add_tree(path))
+        return changed
+
+    def wait(self, timeout: float | None = None) -> set[Path]:
+        ready, _, _ = select.select([ self._fd ], [], [], timeout)
+        if not ready:
+            return set()
+        changed = self._read_events()
+        # Saving a file usually generates a burst of events, which we want to
+        # handle as a single change.
+        while select.select([ self._fd ], [], [], self.debounce)[0]:
+            changed |= self._read_events()
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+def get_file_watcher(roots: list[Path], interval: float = 0.25, polling: bool = False) -> FileWatcher:
+    if not polling and sys.platform == 'linux':
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(roots, interval)
+
+class WatchBuild:
+
+    def __init__(self, dir: Path, dest_dir: Path, load_ctx: Callable[[], dict[str, Any]], data_files: list[Path] = [], helper_cache: HelperCache | None = None, force: bool = False, **kwargs) -> None:
+        if helper_cache is None:
+            helper_cache = HelperCache()
+        self.dir = dir.absolute()
+        self.dest_dir = dest_dir.absolute()
+        self.load_ctx = load_ctx
+        self.data_files = set(path.absolute() for path in data_files)
+        self.helper_cache = helper_cache
+        self.force = force
+        self.kwargs = kwargs
+        self.ctx = load_ctx()
+        self.loader = HelperLoader(self.ctx, helper_cache)
+        self.jobs = dict[Path, Job]()
+        self.dependents = dict[Path, set[Path]]()
+        self.helper_paths = set[Path]()
+        # Outputs that were written by us, and that we may therefore
+        # overwrite or delete without --force.
+        self.generated = set[Path]()
+        self._templates = dict[Path, tuple[list[int] | None, CompiledTemplate]]()
+
+    def get_roots(self) -> list[Path]:
+        return [ self.dir, *sorted(self.data_files) ]
+
+    def get_template(self, job: RenderJob) -> CompiledTemplate:
+        stamp = get_file_stamp(job.src_path)
+        cached = self._templates.get(job.src_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(job.src_path, 'r') as f:
+            template = CompiledTemplate(f.read(), job.filename)
+        self._templates[job.src_path] = (stamp, template)
+        return template
+
+    def plan(self) -> None:
+        jobs = plan_dir(self.dir, self.dest_dir)
+        self.jobs = dict((job.dest_path, job) for job in jobs)
+        self.dependents = {}
+        self.helper_paths = set()
+        for job in jobs:
+            sources = [ job.src_path ]
+            if isinstance(job, RenderJob):
+                for paths in job.helpers:
+                    sources.extend(paths)
+                    self.helper_paths.update(paths)
+            for path in sources:
+                self.dependents.setdefault(path, set()).add(job.dest_path)
+
+    def run_job(self, job: Job, summary: BuildSummary) -> None:
+        if not self.force and job.dest_path not in self.generated and job.dest_path.exists():
+            warn(f'Skipping {job.dest_path} because it already exists')
+            summary.skipped += 1
+            return
+        try:
+            if isinstance(job, RenderJob):
+                with shared_context.bind(self.ctx):
+                    ctx = self.loader.load(job.helpers)
+                result = render_job(job, ctx, self.ctx, self.kwargs, self.get_template(job))
+                written = write_if_changed(job.dest_path, result)
+            else:
+                written = copy_if_changed(job.src_path, job.dest_path)
+        except Exception as e:
+            warn(f'Failed to generate {job.dest_path}: {e}')
+            summary.failed += 1
+            return
+        self.generated.add(job.dest_path)
+        if written:
+            summary.written += 1
+        else:
+            summary.unchanged += 1
+
+    def build(self) -> BuildSummary:
+        summary = BuildSummary()
+        self.plan()
+        for job in self.jobs.values():
+            self.run_job(job, summary)
+        return summary
+
+    def update(self, changed: set[Path]) -> BuildSummary:
+
+        changed = set(path.absolute() for path in changed)
+
+        if changed & self.data_files:
+            # Every output depends on the data, so there is nothing to gain
+            # from looking any further.
+            self.ctx = self.load_ctx()
+            self.loader = HelperLoader(self.ctx, self.helper_cache)
+            return self.build()
+
+        summary = BuildSummary()
+
+        relevant = set(path for path in changed if path.is_relative_to(self.dir) and not path.is_relative_to(self.dest_dir))
+        if not relevant:
+            return summary
+
+        for path in relevant:
+            self._templates.pop(path, None)
+
+        old_jobs = self.jobs
+        old_helper_paths = self.helper_paths
+        if any(path not in self.dependents or not path.is_file() for path in relevant):
+            # A file was added or removed, so which outputs there are and
+            # which helpers they see might have changed.
+            self.plan()
+            for dest_path in sorted(old_jobs.keys() - self.jobs.keys()):
+                if dest_path in self.generated and dest_path.is_file():
+                    self.generated.discard(dest_path)
+                    dest_path.unlink()
+                    summary.deleted += 1
+
+        if relevant & (old_helper_paths | self.helper_paths) or self.helper_paths != old_helper_paths:
+            # Namespaces of helpers that did not change are still reused
+            # through the helper cache.
+            self.loader = HelperLoader(self.ctx, self.helper_cache)
+
+        affected = self.jobs.keys() - old_jobs.keys()
+        for path in relevant:
+            affected.update(self.dependents.get(path, ()))
+
+        for dest_path in sorted(affected):
+            self.run_job(self.jobs[dest_path], summary)
+
+        return summary
+
+def watch_dir(dir: Path, dest_dir: Path, load_ctx: Callable[[], dict[str, Any]], data_files: list[Path] = [], interval: float = 0.25, polling: bool = False, on_update: Callable[[BuildSummary, float], None] | None = None, **kwargs) -> None:
+    build = WatchBuild(dir, dest_dir, load_ctx, data_files, **kwargs)
+    start = time.perf_counter()
+    summary = build.build()
+    if on_update is not None:
+        on_update(summary, time.perf_counter() - start)
+    watcher = get_file_watcher(build.get_roots(), interval, polling)
+    try:
+        while True:
+            changed = watcher.wait()
+            start = time.perf_counter()
+            summary = build.update(changed)
+            if on_update is not None and (summary.written or summary.deleted or summary.failed):
+                on_update(summary, time.perf_counter() - start)
+    finally:
+        watcher.close()